@@ -0,0 +1,326 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import json
+import shutil
+import hashlib
+import conf
+import ih.database
+
+"""
+Part of every key, increase it when a change to the image processing functions
+changes their results, so that results cached by older versions are not used.
+"""
+version = 1
+
+"""
+The first bytes of every png file.  Results that don't start with it, such as
+the blank files written by --writeblank, are never cached.
+"""
+signature = "\x89PNG\r\n\x1a\n"
+
+def order(jobs):
+    """
+    :param jobs: The validated job list of a single image type.
+    :type jobs: list
+    :return: The jobs, ordered so that every job comes after its dependencies.
+    :rtype: list
+
+    Jobs that don't depend on each other keep their order in the list.  Used both
+    to key the steps of an image, and by :py:class:`~ih.imgproc.Chain` to run them.
+    """
+    ordered = []
+    done = set()
+    remaining = list(jobs)
+    while remaining:
+        ready = [job for job in remaining if all(depend in done for depend in job.get("depends", []))]
+        if not ready:
+            raise Exception("Cannot resolve job dependencies for jobs: '%s'." % ([job["name"] for job in remaining],))
+        for job in ready:
+            ordered.append(job)
+            done.add(job["name"])
+            remaining.remove(job)
+    return ordered
+
+class StepCache(object):
+
+    """
+    A content addressed cache of image processing step results.  The key of a
+    step is a hash of its executable, its normalised arguments, and the keys of
+    its inputs.  The key of the raw input image, or of any other file used as an
+    input, is a hash of the file's content, and the key of an output is the key
+    of the step that writes it.  A step therefore gets the same key for the same
+    image, the same settings, and the same upstream steps, no matter which run
+    or which output names it is part of.  Only steps whose outputs are all images
+    are cached.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The directory to store cached results in.
+        :type path: str
+
+        Results are stored as path/ab/key_index.png.  The index database path/cache.db
+        holds the content hashes of input files, and where each result is stored.
+        """
+        self.path = os.path.abspath(path)
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+        self.conn = ih.database.connect(self.path + "/cache.db", "master")
+        self.conn.execute("create table if not exists hashes (path PRIMARY KEY, size, mtime, hash)")
+        self.conn.execute("create table if not exists results (key PRIMARY KEY, path)")
+        self.conn.commit()
+        return
+
+    def close(self):
+        """
+        Commits and closes the index database.
+        """
+        ih.database.close(self.conn)
+        return
+
+    def hash(self, path):
+        """
+        :param path: The path of the file to hash.
+        :type path: str
+        :return: The sha1 of the file's content.
+        :rtype: str
+
+        Hashes are stored with the file's size and modification time, and only
+        recomputed when either changes.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.conn.execute("select size,mtime,hash from hashes where path=?", (path,)).fetchone()
+        if row and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+            return row["hash"]
+        sha = hashlib.sha1()
+        with open(path, "rb") as rh:
+            for block in iter(lambda: rh.read(1 << 20), ""):
+                sha.update(block)
+        self.conn.execute("insert or replace into hashes (path,size,mtime,hash) values (?,?,?,?)", (path, stat.st_size, stat.st_mtime, sha.hexdigest()))
+        self.conn.commit()
+        return sha.hexdigest()
+
+    def _normalise(self, value):
+        """
+        Normalises an argument value, so that equivalent spellings in the template
+        give the same key.  Surrounding quotes and repeated whitespace are removed,
+        and integers are written in a single form.
+        """
+        if isinstance(value, list):
+            return [self._normalise(x) for x in value]
+        if isinstance(value, dict):
+            return dict((str(key), self._normalise(value[key])) for key in value)
+        value = " ".join(unicode(value).strip().strip('"').split())
+        try:
+            return str(int(value))
+        except ValueError:
+            return value
+
+    def arguments(self, job):
+        """
+        :param job: A validated job definition.
+        :type job: dict
+        :return: The normalised arguments of the job.
+        :rtype: list
+
+        Arguments that only name the job's inputs and outputs are reduced to their
+        presence, since the inputs are part of the key through their own keys.
+        Fixed arguments, such as --outputdir and --writeblank, are left out.
+        """
+        args = []
+        for arg in sorted(job["arguments"]):
+            type = conf.valid[job["executable"]]["arguments"][arg]["type"] if arg in conf.valid[job["executable"]]["arguments"] else None
+            if type == "derived":
+                args.append([arg])
+            elif type != "overwrite":
+                args.append([arg, self._normalise(job["arguments"][arg])])
+        return args
+
+    def cacheable(self, job):
+        """
+        :param job: A validated job definition.
+        :type job: dict
+        :return: Whether the job's results can be cached.
+        :rtype: bool
+        """
+        types = conf.valid[job["executable"]]["outputs"]
+        return len(job["outputs"]) > 0 and all(i < len(types) and types[i] == "image" for i in range(0, len(job["outputs"])))
+
+    def keys(self, jobs, image):
+        """
+        :param jobs: The validated job list of a single image type.
+        :type jobs: list
+        :param image: The path to the raw input image.
+        :type image: str
+        :return: The key of every job, by job name.
+        :rtype: dict
+
+        Inputs written by another job use that job's output key, inputs that are
+        existing files use their content hash, and all other inputs (usually 'base')
+        are the raw input image.
+        """
+        base = self.hash(image)
+        outputs = {}
+        keys = {}
+        for job in order(jobs):
+            inputs = []
+            for input in job["inputs"]:
+                if input in outputs:
+                    inputs.append(outputs[input])
+                elif os.path.isfile(input):
+                    inputs.append(self.hash(input))
+                else:
+                    inputs.append(base)
+            keys[job["name"]] = hashlib.sha1(json.dumps([version, job["executable"], self.arguments(job), inputs], sort_keys = True)).hexdigest()
+            for i,output in enumerate(job["outputs"]):
+                outputs[output] = keys[job["name"]] + "_" + str(i)
+        return keys
+
+    def plan(self, jobs, image, keep = [], save = False):
+        """
+        :param jobs: The validated job list of a single image type.
+        :type jobs: list
+        :param image: The path to the raw input image.
+        :type image: str
+        :param keep: Output names that are needed after the last step, such as the extraction inputs.
+        :type keep: list
+        :param save: If True, every output is needed (the 'save-steps' option).
+        :type save: bool
+        :return: The key of every job, the cached output paths of the jobs whose results are used from the cache, and the names of the jobs that have to run.
+        :rtype: tuple
+
+        Jobs whose results are cached are skipped.  Other cacheable jobs only
+        run if one of their outputs is needed, either directly or by another job
+        that runs.  Jobs that can't be cached always run.  The returned cached
+        dictionary maps job names to the list of cached output paths, and only
+        holds the jobs whose outputs are needed.
+        """
+        keys = self.keys(jobs, image)
+        ordered = order(jobs)
+        found = dict((job["name"], self.fetch(keys[job["name"]], len(job["outputs"]))) for job in ordered if self.cacheable(job))
+        needed = set(keep)
+        run = set()
+        cached = {}
+        for job in reversed(ordered):
+            if job["name"] not in found or save or any(output in needed for output in job["outputs"]):
+                if found.get(job["name"]):
+                    cached[job["name"]] = found[job["name"]]
+                else:
+                    run.add(job["name"])
+                    needed.update(job["inputs"])
+        return (keys, cached, run)
+
+    def file(self, key, index):
+        """
+        :param key: The key of a job.
+        :type key: str
+        :param index: The index of the output.
+        :type index: int
+        :return: The path a cached output is stored at.
+        :rtype: str
+        """
+        return self.path + "/" + key[:2] + "/" + key + "_" + str(index) + ".png"
+
+    def fetch(self, key, count):
+        """
+        :param key: The key of a job.
+        :type key: str
+        :param count: The number of outputs of the job.
+        :type count: int
+        :return: The cached paths of all outputs, or None if any of them isn't cached.
+        :rtype: list
+
+        Outputs that were expected from an earlier run, see :py:meth:`~ih.cache.StepCache.expect`,
+        are copied into the cache if that run has written them.
+        """
+        paths = []
+        for i in range(0, count):
+            path = self.file(key, i)
+            if not os.path.isfile(path):
+                row = self.conn.execute("select path from results where key=?", (key + "_" + str(i),)).fetchone()
+                if not row or not self._isImage(row["path"]):
+                    return None
+                self.store(key, i, row["path"])
+            paths.append(path)
+        return paths
+
+    def store(self, key, index, source, move = False):
+        """
+        :param key: The key of a job.
+        :type key: str
+        :param index: The index of the output.
+        :type index: int
+        :param source: The path of the output image.
+        :type source: str
+        :param move: If True, the source is moved into the cache instead of copied.
+        :type move: bool
+
+        Adds an output to the cache.  The file is copied next to its final path and
+        then renamed, so concurrent readers never see a partial file.
+        """
+        path = self.file(key, index)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(path)):
+                    raise
+        if self._isImage(source):
+            tmp = path + "." + str(os.getpid())
+            if move:
+                shutil.move(source, tmp)
+            else:
+                shutil.copyfile(source, tmp)
+            os.rename(tmp, path)
+            self.conn.execute("insert or replace into results (key,path) values (?,?)", (key + "_" + str(index), path))
+            self.conn.commit()
+        elif move:
+            os.remove(source)
+        return
+
+    def expect(self, key, index, path):
+        """
+        :param key: The key of a job.
+        :type key: str
+        :param index: The index of the output.
+        :type index: int
+        :param path: Where the output will be written.
+        :type path: str
+
+        Records where a job that hasn't run yet, such as a job in a pegasus workflow,
+        will write an output.  The output is added to the cache by :py:meth:`~ih.cache.StepCache.fetch`
+        once it exists.
+        """
+        if not os.path.isfile(self.file(key, index)):
+            self.conn.execute("insert or replace into results (key,path) values (?,?)", (key + "_" + str(index), os.path.abspath(path)))
+            self.conn.commit()
+        return
+
+    def _isImage(self, path):
+        """
+        Whether or not the file exists and is a png image.
+        """
+        if not os.path.isfile(path):
+            return False
+        with open(path, "rb") as rh:
+            return rh.read(len(signature)) == signature
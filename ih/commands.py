@@ -0,0 +1,1556 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import sys
+import time
+import subprocess
+
+"""
+Prefix of the installed scripts.  The subcommand 'convert-color' runs the script 'ih-convert-color'.
+"""
+prefix = "ih-"
+
+"""
+Commands that always run in the calling process.  They aren't run as workflow jobs,
+and ih-worker is the worker itself.  Every other command is forwarded to a worker
+when IH_WORKER is set, see :py:meth:`~ih.worker.forward`.
+"""
+local = set(["ih-crawl", "ih-data", "ih-meanshift-bench", "ih-run", "ih-seed", "ih-setup", "ih-worker", "ih-write-sql"])
+
+def folder():
+    """
+    :return: The directory holding the ih-* scripts.
+    :rtype: str
+
+    Scripts are installed next to the ih dispatcher.
+    """
+    return os.path.dirname(os.path.abspath(sys.argv[0]))
+
+def commands():
+    """
+    :return: The available subcommands.
+    :rtype: list
+    """
+    return sorted([name[len(prefix):] for name in handlers])
+
+def script(name, path = None):
+    """
+    :param name: The subcommand, with or without the ih- prefix.
+    :type name: str
+    :param path: The directory holding the ih-* scripts.
+    :type path: str
+    :return: The path to the script.
+    :rtype: str
+    """
+    path = path if path else folder()
+    name = name if name.startswith(prefix) else prefix + name
+    if name not in handlers:
+        raise Exception("Invalid command '%s'.  Run 'ih --list' for the available commands." % (name[len(prefix):],))
+    return os.path.join(path, name)
+
+def main(name, argv = None):
+    """
+    :param name: The command to run, with or without the ih- prefix.
+    :type name: str
+    :param argv: The arguments to the command, defaults to the arguments of the current process.
+    :type argv: list
+
+    The entry point of every command, each ih-* script only calls this with its
+    own name.  Commands not in :py:data:`~ih.commands.local` are first forwarded
+    to a worker if IH_WORKER is set.  Only the modules the command uses are
+    imported, by the command itself.
+    """
+    exe = script(name)
+    if argv is not None:
+        sys.argv = [exe] + list(argv)
+    if os.path.basename(exe) not in local:
+        import ih.worker
+        ih.worker.forward()
+    handlers[os.path.basename(exe)]()
+    return
+
+def dispatch():
+    """
+    Runs the ih script.  'ih convert-color --input ...' is the same as running
+    'ih-convert-color --input ...'.
+    """
+    import argparse
+
+    usage = "ih [-h] [--list] [--benchmark [COMMAND ...]] COMMAND [ARGS ...]"
+    description = "Runs an Image Harvest command.  'ih convert-color --input ...' is the same as 'ih-convert-color --input ...', and only loads the modules the command uses."
+
+    if len(sys.argv) > 1 and not sys.argv[1].startswith("-"):
+        try:
+            script(sys.argv[1])
+        except Exception as e:
+            print e
+            sys.exit(2)
+        main(sys.argv[1], sys.argv[2:])
+    else:
+        parser = argparse.ArgumentParser(usage = usage, description = description)
+        parser.add_argument("--list", dest="list", default=False, action="store_true", help="List the available commands.")
+        parser.add_argument("--benchmark", dest="benchmark", nargs="*", default=None, help="Time the start-up of the given commands, or of all commands if none are given.")
+        parser.add_argument("--repeat", dest="repeat", type=int, default=5, help="Number of times to start each command when benchmarking.")
+        args = parser.parse_args()
+
+        if args.benchmark is not None:
+            print "%-28s %10s %10s" % ("command", "best (ms)", "mean (ms)")
+            for name, best, mean in benchmark(args.benchmark, args.repeat):
+                print "%-28s %10.1f %10.1f" % (name, best * 1000, mean * 1000)
+        elif args.list:
+            for name in commands():
+                print name
+        else:
+            parser.print_help()
+    return
+
+def benchmark(names = None, repeat = 5, path = None):
+    """
+    :param names: The subcommands to time, defaults to all of them.
+    :type names: list
+    :param repeat: The number of times to start each subcommand.
+    :type repeat: int
+    :param path: The directory holding the ih-* scripts.
+    :type path: str
+    :return: A list of (name, best, mean) start-up times in seconds.
+    :rtype: list
+
+    Times how long each subcommand takes to start, by running it with --help
+    in a new interpreter, which imports everything the subcommand loads
+    and parses its arguments.  The first entry, 'python', is the time to start
+    the bare interpreter.  IH_WORKER is unset, so that the imports are timed
+    instead of a worker.
+    """
+    names = names if names else commands()
+    env = dict((key, value) for key, value in os.environ.items() if key != "IH_WORKER")
+    results = []
+    with open(os.devnull, "w") as null:
+        for name in ["python"] + list(names):
+            cmd = [sys.executable, "-c", "pass"] if name == "python" else [sys.executable, script(name, path), "--help"]
+            times = []
+            for i in range(0, repeat):
+                start = time.time()
+                subprocess.call(cmd, stdout = null, stderr = null, env = env)
+                times.append(time.time() - start)
+            results.append((name, min(times), sum(times) / len(times)))
+    return results
+
+def ihAdaptiveThreshold():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Thresholds an image based on windows.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--value", dest="value", type=int, help="Value to write to pixels.  Usually 255 or 0.", required = True)
+    parser.add_argument("--adaptiveType", dest="adaptiveType", help="Adaptive type to use.  Either 'mean' or 'gaussian'.", required = True)
+    parser.add_argument("--thresholdType", dest="thresholdType", help="Threshold type to use.  Either 'binary' or 'inverse'.", required = True)
+    parser.add_argument("--blockSize", dest="blockSize", type=int, help="Window size to consider.  Should be an odd number.", required = True)
+    parser.add_argument("--C", dest="C", type=int, help="Constant to subtract from window mean.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.adaptiveThreshold(args.value, args.adaptiveType, args.thresholdType, args.blockSize, args.C)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihAddWeighted():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Blends two images based on the provided weights.")
+    parser.add_argument("--input1", dest="input1", help="Path to first input image.", required = True)
+    parser.add_argument("--input2", dest="input2", help="Path to second input image.", required = True)
+    parser.add_argument("--weight1", type=float, help="Weight of the first image.")
+    parser.add_argument("--weight2", type=float, help="Weight of the second image.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input1, args.outputdir, args.output, False)
+        plant.addWeighted(args.input2, args.weight1, args.weight2)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihBitwiseAnd():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input1", dest="input1", help="Path to first input image.", required = True)
+    parser.add_argument("--input2", dest="input2", help="Path to second input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--mask", default=False, dest="mask", action="store_true", help="Convert the first input image to a mask.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input1, args.outputdir, args.output, False)
+        if args.mask:
+            plant.mask()
+        plant.bitwise_and(args.input2)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihBitwiseNot():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input", dest="input", help="Path to first input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.bitwise_not()
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihBitwiseOr():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input1", dest="input1", help="Path to first input image.", required = True)
+    parser.add_argument("--input2", dest="input2", help="Path to second input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input1, args.outputdir, args.output, False)
+        plant.bitwise_or(args.input2)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihBitwiseXor():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input1", dest="input1", help="Path to first input image.", required = True)
+    parser.add_argument("--input2", dest="input2", help="Path to second input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input1, args.outputdir, args.output, False)
+        plant.bitwise_xor(args.input2)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihBlur():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--kwidth", dest="kwidth", type=int, help="Width of the kernel", required = True)
+    parser.add_argument("--kheight", dest="kheight", type=int, help="Height of the kernel", required = True)
+    parser.add_argument("--anchorx", default=-1, dest="anchorx", type=int, help="X position of the anchor")
+    parser.add_argument("--anchory", default=-1, dest="anchory", type=int, help="Y position of the anchor")
+    parser.add_argument("--border", default="default", dest="border", help="Border type for extrapolation.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.blur((args.kwidth, args.kheight), (args.anchorx, args.anchory), args.border)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihColorFilter():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--logic", dest="logic", help="Logic string to compute.", required = True)
+    parser.add_argument("--roi", dest="roi", help="roi file")
+    parser.add_argument("--lutdir", dest="lutdir", default=None, help="If specified, precompile the logic into a lookup table, cached in this directory.")
+    parser.add_argument("--ystart", dest="ystart", default=-1, help="Minimum Y of the roi.")
+    parser.add_argument("--yend", dest="yend", default=-1, help="Maximum Y of the roi.")
+    parser.add_argument("--xstart", dest="xstart", default=-1, help="Minimum X of the roi.")
+    parser.add_argument("--xend", dest="xend", default=-1, help="Maximum X of the roi.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        if args.roi:
+            plant.colorFilter(args.logic, args.roi, args.lutdir)
+        else:
+            plant.colorFilter(args.logic, [args.ystart, args.yend, args.xstart, args.xend], args.lutdir)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihContourChop():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Removes contours from an image based on size.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--binary", dest="binary", help="Binary image to calculate contours from", required = True)
+    parser.add_argument("--basemin", default=100, dest="basemin", type=int, help="Minimum area of contour required to keep in final image.")
+    parser.add_argument("--components", default=False, dest="components", action="store_true", help="Compare basemin with the pixel area of connected components instead of contours.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.contourChop(args.binary, args.basemin, args.components)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihContourCut():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--binary", dest="binary", help="Binary image to calculate contours from", required = True)
+    parser.add_argument("--basemin", default=100, dest="basemin", type=int, help="Minimum area of contour required to keep in final image.")
+    parser.add_argument("--padminx", default=0, dest="padminx", type=int, help="Padding added to left.")
+    parser.add_argument("--padmaxx", default=0, dest="padmaxx", type=int, help="Padding added to right.")
+    parser.add_argument("--padminy", default=0, dest="padminy", type=int, help="Padding added to top.")
+    parser.add_argument("--padmaxy", default=0, dest="padmaxy", type=int, help="Padding added to bottom.")
+    parser.add_argument("--resize", default=False, dest="resize", action="store_true", help="Whether or not to resize the actual image.")
+    parser.add_argument("--returnBound", default=False, dest="returnBound", action="store_true", help="Whether or not to write the bound.")
+    parser.add_argument("--roiwrite", default="roi.json", dest="roiwrite", help="The name of the roi file to write.")
+    parser.add_argument("--components", default=False, dest="components", action="store_true", help="Compare basemin with the pixel area of connected components instead of contours.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.contourCut(args.binary, args.basemin, [args.padminy, args.padmaxy, args.padminx, args.padmaxx], args.resize, args.returnBound, args.roiwrite, args.components)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihConvertColor():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--intype", dest="intype", help="Type of input image, one of [bgr, gray, hsv, lab, ycrcb]", required = True)
+    parser.add_argument("--outtype", dest="outtype", help="Type of output image, one of [bgr, gray, hsv, lab, ycrcb]", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.convertColor(args.intype, args.outtype)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihCrawl():
+    import argparse
+    import traceback
+    import ih.workflow
+
+    parser = argparse.ArgumentParser(description = "Initial setup for job submission")
+    parser.add_argument("--dir", dest="dir", default=".", help="Base directory name.")
+    parser.add_argument("--template", default="input/crawl.json", dest="template", help="Name of template file to use for directory crawling.")
+    parser.add_argument("--validate", dest="validate", action="store_true", help="If specified only validates the workflow.  Does not generate submission.")
+    args = parser.parse_args()
+
+    try:
+        loader = ih.workflow.ImageLoader(args.template, args.dir, args.validate, True)
+        loader.crawl()
+        loader.write()
+        loader._success()
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihCrop():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--roi", dest="roi", help="roi file")
+    parser.add_argument("--ystart", dest="ystart", help="Minimum Y of the roi.")
+    parser.add_argument("--yend", dest="yend", help="Maximum Y of the roi.")
+    parser.add_argument("--xstart", dest="xstart", help="Minimum X of the roi.")
+    parser.add_argument("--xend", dest="xend", help="Maximum X of the roi.")
+    parser.add_argument("--resize", default=False, dest="resize", action="store_true", help="Whether or not to actually resize the image.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        if args.roi:
+            plant.crop(args.roi, args.resize)
+        else:
+            plant.crop([args.ystart, args.yend, args.xstart, args.xend], args.resize)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihData():
+    import argparse
+    import traceback
+    import ih.statistics
+    import os
+    import json
+
+    parser = argparse.ArgumentParser(description = "Change input data format.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--dir", dest="dir", required = True, help="Folder to move files to.")
+    parser.add_argument("--type", dest="type", required = True, help="Type of translation.  Should be one of [pcv, iap]")
+    parser.add_argument("--ids", dest="ids", nargs="+", default=None, help="List of ids to extract from db.")
+    parser.add_argument("--idfile", dest="idfile", default=None, help="Path to file containing list of ids.")
+    parser.add_argument("--imtypes", dest="imtypes", nargs="+", default=None, help="List of imtypes to extract from db.")
+    parser.add_argument("--imtypefile", dest="imtypefile", default=None, help="Path to file containing list of imtypes.")
+    parser.add_argument("--dates", dest="dates", nargs="+", default=None, help="List of dates to extract from db.")
+    parser.add_argument("--datefile", dest="datefile", default=None, help="Path to file containing list of dates.")
+    args = parser.parse_args()
+
+    try:
+        if args.idfile:
+            with open(args.idfile, "r") as rh:
+                ids = []
+                for line in rh.readlines():
+                    ids.append(line.strip())
+        else:
+            ids = args.ids
+
+        if args.imtypefile:
+            with open(args.idfile, "r") as rh:
+                imtypes = []
+                for line in rh.readlines():
+                    imtypes.append(line.strip())
+        else:
+            imtypes = args.imtypes
+
+        if args.datefile:
+            with open(args.datefile, "r") as rh:
+                dates = []
+                for line in rh.readlines():
+                    dates.append(line.strip())
+        else:
+            dates = args.dates
+
+        stats = ih.statistics.Stats(args.db)
+        if args.type == "pcv":
+            stats.dataToPlantcv(args.dir, ids, imtypes, dates)
+        elif args.type == "iap":
+            stats.dataToIAP(args.dir, ids, imtypes, dates)
+        stats._closeConnection()
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihEdges():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--threshold1", dest="threshold1", type=int, help="Minimum threshold value.", required = True)
+    parser.add_argument("--threshold2", dest="threshold2", type=int, help="Maximum threshold value.", required = True)
+    parser.add_argument("--apertureSize", default = 3, dest="apertureSize", type=int, help="Aperture size for Sobel algorithm.")
+    parser.add_argument("--L2gradient", default = False, dest="L2gradient", action="store_true", help="Determines method to calculate gradient magnitutde.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.edges(args.threshold1, args.threshold2, args.apertureSize, args.L2gradient)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihEqualizeHist():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Stretches a grayscale image to the full 0-255 intensity range.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.equalizeHist()
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+            with open(args.outputdir + "/" + args.output, "w") as wh:
+                wh.write("not an image.")
+    return
+
+def ihErrorLog():
+    import argparse
+    import traceback
+    import ih.statistics
+
+    parser = argparse.ArgumentParser(description = "Extracts numerical information from an image.")
+    parser.add_argument("--db", dest="db", help="Path to database to write", required = True)
+    parser.add_argument("--output", dest="output", help="Path to output log file.", required = True)
+    args = parser.parse_args()
+
+    try:
+        stats = ih.statistics.Stats(args.db)
+        stats.logErrors(args.output)
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihExtract():
+    import argparse
+    import traceback
+    import ih.imgproc
+    import os
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description = "Extracts numerical information from an image.")
+    parser.add_argument("--input", dest="input", help="Path to processed image.", required = True)
+    parser.add_argument("--dbid", dest="dbid", help="Image Id, used for database writing", required = True)
+    parser.add_argument("--db", dest="db", help="Path to database to write", required = True)
+    parser.add_argument("--dimensions", dest="dimensions", default=False, action="store_true", help="Extract dimensions.")
+    parser.add_argument("--dimfromroi", dest="dimfromroi", help="Path to roi file for modified dimensions extraction.")
+    parser.add_argument("--pixels", dest="pixels", default=False, action="store_true", help="Extract pixels.")
+    parser.add_argument("--colors", dest="colors", default=False, action="store_true", help="Extract color data.")
+    parser.add_argument("--channels", dest="channels", default=False, action="store_true", help="Extract channel data.")
+    parser.add_argument("--bins", dest="bins", default=None, help="Path to bin file.")
+    parser.add_argument("--moments", dest="moments", default=False, action="store_true", help="Extract moment data.")
+    parser.add_argument("--hull", dest="hull", default=False, action="store_true", help="Extract area of convex hull of entire image.")
+    parser.add_argument("--circle", dest="circle", default=False, action="store_true", help="Extract area of min enclosing circle of entire image.")
+    parser.add_argument("--packed", dest="packed", default=False, action="store_true", help="Store color and channel histograms as packed rows in the histograms table.")
+    parser.add_argument("--colors3d", dest="colors3d", default=False, action="store_true", help="Store a 3-D color histogram in the histograms table, used for histogram binning.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, ".", db = args.db, dbid = args.dbid)
+
+        plant.extractFinalPath()
+
+        features = ih.imgproc.extractFeatures(args)
+        plant.extractAll(features, args.dimfromroi, args.bins, args.packed)
+
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihExtractAll():
+    import argparse
+    import traceback
+    import ih.imgproc
+    import ih.statistics
+    import os
+    import sqlite3
+    import json
+
+    parser = argparse.ArgumentParser(description = "Extracts numerical information from all images in a database.")
+    parser.add_argument("--db", dest="db", help="Database to load processed images from.", required = True)
+    parser.add_argument("--options", dest="options", help="Path to options json file.", required = True)
+    args = parser.parse_args()
+
+    try:
+        with open (args.options, "r") as rh:
+            options = json.load(rh)
+        stats = ih.statistics.Stats(args.db)
+        stats.extractAll(options)
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihExtractMulti():
+    import argparse
+    import traceback
+    import ih.imgproc
+    import ih.database
+    import os
+    import sqlite3
+    import shutil
+
+    parser = argparse.ArgumentParser(description = "Extracts numerical information from multiple images.")
+    parser.add_argument("--inputs", dest="inputs", nargs="+", help="Path to processed image.", required = True)
+    parser.add_argument("--db", dest="db", help="Path to database to write", required = True)
+    parser.add_argument("--copydb", dest="copydb", help = "Copy database file specified by db to new output db specified by argument.")
+    parser.add_argument("--createdb", dest="createdb", default=False, action="store_true", help = "Create database file specified by db")
+    parser.add_argument("--dimensions", dest="dimensions", default=False, action="store_true", help="Extract dimensions.")
+    parser.add_argument("--dimfromroi", dest="dimfromroi", default=[], nargs="+", help="Path to roi files for modified dimensions extraction.")
+    parser.add_argument("--pixels", dest="pixels", default=False, action="store_true", help="Extract pixels.")
+    parser.add_argument("--colors", dest="colors", default=False, action="store_true", help="Extract color data.")
+    parser.add_argument("--channels", dest="channels", default=False, action="store_true", help="Extract channel data.")
+    parser.add_argument("--bins", dest="bins", default=None, help="Path to bin file.")
+    parser.add_argument("--moments", dest="moments", default=False, action="store_true", help="Extract moment data.")
+    parser.add_argument("--hull", dest="hull", default=False, action="store_true", help="Extract convexHull data.")
+    parser.add_argument("--circle", dest="circle", default=False, action="store_true", help="Extract minEnclosingCircle data.")
+    parser.add_argument("--packed", dest="packed", default=False, action="store_true", help="Store color and channel histograms as packed rows in the histograms table.")
+    parser.add_argument("--colors3d", dest="colors3d", default=False, action="store_true", help="Store a 3-D color histogram in the histograms table, used for histogram binning.")
+    parser.add_argument("--batch", dest="batch", type=int, default=50, help="Number of images to buffer before writing to the database.")
+    args = parser.parse_args()
+
+    try:
+        if args.copydb:
+          shutil.copyfile(args.db, args.copydb)
+          args.db = args.copydb
+        elif args.createdb:
+            conn = ih.database.connect(args.db)
+            conn.execute("drop table if exists images")
+            conn.commit()
+            conn.execute("create table images (pegasusid PRIMARY KEY)")
+            conn.commit()
+            conn.executemany("insert into images (pegasusid) values (?)", [(os.path.basename(x).split("_")[0],) for x in args.inputs])
+            ih.database.close(conn)
+        # Only databases created by this job can be written without journal syncs.
+        writer = ih.database.DbWriter(args.db, role = "scratch" if args.copydb or args.createdb else "master")
+        for i,input in enumerate(args.inputs):
+            try:
+                dbid = "_".join(os.path.basename(input).split("_")[:-1])
+                plant = ih.imgproc.Image(input, ".", db = args.db, dbid = dbid, writer = writer)
+
+                plant.extractFinalPath()
+
+                features = ih.imgproc.extractFeatures(args)
+                if i < len(args.dimfromroi):
+                    dimfromroi = args.dimfromroi[i]
+                elif len(args.dimfromroi) > 0:
+                    dimfromroi = args.dimfromroi[0]
+                else:
+                    dimfromroi = None
+
+                plant.extractAll(features, dimfromroi, args.bins, args.packed)
+
+                if (i + 1) % args.batch == 0:
+                    writer.flush()
+
+            except:
+                print traceback.format_exc()
+        writer.close()
+
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihFill():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--roi", dest="roi", help="roi file")
+    parser.add_argument("--ystart", dest="ystart", help="Minimum Y of the roi.")
+    parser.add_argument("--yend", dest="yend", help="Maximum Y of the roi.")
+    parser.add_argument("--xstart", dest="xstart", help="Minimum X of the roi.")
+    parser.add_argument("--xend", dest="xend", help="Maximum X of the roi.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--r", default = 0, type = int, help="Fill color red channel.")
+    parser.add_argument("--g", default = 0, type = int, help="Fill color green channel.")
+    parser.add_argument("--b", default = 0, type = int, help="Fill color blue channel.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        if args.roi:
+            plant.fill(args.roi, [args.b, args.g, args.r])
+        else:
+            plant.fill([args.ystart, args.yend, args.xtart, args.xend], [args.b, args.g, args.r])
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+            with open(args.outputdir + "/" + args.output, "w") as wh:
+                wh.write("not an image.")
+    return
+
+def ihFloodFill():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--mask", dest="mask", help="Path to mask image.", required = True)
+    parser.add_argument("--low", dest="low", nargs="+", type=int, help="Maximal lower brigthness/color difference.", required = True)
+    parser.add_argument("--high", dest="high", nargs="+", type=int, help="Maximal upper brigthness/color difference.", required = True)
+    parser.add_argument("--writeColor", dest="writeColor", nargs="+", type=int, help="Write Color.")
+    parser.add_argument("--connectivity", dest="connectivity", type=int, default=4, help="Number of neighboring pixels to consider.")
+    parser.add_argument("--fixed", dest="fixed", default=False, action="store_true", help="Use difference relative to the seed.")
+    parser.add_argument("--seedx", dest="seedx", type=int, default=0, help="X coordinate of the seed.")
+    parser.add_argument("--seedy", dest="seedy", type=int, default=0, help="Y coordinate of the seed.")
+    parser.add_argument("--findSeed", dest="findSeed", default=False, action="store_true", help="Calculate seed from a given image.")
+    parser.add_argument("--seedMask", dest="seedMask", help="Path to seed mask image.")
+    parser.add_argument("--binary", dest="binary", default=False, action="store_true", help="Specify if flood is performed on a grayscale image.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.floodFill(args.mask,
+                        tuple(args.low),
+                        tuple(args.high),
+                        writeColor = tuple(args.writeColor),
+                        connectivity = args.connectivity,
+                        fixed = args.fixed,
+                        seed = tuple([args.seedx, args.seedy]),
+                        findSeed = args.findSeed,
+                        seedMask = args.seedMask,
+                        binary = args.binary
+                        )
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+            with open(args.outputdir + "/" + args.output, "w") as wh:
+                wh.write("not an image.")
+    return
+
+def ihGaussianBlur():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smooths an image based on a Gaussian kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--kwidth", dest="kwidth", type=int, help="Width of the kernel", required = True)
+    parser.add_argument("--kheight", dest="kheight", type=int, help="Height of the kernel", required = True)
+    parser.add_argument("--sigmax", default=0, dest="sigmax", type=int, help="Standard deviation in the x direction.")
+    parser.add_argument("--sigmay", default=0, dest="sigmay", type=int, help="Standard deviation in the y direction.")
+    parser.add_argument("--border", default="default", dest="border", help="Border type for extrapolation.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.gaussianBlur((args.kwidth, args.kheight), args.sigmax, args.sigmay, args.border)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihMask():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.mask()
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihMeanshift():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Shifts colors in an image based on nearest neighbors.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--spatial_radius", dest="spatial_radius", type=int, help="Spatial Radius.", required = True)
+    parser.add_argument("--range_radius", dest="range_radius", type=int, help="Range Radius.", required = True)
+    parser.add_argument("--min_density", dest="min_density", type=int, help="Minimum Density.", required = True)
+    parser.add_argument("--mode", dest="mode", default="full", help="Segmentation mode, one of [full, tiled, reduced].")
+    parser.add_argument("--processes", dest="processes", type=int, default=None, help="Number of processes for tiled mode.  Defaults to the number of cores.")
+    parser.add_argument("--overlap", dest="overlap", type=int, default=None, help="Number of rows shared by neighboring tiles in tiled mode.  Defaults to 4 * spatial_radius.")
+    parser.add_argument("--scale", dest="scale", type=float, default=0.5, help="Resize factor for reduced mode.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.meanshift(args.spatial_radius, args.range_radius, args.min_density, args.mode, args.processes, args.overlap, args.scale)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihMeanshiftBench():
+    import argparse
+    import traceback
+    import ih.imgproc
+    import numpy as np
+    import time
+
+    parser = argparse.ArgumentParser(description = "Compares the speed and output of the meanshift modes against the full segmentation.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--spatial_radius", dest="spatial_radius", type=int, help="Spatial Radius.", required = True)
+    parser.add_argument("--range_radius", dest="range_radius", type=int, help="Range Radius.", required = True)
+    parser.add_argument("--min_density", dest="min_density", type=int, help="Minimum Density.", required = True)
+    parser.add_argument("--modes", dest="modes", nargs="+", default=["tiled", "reduced"], help="Modes to compare against the full segmentation.")
+    parser.add_argument("--processes", dest="processes", type=int, default=None, help="Number of processes for tiled mode.  Defaults to the number of cores.")
+    parser.add_argument("--overlap", dest="overlap", type=int, default=None, help="Number of rows shared by neighboring tiles in tiled mode.  Defaults to 4 * spatial_radius.")
+    parser.add_argument("--scale", dest="scale", type=float, default=0.5, help="Resize factor for reduced mode.")
+    args = parser.parse_args()
+
+    try:
+        results = {}
+        for mode in ["full"] + args.modes:
+            plant = ih.imgproc.Image(args.input)
+            start = time.time()
+            plant.meanshift(args.spatial_radius, args.range_radius, args.min_density, mode, args.processes, args.overlap, args.scale)
+            results[mode] = (time.time() - start, plant.image.astype(np.int32))
+        full, base = results["full"]
+        print "%-10s %10s %10s %10s %10s" % ("mode", "seconds", "speedup", "exact", "in range")
+        for mode in ["full"] + args.modes:
+            elapsed, image = results[mode]
+            dist = np.sqrt(np.sum((image - base).reshape((-1, base.shape[2] if len(base.shape) == 3 else 1)) ** 2, axis = 1))
+            print "%-10s %10.3f %9.2fx %9.2f%% %9.2f%%" % (mode, elapsed, full / elapsed, 100.0 * np.mean(dist == 0), 100.0 * np.mean(dist <= args.range_radius))
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihMedianBlur():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Thresholds an image based on windows.")
+    parser.add_argument("--input", dest="input", help="Path to input image.")
+    parser.add_argument("--ksize", dest="ksize", type=int, help="Size of the kernel.  Should be odd and positive.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.medianBlur(args.ksize)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihMorphology():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--morphType", dest="morphType", help="Type of morphology to perform.", required = True)
+    parser.add_argument("--ktype", dest="ktype", help="Type of kernel to generate.", required = True)
+    parser.add_argument("--kwidth", dest="kwidth", type=int, help="Width of the kernel.", required = True)
+    parser.add_argument("--kheight", dest="kheight", type=int, help="Height of the kernel.", required = True)
+    parser.add_argument("--anchorx", default=-1, dest="anchorx", type=int, help="X position of the anchor")
+    parser.add_argument("--anchory", default=-1, dest="anchory", type=int, help="Y position of the anchor")
+    parser.add_argument("--iterations", default=1, dest="iterations", type=int, help="Number of times to perform the morphology.")
+    parser.add_argument("--border", default="default", dest="border", help="Border type for extrapolation.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.morphology(args.morphType, args.ktype, (args.kwidth, args.kheight), (args.anchorx, args.anchory), args.iterations, args.border)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihNormalizeIntensity():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Normalizes an image by per-pixel intensity.")
+    parser.add_argument("--input", dest="input", help="Path to first input image.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.normalizeByIntensity()
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihResize():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Smoothes an image based on a evenly distributed kernel.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--scale", dest="scale", default=None, type=float, help="Scaling factor.")
+    parser.add_argument("--width", dest="width", default=None, type=int, help="Target width.")
+    parser.add_argument("--height", dest="height", default=None, type=int, help="Target height.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.resizeSelf(args.scale, args.width, args.height)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihRun():
+    import argparse
+    import traceback
+    import ih.workflow
+    import datetime
+    import sys
+
+    parser = argparse.ArgumentParser(description = "Initial setup for job submission")
+    parser.add_argument("--jobhome", dest="jobhome", default=".", help="Job root.  Should be the output directory from ih-setup. If left blank, will use current directory.")
+    parser.add_argument("--basename", dest="basename", default=None, help="Base submission directory name.  If left blank, this will generate a timestamped directory.")
+    parser.add_argument("--stats", dest="stats", action="store_true", default=False, help="Write the statistics workflow instead of imgproc workflow.  Requires --basename.")
+    parser.add_argument("--local", dest="local", type=int, default=None, help="Run the image processing workflow on this machine with the given number of processes, instead of generating a pegasus submission.")
+    parser.add_argument("--chunk", dest="chunk", type=int, default=None, help="Number of images per chunk when running locally.  By default about four chunks per process, at most 50 images each.")
+    parser.add_argument("--validate", dest="validate", action="store_true", default=False, help="If specified only validates the workflow.  Does not generate submission.")
+    args = parser.parse_args()
+
+    try:
+            basename = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S") if not args.basename else args.basename
+            if args.stats:
+                if args.basename:
+                    stats = ih.workflow.Statistics(args.jobhome, basename, args.validate)
+                    stats.create()
+                else:
+                    print "Stats requires an already processed folder.  Specify --basename."
+            else:
+                workflow = ih.workflow.ImageProcessor(args.jobhome, basename, args.validate)
+                if args.local:
+                    if workflow.runLocal(args.local, args.chunk):
+                        sys.exit(1)
+                else:
+                    workflow.create()
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihSeed():
+    import cv2
+    import ih.imgproc
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description = "Processes & Extracts a seed scan.")
+    parser.add_argument("--input", dest="input", help="Path to input seed scan image.", required = True)
+    parser.add_argument("--output", dest="output", help="Path to output csv file.", required = True)
+    parser.add_argument("--dpi", dest="dpi", help="dpi of the image.", type = float, default = 600)
+    parser.add_argument("--roi", dest="roi", help="roi file")
+    parser.add_argument("--thresh", dest="thresh", type=int, default=230, help="Threshold value.")
+    parser.add_argument("--ystart", dest="ystart", default=-1, help="Minimum Y of the roi.")
+    parser.add_argument("--yend", dest="yend", default=-1, help="Maximum Y of the roi.")
+    parser.add_argument("--xstart", dest="xstart", default=-1, help="Minimum X of the roi.")
+    parser.add_argument("--xend", dest="xend", default=-1, help="Maximum X of the roi.")
+    parser.add_argument("--writesteps", dest="writesteps", default = False, action = "store_true", help="If specified, write processing steps.")
+    args = parser.parse_args()
+
+    prefix = os.path.basename(args.input).split(".")[0]
+    seed = ih.imgproc.Image(args.input)
+
+    if args.roi:
+      seed.crop(args.roi, resize = True)
+    else:
+      seed.crop([args.ystart, args.yend, args.xstart, args.xend], resize = True)
+    if args.writesteps:
+      seed.write(prefix + "_crop.png")
+
+    seed.convertColor("bgr", "gray")
+
+    seed.equalizeHist()
+    seed.threshold(args.thresh)
+    seed.save("thresh")
+    if args.writesteps:
+      seed.write(prefix + "_thresh.png")
+
+    seed.contourChop("thresh", 1000)
+    if args.writesteps:
+      seed.write(prefix + "_final.png")
+
+    contours,hierarchy = cv2.findContours(seed.image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    fh = open(args.output, "w")
+    fh.write("seed,area (cm^2),length (cm),width (cm)\n")
+
+    i2c = 2.54
+
+    for i,cnt in enumerate(contours):
+        rect = cv2.minAreaRect(cnt)
+        area = cv2.contourArea(cnt) * i2c / (args.dpi * args.dpi)
+        length = max(rect[1][1], rect[1][0]) * i2c / args.dpi
+        width = min(rect[1][1], rect[1][0]) * i2c / args.dpi
+        fh.write("%s,%s,%s,%s\n" % (i,area,length,width))
+
+    if args.writesteps:
+      seed.convertColor("gray", "bgr")
+      seed.drawContours()
+      seed.write(prefix + "_contours.png")
+    return
+
+def ihSetup():
+    import argparse
+    import traceback
+    import ih.workflow
+
+    parser = argparse.ArgumentParser(description = "Initial setup for job submission")
+    parser.add_argument("--dir", dest="dir", help="Base directory name.")
+    args = parser.parse_args()
+
+    try:
+        setup = ih.workflow.DirectorySetup(args.dir)
+        setup.setup()
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihSplit():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Splits an image into channels and extracts a single one.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--channel", dest="channel", type=int, help="Channel to extract.", required = True)
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", default=None, dest="output", help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.split(args.channel)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+            with open(args.outputdir + "/" + args.output, "w") as wh:
+                wh.write("not an image.")
+    return
+
+def ihSqlAggregate():
+    import argparse
+    import traceback
+    import ih.statistics
+    import shutil
+
+    parser = argparse.ArgumentParser(description = "Writes data from many small sql files to main db.")
+    parser.add_argument("--db", dest="db", help="Main database to load data into.", required = True)
+    parser.add_argument("--output", dest="output", help="Output file to copy to.")
+    parser.add_argument("--inputs", dest="inputs", nargs="+", help="Small db's to load into main one.", required = True)
+    parser.add_argument("--append", dest="append", default=False, action="store_true", help="Append rows that are not in the main db.  The main db is copied to the output first, and left unchanged.")
+    args = parser.parse_args()
+
+    try:
+        if args.append:
+            shutil.copyfile(args.db, args.output)
+            stats = ih.statistics.Stats(args.output)
+            stats.loadSql(args.inputs, append = True)
+            stats._closeConnection()
+        else:
+            stats = ih.statistics.Stats(args.db)
+            stats.loadSql(args.inputs)
+            # Closing checkpoints the database, so it must happen before copying.
+            stats._closeConnection()
+            if (args.output):
+                shutil.copyfile(args.db, args.output)
+
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihStatsAnova():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--group", dest="group", nargs="+", help="Image types to group by. Should be in json format.", required = True)
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+    args = parser.parse_args()
+
+    stats = ih.statistics.Stats(args.db)
+    stats.anova(args.intable, args.outtable, args.group, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihStatsCorrelate():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--datafile", dest="datafile", help="LemanTec data file to correlate to.", required = True)
+    parser.add_argument("--dataheaders", dest="dataheaders", help="Json header file.", required = True)
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+    args = parser.parse_args()
+
+    with open(args.dataheaders, "r") as rh:
+        dataHeaders = json.load(rh)
+    stats = ih.statistics.Stats(args.db)
+    stats.correlation(args.intable, args.outtable, args.datafile, dataHeaders, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihStatsExport():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Export sqlite tables to csv.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--table", dest="table", help="Input table to write to a file.", required = True)
+    parser.add_argument("--group", dest="group", nargs="+", help="Image types to extract.")
+    parser.add_argument("--fname", dest="fname", help="File to write to, if unspecified, file will be written in the current directory with the specified table name.")
+    parser.add_argument("--histograms", dest="histograms", default=False, action="store_true", help="Expand packed histograms into one column per value.")
+    args = parser.parse_args()
+
+    try:
+        stats = ih.statistics.Stats(args.db)
+        stats.export(args.table, group = args.group, fname = args.fname, histograms = args.histograms)
+        stats._closeConnection()
+    except Exception as e:
+        print traceback.format_exc()
+    return
+
+def ihStatsHistogramBin():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+    import shutil
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--options", dest="options", help="Path to options json file.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--jsonwrite", dest="jsonwrite", default = False, action="store_true", help="If specified, writes json output.")
+    parser.add_argument("--overwrite", dest="overwrite", default = False, action="store_true", help="If specified, will overwrite the output table.")
+    parser.add_argument("--counts", dest="counts", default = False, action="store_true", help="If specified, counts the pixels of each image in each bin from the stored 3-D color histograms.")
+    parser.add_argument("--output", dest="output", help="If specified, the database is copied here first, and results are written to the copy.")
+    args = parser.parse_args()
+
+    with open(args.options, "r") as rh:
+        options = json.load(rh)
+    if "histogram-bin" in options:
+        if args.output:
+            shutil.copyfile(args.db, args.output)
+            args.db = args.output
+        stats = ih.statistics.Stats(args.db)
+        stats.histogramBinning(args.intable, args.outtable, options["histogram-bin"]["--group"], options["histogram-bin"]["--chunks"], options["histogram-bin"]["--channels"], args.jsonwrite, args.overwrite, args.counts)
+        stats._closeConnection()
+    else:
+        print "Key Error: key 'histogram-bin' must be in options file!"
+    return
+
+def ihStatsNormalize():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--column", dest="column", help="Column to normalize numeric values to.", required = True)
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+    args = parser.parse_args()
+
+    stats = ih.statistics.Stats(args.db)
+    stats.normalize(args.intable, args.outtable, args.column, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihStatsShootArea():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--group", dest="group", nargs="+", help="Image types to group by. Should be in json format.", required = True)
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+    args = parser.parse_args()
+
+    stats = ih.statistics.Stats(args.db)
+    stats.shootArea(args.intable, args.outtable, args.group, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihStatsThreshold():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--thresh", dest="thresh", type=float, help="Threhsold value.", required = True)
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+    args = parser.parse_args()
+
+    stats = ih.statistics.Stats(args.db)
+    stats.threshold(args.intable, args.outtable, args.thresh, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihStatsTreatmentComp():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--type", dest="type", default="ratio", help="Whether to perform division or subtraction between treatments.")
+    paresr.add_argument("--direction", dest="direction", default="Control", help="Whether to perform C ~ S, or S ~ C.")
+    parser.add_argument("--comp", dest="comp", default="imtype", help="Whether or not to use imtype or imgname as the primary comparison.")
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+
+    args = parser.parse_args()
+
+    stats = ih.statistics.Stats(args.db)
+    stats.treatmentComp(args.intable, args.outtable, args.type, args.direction, args.comp, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihStatsTtest():
+    import argparse
+    import traceback
+    import ih.statistics
+    import json
+
+    parser = argparse.ArgumentParser(description = "Gathers shoot area information based on specified groupings.")
+    parser.add_argument("--db", dest="db", help="Database to run statistics on.", required = True)
+    parser.add_argument("--intable", dest="intable", help="Input table to gather data from.", required = True)
+    parser.add_argument("--outtable", dest="outtable", help="Output table to write data to.", required = True)
+    parser.add_argument("--comp", dest="comp", default="imtype", help="Whether or not to use imtype or imgname as the primary comparison.")
+    parser.add_argument("--overwrite", dest="overwrite", action="store_true", help="If specified, will overwrite the output table.")
+
+    args = parser.parse_args()
+
+    stats = ih.statistics.Stats(args.db)
+    stats.ttest(args.intable, args.outtable, args.comp)
+    stats.treatmentComp(args.intable, args.outtable, args.type, args.direction, args.comp, args.overwrite)
+    stats._closeConnection()
+    return
+
+def ihThreshold():
+    import argparse
+    import traceback
+    import ih.imgproc
+
+    parser = argparse.ArgumentParser(description = "Converts an image between color spectrums.")
+    parser.add_argument("--input", dest="input", help="Path to input image.", required = True)
+    parser.add_argument("--thresh", dest="thresh", default=127, type=int, help="Threshold cutoff value.")
+    parser.add_argument("--max", dest="max", default=255, type=int, help="Write value for binary threhsold")
+    parser.add_argument("--type", dest="type", default="binary", help="Threshold type, one of: binary, inverse, trunc, tozero, otsu.")
+    parser.add_argument("--outputdir", dest="outputdir", default=".", help="Path to write output files, if not specified use current directory.")
+    parser.add_argument("--output", dest="output", default=None, help="Name of output image to write, if not specified, use input image name.")
+    parser.add_argument("--writeblank", default=False, action="store_true", help="If errors happen, write a blank file.  Used to ensure dependent files exist for pegasus workflows.")
+    args = parser.parse_args()
+
+    try:
+        plant = ih.imgproc.Image(args.input, args.outputdir, args.output, False)
+        plant.threshold(args.thresh, args.max, args.type)
+        plant.write()
+    except Exception as e:
+        print traceback.format_exc()
+        if args.writeblank:
+          with open(args.outputdir + "/" + args.output, "w") as wh:
+            wh.write("not an image.")
+    return
+
+def ihWorker():
+    import argparse
+    import os
+    import sys
+    import ih.worker
+
+    parser = argparse.ArgumentParser(description = "Keeps a python process resident and runs ih-* scripts in it, so that modules are only imported once.  Scripts forward their arguments to the worker when IH_WORKER is set to its socket.")
+    parser.add_argument("--socket", dest="socket", default=None, help="Path of the unix socket to listen on.  Defaults to the value of IH_WORKER.")
+    parser.add_argument("--idle", dest="idle", type=int, default=ih.worker.idle, help="Seconds to wait for a request before exiting.")
+    parser.add_argument("--stdin", dest="stdin", default=False, action="store_true", help="Read one json argument vector per line from stdin instead of listening on a socket, and write one json result per line to stdout.")
+    args = parser.parse_args()
+
+    if args.stdin:
+        ih.worker.serveStream(sys.stdin, sys.stdout)
+    else:
+        path = args.socket if args.socket else os.environ.get(ih.worker.variable)
+        if not path:
+            parser.error("A socket must be given with --socket or IH_WORKER.")
+        ih.worker.serve(path, args.idle)
+    return
+
+def ihWriteSql():
+    """
+    A helper script as a workaround for >1000 column sqlite joins.
+    The script itself walks through the current directory, and
+    creates an sql file that will join all possible databases.
+
+    You may want to optionally filter based on the type of the data if different
+    imtypes have different processing results.
+    After creating the combine.sql file, you can aggregate data the following way:
+    1. Copy a sample database to maintain original structure.
+        > cp fluosv0.db fluosv_all.db
+    2. Load up the final database in sqlite:
+        > sqlite3 fluosv_all.db
+    3. Within sqlite, read in the created sql file:
+        > .read combine.sql
+    """
+    import os
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Creates an sql script to join many databse files.")
+    parser.add_argument("--prefix", dest="prefix", default="", help="Optional prefix to match for db names.")
+    parser.add_argument("--output", dest="output", default="combine.sql", help="Output file name.")
+    args = parser.parse_args()
+
+    # The required lines to write for each database
+    lines = [
+    "begin;",
+    "insert into images select * from to_merge.images;",
+    "commit;",
+    "detach to_merge;"
+    ]
+
+    # Writes the resulting combine.sql
+    with open(args.output, "w") as wh:
+        for root, dirs, files in os.walk("."):
+            for f in files:
+                # Matches all db files
+                if f[-2:] == "db":
+                    if not args.prefix or f[:-len(args.prefix)] == args.prefix:
+                        first_line = ["attach \"%s\" as to_merge;" % (f,)]
+                        write_lines = first_line + lines
+                        for line in write_lines:
+                            wh.write(line + "\n")
+                        wh.write("\n")
+            break
+
+    return
+
+"""
+The function running each command, keyed by command name.
+"""
+handlers = {
+    "ih-adaptive-threshold": ihAdaptiveThreshold,
+    "ih-add-weighted": ihAddWeighted,
+    "ih-bitwise-and": ihBitwiseAnd,
+    "ih-bitwise-not": ihBitwiseNot,
+    "ih-bitwise-or": ihBitwiseOr,
+    "ih-bitwise-xor": ihBitwiseXor,
+    "ih-blur": ihBlur,
+    "ih-color-filter": ihColorFilter,
+    "ih-contour-chop": ihContourChop,
+    "ih-contour-cut": ihContourCut,
+    "ih-convert-color": ihConvertColor,
+    "ih-crawl": ihCrawl,
+    "ih-crop": ihCrop,
+    "ih-data": ihData,
+    "ih-edges": ihEdges,
+    "ih-equalize-hist": ihEqualizeHist,
+    "ih-error-log": ihErrorLog,
+    "ih-extract": ihExtract,
+    "ih-extract-all": ihExtractAll,
+    "ih-extract-multi": ihExtractMulti,
+    "ih-fill": ihFill,
+    "ih-flood-fill": ihFloodFill,
+    "ih-gaussian-blur": ihGaussianBlur,
+    "ih-mask": ihMask,
+    "ih-meanshift": ihMeanshift,
+    "ih-meanshift-bench": ihMeanshiftBench,
+    "ih-median-blur": ihMedianBlur,
+    "ih-morphology": ihMorphology,
+    "ih-normalize-intensity": ihNormalizeIntensity,
+    "ih-resize": ihResize,
+    "ih-run": ihRun,
+    "ih-seed": ihSeed,
+    "ih-setup": ihSetup,
+    "ih-split": ihSplit,
+    "ih-sql-aggregate": ihSqlAggregate,
+    "ih-stats-anova": ihStatsAnova,
+    "ih-stats-correlate": ihStatsCorrelate,
+    "ih-stats-export": ihStatsExport,
+    "ih-stats-histogram-bin": ihStatsHistogramBin,
+    "ih-stats-normalize": ihStatsNormalize,
+    "ih-stats-shoot-area": ihStatsShootArea,
+    "ih-stats-threshold": ihStatsThreshold,
+    "ih-stats-treatment-comp": ihStatsTreatmentComp,
+    "ih-stats-ttest": ihStatsTtest,
+    "ih-threshold": ihThreshold,
+    "ih-worker": ihWorker,
+    "ih-write-sql": ihWriteSql
+}
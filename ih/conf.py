@@ -15,41 +15,40 @@ You should have received a copy of the GNU General Public License
 along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import cv2
-
 """
-A dictionary used to map input-output types to a cv2 color code
+A dictionary used to map input-output types to a cv2 color code.  The cv2 codes
+in this file are written as their values, so that importing conf doesn't load opencv.
 """
 colors = {
     "bgr": {
-        "gray": [cv2.COLOR_BGR2GRAY],
-        "hsv": [cv2.COLOR_BGR2HSV],
-        "lab": [cv2.COLOR_BGR2LAB],
-        "ycrcb": [cv2.COLOR_BGR2YCR_CB]
+        "gray": [6],  # cv2.COLOR_BGR2GRAY
+        "hsv": [40],  # cv2.COLOR_BGR2HSV
+        "lab": [44],  # cv2.COLOR_BGR2LAB
+        "ycrcb": [36]  # cv2.COLOR_BGR2YCR_CB
     },
     "gray": {
-        "bgr": [cv2.COLOR_GRAY2BGR],
-        "hsv": [cv2.COLOR_GRAY2BGR, cv2.COLOR_BGR2HSV],
-        "lab": [cv2.COLOR_GRAY2BGR, cv2.COLOR_BGR2LAB],
-        "ycrcb": [cv2.COLOR_GRAY2BGR, cv2.COLOR_BGR2YCR_CB]
+        "bgr": [8],  # cv2.COLOR_GRAY2BGR
+        "hsv": [8, 40],  # cv2.COLOR_GRAY2BGR, cv2.COLOR_BGR2HSV
+        "lab": [8, 44],  # cv2.COLOR_GRAY2BGR, cv2.COLOR_BGR2LAB
+        "ycrcb": [8, 36]  # cv2.COLOR_GRAY2BGR, cv2.COLOR_BGR2YCR_CB
     },
     "hsv": {
-        "bgr": [cv2.COLOR_HSV2BGR],
-        "gray": [cv2.COLOR_HSV2BGR, cv2.COLOR_BGR2GRAY],
-        "lab": [cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2LAB],
-        "ycrcb": [cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2YCR_CB]
+        "bgr": [54],  # cv2.COLOR_HSV2BGR
+        "gray": [54, 6],  # cv2.COLOR_HSV2BGR, cv2.COLOR_BGR2GRAY
+        "lab": [38, 44],  # cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2LAB
+        "ycrcb": [38, 36]  # cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2YCR_CB
     },
     "lab": {
-        "bgr": [cv2.COLOR_LAB2BGR],
-        "gray": [cv2.COLOR_LAB2BGR, cv2.COLOR_BGR2GRAY],
-        "hsv": [cv2.COLOR_LAB2BGR, cv2.COLOR_BGR2HSV],
-        "ycrcb": [cv2.COLOR_LAB2BGR, cv2.COLOR_BGR2YCR_CB]
+        "bgr": [56],  # cv2.COLOR_LAB2BGR
+        "gray": [56, 6],  # cv2.COLOR_LAB2BGR, cv2.COLOR_BGR2GRAY
+        "hsv": [56, 40],  # cv2.COLOR_LAB2BGR, cv2.COLOR_BGR2HSV
+        "ycrcb": [56, 36]  # cv2.COLOR_LAB2BGR, cv2.COLOR_BGR2YCR_CB
     },
     "ycrcb": {
-        "bgr": [cv2.COLOR_YCR_CB2BGR],
-        "gray": [cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2GRAY],
-        "hsv": [cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2HSV],
-        "lab": [cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2LAB]
+        "bgr": [38],  # cv2.COLOR_YCR_CB2BGR
+        "gray": [38, 6],  # cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2GRAY
+        "hsv": [38, 40],  # cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2HSV
+        "lab": [38, 44]  # cv2.COLOR_YCR_CB2BGR, cv2.COLOR_BGR2LAB
     }
 }
 
@@ -57,20 +56,20 @@ colors = {
 A dicitonary used to map threshold-types to cv2 threshold codes
 """
 thresholds = {
-    "binary": cv2.THRESH_BINARY,
-    "inverse": cv2.THRESH_BINARY_INV,
-    "truncate": cv2.THRESH_TRUNC,
-    "tozero": cv2.THRESH_TOZERO,
-    "otsu": cv2.THRESH_BINARY + cv2.THRESH_OTSU
+    "binary": 0,  # cv2.THRESH_BINARY
+    "inverse": 1,  # cv2.THRESH_BINARY_INV
+    "truncate": 2,  # cv2.THRESH_TRUNC
+    "tozero": 3,  # cv2.THRESH_TOZERO
+    "otsu": 0 + 8  # cv2.THRESH_BINARY + cv2.THRESH_OTSU
 }
 
 """
 A dictionary used to map adaptive-types to cv2 adaptive codes
 """
 adaptives = {
-    "mean": cv2.ADAPTIVE_THRESH_MEAN_C,
-    "gauss": cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-    "gaussian": cv2.ADAPTIVE_THRESH_GAUSSIAN_C
+    "mean": 0,  # cv2.ADAPTIVE_THRESH_MEAN_C
+    "gauss": 1,  # cv2.ADAPTIVE_THRESH_GAUSSIAN_C
+    "gaussian": 1  # cv2.ADAPTIVE_THRESH_GAUSSIAN_C
 }
 
 
@@ -78,51 +77,51 @@ adaptives = {
 A dictionary used to map border-types to cv2 border codes
 """
 borders = {
-    "default": cv2.BORDER_DEFAULT,
-    "constant": cv2.BORDER_CONSTANT,
-    "reflect": cv2.BORDER_REFLECT,
-    "replicate": cv2.BORDER_REPLICATE,
-    "transparent": cv2.BORDER_TRANSPARENT,
-    "wrap": cv2.BORDER_WRAP
+    "default": 4,  # cv2.BORDER_DEFAULT
+    "constant": 0,  # cv2.BORDER_CONSTANT
+    "reflect": 2,  # cv2.BORDER_REFLECT
+    "replicate": 1,  # cv2.BORDER_REPLICATE
+    "transparent": 5,  # cv2.BORDER_TRANSPARENT
+    "wrap": 3  # cv2.BORDER_WRAP
 }
 
 """
 A dictionary used to map morphology types to cv2 morphology codes
 """
 morph = {
-    "dilate": cv2.MORPH_DILATE,
-    "erode": cv2.MORPH_ERODE,
-    "open": cv2.MORPH_OPEN,
-    "close": cv2.MORPH_CLOSE,
-    "gradient": cv2.MORPH_GRADIENT,
-    "tophat": cv2.MORPH_TOPHAT,
-    "blackhat": cv2.MORPH_BLACKHAT
+    "dilate": 1,  # cv2.MORPH_DILATE
+    "erode": 0,  # cv2.MORPH_ERODE
+    "open": 2,  # cv2.MORPH_OPEN
+    "close": 3,  # cv2.MORPH_CLOSE
+    "gradient": 4,  # cv2.MORPH_GRADIENT
+    "tophat": 5,  # cv2.MORPH_TOPHAT
+    "blackhat": 6  # cv2.MORPH_BLACKHAT
 }
 
 """
 A dictionary used to map kernel types to cv2 kernel codes
 """
 kernels = {
-    "rect": cv2.MORPH_RECT,
-    "ellipse": cv2.MORPH_ELLIPSE,
-    "cross": cv2.MORPH_CROSS
+    "rect": 0,  # cv2.MORPH_RECT
+    "ellipse": 2,  # cv2.MORPH_ELLIPSE
+    "cross": 1  # cv2.MORPH_CROSS
 }
 
 """
 A dictionary used to map center types to cv2 center codes
 """
 centers = {
-    "random": cv2.KMEANS_RANDOM_CENTERS,
-    "pp": cv2.KMEANS_PP_CENTERS
+    "random": 0,  # cv2.KMEANS_RANDOM_CENTERS
+    "pp": 2  # cv2.KMEANS_PP_CENTERS
 }
 
 """
 A dictionary used to map termination types to cv2 termination codes
 """
 ktermination = {
-    "accuracy": cv2.TERM_CRITERIA_EPS,
-    "iteration": cv2.TERM_CRITERIA_MAX_ITER,
-    "either": cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER
+    "accuracy": 2,  # cv2.TERM_CRITERIA_EPS
+    "iteration": 1,  # cv2.TERM_CRITERIA_MAX_ITER
+    "either": 2 + 1  # cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER
 }
 
 """
@@ -170,7 +169,7 @@ templateKeys = {
     },
     "config": {
         "required": ["version", "installdir", "profile"],
-        "optional": ["cluster", "notify", "maxwalltime", "osg"],
+        "optional": ["cluster", "aggregate", "notify", "maxwalltime", "osg", "worker"],
         "maxwalltime": {
             "optional": ["images", "stats"]
         },
@@ -190,7 +189,7 @@ templateKeys = {
         },
         "options": {
             "required": [],
-            "optional": ["save-steps"]
+            "optional": ["save-steps", "cache"]
         },
         "extract": {
             "required": ["workflows"],
@@ -244,6 +243,56 @@ dbFile = "images.db"
 statsFile = "stats.json"
 outputdb = "output.db"
 
+"""
+Directory inside the job home that holds the step result cache, used
+when the 'cache' option is specified in the processing template.
+"""
+cacheDir = "cache"
+
+"""
+The largest number of images of a single type the local executor processes
+as one chunk.  Each chunk is written to its own database, and buffers all of
+its results until it finishes.
+"""
+localChunk = 50
+
+"""
+Connection settings for each database role, applied by ih.database.connect.
+'scratch' databases are the small per cluster databases written during extraction,
+which are recreated if a job fails, so they skip journal syncs entirely.
+'master' databases are the images databases that hold the results of an entire workflow.
+"""
+dbRoles = {
+    "scratch": [
+        "PRAGMA journal_mode = MEMORY",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -262144",
+        "PRAGMA temp_store = MEMORY"
+    ],
+    "master": [
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -65536",
+        "PRAGMA foreign_keys = ON"
+    ]
+}
+
+"""
+Indexes maintained on images tables and statistics tables, applied by ih.database.createIndexes.
+Each index is only created if the table has all of its columns.  The first
+serves lookups by id (correlation and the id based write backs), the second serves
+filtering by imtype and grouping by genotype, date, and treatment.
+"""
+dbIndexes = [
+    ["id", "imtype", "date"],
+    ["imtype", "genotype", "date", "treatment"]
+]
+
+"""
+Columns written during extraction that hold text.  All other extracted columns are numeric.
+"""
+textColumns = ["outputPath", "error"]
+
 
 """
 Defines two things for stats functions.
@@ -309,6 +358,12 @@ statsColumns = {
     }
 }
 
+"""
+Features extracted by :py:meth:`~ih.imgproc.Image.extractAll`, in the order they are
+written.  Each one is selected by the extraction argument of the same name, e.g. '--pixels'.
+"""
+features = ["dimensions", "pixels", "moments", "colors", "channels", "hull", "circle", "colors3d"]
+
 """
 Defines allowed image extensions, png is preferred.
 """
@@ -406,6 +461,9 @@ valid = {
                 "type": "string",
                 "required": "true",
                 "complex": "true"
+            },
+            "--lutdir": {
+                "type": "string"
             }
         }
     },
@@ -487,6 +545,9 @@ valid = {
             },
             "--basemin": {
                 "type": "numeric"
+            },
+            "--components": {
+                "type": "exist"
             }
         }
     },
@@ -540,6 +601,9 @@ valid = {
             "--resize": {
                 "type": "exist"
             },
+            "--components": {
+                "type": "exist"
+            },
             "--returnBound": {
                 "type": "derived",
                 "key": "outputs",
@@ -1134,6 +1198,20 @@ valid = {
             "--min_density": {
                 "type": "numeric",
                 "required": "true"
+            },
+            "--mode": {
+                "type": "string",
+                "validation": "list",
+                "value": ["full", "tiled", "reduced"]
+            },
+            "--processes": {
+                "type": "numeric"
+            },
+            "--overlap": {
+                "type": "numeric"
+            },
+            "--scale": {
+                "type": "numeric"
             }
         }
     },
@@ -1429,6 +1507,12 @@ valid = {
             },
             "--circle": {
                 "type": "exist"
+            },
+            "--packed": {
+                "type": "exist"
+            },
+            "--colors3d": {
+                "type": "exist"
             }
         }
     },
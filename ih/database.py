@@ -0,0 +1,301 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import zlib
+import sqlite3
+import conf
+
+"""
+Open connections, keyed by (process id, absolute path).  Each entry is [connection, references].
+"""
+connections = {}
+
+def connect(db, role = "scratch"):
+    """
+    :param db: The database to connect to.
+    :type db: str
+    :param role: The role of the database, a key of conf.dbRoles.
+    :type role: str
+    :return: A connection to the database.
+    :rtype: sqlite3.Connection
+
+    Opens a connection to a database with the settings for its role.  Within
+    a process, connecting to the same database again returns the already open
+    connection, and the role settings of the first connection are kept.  Every
+    call should be paired with a call to :py:meth:`~ih.database.close`, the connection
+    is only closed once it has been released by every caller.  Connections always
+    use sqlite3.Row as the row factory.
+    """
+    if role not in conf.dbRoles:
+        raise Exception("Invalid database role '%s'." % (role,))
+    key = (os.getpid(), os.path.abspath(db))
+    if key in connections:
+        connections[key][1] += 1
+    else:
+        conn = sqlite3.connect(db, check_same_thread = False)
+        conn.row_factory = sqlite3.Row
+        for pragma in conf.dbRoles[role]:
+            conn.execute(pragma)
+        connections[key] = [conn, 1]
+    return connections[key][0]
+
+def close(conn):
+    """
+    :param conn: A connection returned by :py:meth:`~ih.database.connect`.
+    :type conn: sqlite3.Connection
+
+    Commits and releases a connection.  The connection is closed when it
+    is no longer used by any caller, which also checkpoints a master database,
+    so the database file can safely be copied afterwards.
+    """
+    conn.commit()
+    for key in connections.keys():
+        if connections[key][0] is conn:
+            connections[key][1] -= 1
+            if connections[key][1] == 0:
+                del connections[key]
+                conn.close()
+            return
+    conn.close()
+    return
+
+def affinity(column):
+    """
+    :param column: The name of a column written during extraction.
+    :type column: str
+    :return: The type to declare for the column.
+    :rtype: str
+    """
+    return "TEXT" if column in conf.textColumns else "NUMERIC"
+
+def createIndexes(conn, table):
+    """
+    :param conn: The connection to use.
+    :type conn: sqlite3.Connection
+    :param table: The table to index.
+    :type table: str
+
+    Creates every index in conf.dbIndexes that the table has the columns for.
+    Indexes that already exist are left as they are.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info('" + table + "')")]
+    for index in conf.dbIndexes:
+        if set(index) <= set(columns):
+            conn.execute("create index if not exists " + table + "_" + "_".join(index) + " on " + table + " (" + ",".join(index) + ")")
+    conn.commit()
+    return
+
+def isOpen(db):
+    """
+    :param db: The database to check.
+    :type db: str
+    :return: Whether or not this process has an open connection to the database.
+    :rtype: bool
+    """
+    return (os.getpid(), os.path.abspath(db)) in connections
+
+class DbWriter(object):
+
+    """
+    Buffered writer of extracted values to the images table.
+    """
+
+    histtable = "histograms"
+    """Table holding packed per image histograms, keyed by (pegasusid, kind)."""
+
+    histograms = {"colors": ["bhist", "ghist", "rhist"], "channels": ["b", "g", "r"]}
+    """Column prefixes of each histogram kind when expanded to wide columns."""
+
+    cube = "colors3d"
+    """Kind of the sparse 3-D color histograms, which have no wide columns."""
+
+    def __init__(self, db, tablename = "images", role = "master"):
+        """
+        :param db: The database to write to.
+        :type db: str
+        :param tablename: The table to write to.
+        :type tablename: str
+        :param role: The role of the database, see :py:meth:`~ih.database.connect`.
+        :type role: str
+
+        Writers default to the durable 'master' settings.  Only pass 'scratch' for a
+        database the caller created itself and can recreate, such as a per cluster
+        database.  The writer loads the column names of the table once, and keeps them
+        up to date as columns are added.  Values are buffered per image with
+        :py:meth:`~ih.database.DbWriter.add`, and written by :py:meth:`~ih.database.DbWriter.flush`.
+        A single writer can be shared by many :py:class:`~ih.imgproc.Image` instances,
+        so a batch of images is written with one executemany per column set,
+        and one commit.  Histograms can instead be written with :py:meth:`~ih.database.DbWriter.addHistogram`,
+        which stores each one as a single packed row in the histograms table.
+        """
+        if os.path.isfile(db):
+            self.db = db
+            self.tablename = tablename
+            self.conn = connect(db, role)
+            self.columns = set([row["name"] for row in self.conn.execute("PRAGMA table_info(" + tablename + ");")])
+            self.rows = {}
+            self.order = []
+            self.added = []
+            self.hists = []
+        else:
+            raise Exception("Invalid database given!")
+        return
+
+    @staticmethod
+    def pack(hist):
+        """
+        :param hist: A (3, 256) histogram, ordered B, G, R.
+        :type hist: numpy.ndarray or list
+        :return: The histogram as a blob.
+        :rtype: buffer
+        """
+        import numpy as np
+        return sqlite3.Binary(np.asarray(hist, dtype = "<u4").tostring())
+
+    @staticmethod
+    def unpack(data):
+        """
+        :param data: A blob created by :py:meth:`~ih.database.DbWriter.pack`.
+        :type data: buffer
+        :return: The (3, 256) histogram.
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+        return np.frombuffer(data, dtype = "<u4").reshape((3, 256)).astype(np.int64)
+
+    @staticmethod
+    def packCube(cube):
+        """
+        :param cube: The (colors, counts) of an image, see :py:meth:`~ih.imgproc.Image.extractColorCube`.
+        :type cube: tuple
+        :return: The 3-D histogram as a blob.
+        :rtype: buffer
+
+        Only colors present in the image are stored.  The sorted colors are delta encoded,
+        and the blob is compressed.
+        """
+        import numpy as np
+        colors, counts = cube
+        return sqlite3.Binary(zlib.compress(np.concatenate([np.diff(np.concatenate([[0], colors])), counts]).astype("<u4").tostring()))
+
+    @staticmethod
+    def unpackCube(data):
+        """
+        :param data: A blob created by :py:meth:`~ih.database.DbWriter.packCube`.
+        :type data: buffer
+        :return: The (colors, counts) of the image.
+        :rtype: tuple
+        """
+        import numpy as np
+        values = np.frombuffer(zlib.decompress(data), dtype = "<u4").astype(np.int64)
+        return np.cumsum(values[:len(values) / 2]), values[len(values) / 2:]
+
+    def addColumns(self, columns):
+        """
+        :param columns: The columns to add to the table.
+        :type columns: list
+
+        Adds all columns not already in the table within a single transaction.
+        """
+        missing = []
+        for column in columns:
+            if column not in self.columns and column not in missing:
+                missing.append(column)
+        if missing:
+            # The connection may be shared, so reload the columns before altering the table.
+            self.columns = set([row["name"] for row in self.conn.execute("PRAGMA table_info(" + self.tablename + ");")])
+            missing = [column for column in missing if column not in self.columns]
+            for column in missing:
+                self.conn.execute("alter table " + self.tablename + " add column " + column + " " + affinity(column) + ";")
+            self.conn.commit()
+            self.columns.update(missing)
+        return
+
+    def add(self, dbid, values):
+        """
+        :param dbid: The pegasusid of the image.
+        :type dbid: str
+        :param values: The (column, value) pairs to write.
+        :type values: list
+
+        Buffers values for an image.  Later values for the same column overwrite
+        earlier ones.
+        """
+        if dbid not in self.rows:
+            self.rows[dbid] = ([], {})
+            self.order.append(dbid)
+        columns, row = self.rows[dbid]
+        for column, value in values:
+            if column not in row:
+                columns.append(column)
+                if column not in self.columns:
+                    self.added.append(column)
+            row[column] = value
+        return
+
+    def addHistogram(self, dbid, kind, hist):
+        """
+        :param dbid: The pegasusid of the image.
+        :type dbid: str
+        :param kind: The kind of histogram, a key of :py:attr:`~ih.database.DbWriter.histograms` or :py:attr:`~ih.database.DbWriter.cube`.
+        :type kind: str
+        :param hist: A (3, 256) histogram, ordered B, G, R, or the (colors, counts) of a 3-D histogram.
+        :type hist: numpy.ndarray or list or tuple
+
+        Buffers a histogram for an image.
+        """
+        if kind == self.cube:
+            self.hists.append((dbid, kind, self.packCube(hist)))
+        elif kind in self.histograms:
+            self.hists.append((dbid, kind, self.pack(hist)))
+        else:
+            raise Exception("Invalid histogram kind '%s'." % (kind,))
+        return
+
+    def flush(self):
+        """
+        Writes all buffered values.  Images with the same columns are written
+        with a single executemany, and everything is committed once.  New columns
+        are added in the order they were first given.
+        """
+        if self.hists:
+            self.conn.execute("create table if not exists " + self.histtable + " (pegasusid, kind, data BLOB, PRIMARY KEY (pegasusid, kind))")
+            self.conn.executemany("insert or replace into " + self.histtable + " (pegasusid, kind, data) values (?, ?, ?)", self.hists)
+            self.conn.commit()
+            self.hists = []
+        if self.rows:
+            self.addColumns(self.added)
+            groups = {}
+            for dbid in self.order:
+                columns, row = self.rows[dbid]
+                if columns:
+                    groups.setdefault(tuple(columns), []).append(tuple([row[column] for column in columns] + [dbid]))
+            for columns in groups:
+                self.conn.executemany("update " + self.tablename + " set " + ",".join([column + "=?" for column in columns]) + " where pegasusid=?", groups[columns])
+            self.conn.commit()
+            self.rows = {}
+            self.order = []
+            self.added = []
+        return
+
+    def close(self):
+        """
+        Flushes any remaining values and closes the connection.
+        """
+        self.flush()
+        close(self.conn)
+        return
@@ -28,16 +28,48 @@ import numpy as np
 import math
 import conf
 import sqlite3
-import pymeanshift as pms
+import ih.database
+import ih.cache
 import traceback
 import json
 import random
+import hashlib
+import itertools
+import shutil
+import multiprocessing
+
+def extractFeatures(arguments):
+    """
+    :param arguments: Extraction arguments, either parsed script arguments or a workflow's extract arguments.
+    :type arguments: argparse.Namespace or dict
+    :return: The features to pass to :py:meth:`~ih.imgproc.Image.extractAll`.
+    :rtype: list
+
+    Maps the extraction flags, such as --pixels and --moments, to their features.
+    """
+    if isinstance(arguments, dict):
+        return [feature for feature in conf.features if "--" + feature in arguments]
+    return [feature for feature in conf.features if getattr(arguments, feature, False)]
+
+def _meanshiftTile(args):
+    """
+    Segments a single tile for :py:meth:`~ih.imgproc.Image.meanshift`.  Must be
+    top level to be sent to worker processes.
+    """
+    import pymeanshift as pms
+    tile, spatial_radius, range_radius, min_density = args
+    return pms.segment(tile, spatial_radius = spatial_radius, range_radius = range_radius, min_density = min_density)[0]
+
 
 class ColorFilter(object):
 
     """
     Color Filtration logic container.
     """
+
+    # Compiled logic strings, shared by all filters.
+    compiled = {}
+
     def __init__(self, filter):
         self.tokens = {
             "True": True,
@@ -59,8 +91,18 @@ class ColorFilter(object):
             "(": "(",
             ")": ")",
         }
+        self.planes = {
+            "r": (0, 255),
+            "g": (0, 255),
+            "b": (0, 255),
+            "i": (0, 765),
+            "high": (0, 255),
+            "low": (0, 255)
+        }
         self.filterString = filter
-        self.emptyRes = True
+        if filter not in ColorFilter.compiled:
+            ColorFilter.compiled[filter] = self._compile()
+        self.tree, self.used, self.dtype = ColorFilter.compiled[filter]
         return
 
     def _createArgList(self):
@@ -68,58 +110,212 @@ class ColorFilter(object):
         s = s.replace(")", " ) ")
         self.filter = []
         for item in s.split():
-            if item in self.tokens:
-                self.filter.append(self.tokens[item])
+            if item in self.tokens or item in self.planes:
+                self.filter.append(item)
             else:
                 try:
-                    val = int(item)
-                    self.filter.append(val)
+                    self.filter.append(int(item))
                 except:
                     raise Exception("Invalid logic string.")
-        #self.filter = [self.tokens[x] if x in self.tokens else int(x) for x in s.split()]
         return
 
-    def _find(self, what, start = 0):
-        return [i for i,x in enumerate(self.filter) if x == what and i >= start]
+    def _parseOperand(self, pos):
+        if pos >= len(self.filter) or self.filter[pos] == ")":
+            raise Exception("Invalid logic string.")
+        if self.filter[pos] == "(":
+            node, pos = self._parseOperation(pos + 1)
+            if pos >= len(self.filter) or self.filter[pos] != ")":
+                raise Exception("Invalid logic string.")
+            return node, pos + 1
+        return self.filter[pos], pos + 1
+
+    def _parseOperation(self, pos):
+        left, pos = self._parseOperand(pos)
+        if pos < len(self.filter) and self.filter[pos] in self.tokens and callable(self.tokens[self.filter[pos]]):
+            op = self.filter[pos]
+            right, pos = self._parseOperand(pos + 1)
+            return (op, left, right), pos
+        return left, pos
+
+    def _range(self, node):
+        """
+        Calculates the range of values a node can take, used to find the narrowest
+        dtype that can hold every intermediate value.  Returns None if the node
+        requires floating point.
+        """
+        if isinstance(node, tuple):
+            op, left, right = node
+            left, right = self._range(left), self._range(right)
+            if left is None or right is None or op == "/":
+                return None
+            if op in ["+", "-", ".", "max", "min"]:
+                if op == "+":
+                    bounds = [left[0] + right[0], left[1] + right[1]]
+                elif op == "-":
+                    bounds = [left[0] - right[1], left[1] - right[0]]
+                elif op == ".":
+                    bounds = [x * y for x in left for y in right]
+                elif op == "max":
+                    bounds = [max(left[0], right[0]), max(left[1], right[1])]
+                else:
+                    bounds = [min(left[0], right[0]), min(left[1], right[1])]
+                return (min(bounds + [left[0], right[0]]), max(bounds + [left[1], right[1]]))
+            return (min(0, left[0], right[0]), max(1, left[1], right[1]))
+        elif node in self.planes:
+            return self.planes[node]
+        elif node in ["True", "False"]:
+            return (0, 1)
+        return (node, node)
 
-    def _parens(self):
-        left_1st = self._find("(")
-        if not left_1st:
-            return False, -1, -1
-        left = left_1st[-1]
-        right = self._find(")", left + 2)[0]
-        return True, left, right
+    def _compile(self):
+        """
+        Parses the logic string into an expression tree.  Returns the tree,
+        the image planes the logic references, and the dtype to evaluate in.
+        """
+        self._createArgList()
+        tree, pos = self._parseOperation(0)
+        if pos != len(self.filter):
+            raise Exception("Invalid logic string.")
+        used = set([token for token in self.filter if token in self.planes])
+        bounds = self._range(tree)
+        if bounds is None:
+            dtype = np.float64
+        else:
+            dtype = np.int64
+            for t in [np.uint8, np.int16, np.int32]:
+                if np.iinfo(t).min <= bounds[0] and bounds[1] <= np.iinfo(t).max:
+                    dtype = t
+                    break
+        return tree, used, dtype
+
+    def _evaluate(self, node, values):
+        if isinstance(node, tuple):
+            return self.tokens[node[0]](self._evaluate(node[1], values), self._evaluate(node[2], values))
+        elif node in values:
+            return values[node]
+        elif node in ["True", "False"]:
+            return self.tokens[node]
+        return node
+
+    def _mask(self, region):
+        """
+        Evaluates the compiled logic on the given region.  Only the image planes
+        referenced by the logic are created, in the narrowest dtype that can
+        hold every intermediate value.
+        """
+        values = {}
+        for x,c in enumerate(["b", "g", "r"]):
+            if any(plane in self.used for plane in [c, "i", "high", "low"]):
+                values[c] = region[:,:,x] if self.dtype == np.uint8 else region[:,:,x].astype(self.dtype)
+        if "i" in self.used:
+            values["i"] = values["r"] + values["g"] + values["b"]
+        if "high" in self.used:
+            values["high"] = np.maximum(np.maximum(values["r"], values["g"]), values["b"])
+        if "low" in self.used:
+            values["low"] = np.minimum(np.minimum(values["r"], values["g"]), values["b"])
+        return np.broadcast_to(np.asarray(self._evaluate(self.tree, values)).astype(bool), region.shape[:2])
+
+    def table(self):
+        """
+        :return: The result of the logic for every possible color.
+        :rtype: numpy.ndarray
+
+        Builds a boolean lookup table of the logic over all 256^3 colors,
+        see :py:class:`~ih.imgproc.ColorTable`.
+        """
+        table = np.zeros(ColorTable.size, dtype = bool)
+        for start in xrange(0, ColorTable.size, ColorTable.chunk):
+            colors = ColorTable.colors(np.arange(start, start + ColorTable.chunk, dtype = np.int32))
+            table[start:start + ColorTable.chunk] = self._mask(colors.reshape((-1, 1, 3))).ravel()
+        return table
+
+    def apply(self, image, roi):
+        """
+        Evaluates the compiled logic only inside the roi.
+        """
+        region = image[roi[0]:roi[1], roi[2]:roi[3]]
+        region *= self._mask(region)[:,:,None]
+        return image
 
-    def _eval(self, filter):
-        return filter[1](filter[0], filter[2])
 
-    def _formattedEval(self, filter):
-        if not filter:
-            return self.emptyRes
-        if len(filter) == 1:
-            return filter[0]
+class ColorTable(object):
 
-        has_parens, l_paren, r_paren = self._parens()
+    """
+    A precompiled lookup table over every possible (b, g, r) color.
+    """
 
-        if not has_parens:
-            return self._eval(filter)
+    size = 256 ** 3
+    chunk = 256 ** 2 * 16
 
-        filter[l_paren:r_paren + 1] = [self._eval(filter[l_paren+1:r_paren])]
-        self.emptyRes = self._eval
-        return self._formattedEval(filter)
+    # Loaded tables, shared by all images in the process.
+    tables = {}
 
-    def apply(self, image, roi):
-        self.tokens["r"] = image[:,:,2].astype(float)
-        self.tokens["g"] = image[:,:,1].astype(float)
-        self.tokens["b"] = image[:,:,0].astype(float)
-        self.tokens["i"] = np.add(np.add(self.tokens["r"], self.tokens["g"]), self.tokens["b"])
-        self.tokens["high"] = np.maximum(np.maximum(self.tokens["r"], self.tokens["g"]), self.tokens["b"])
-        self.tokens["low"] = np.minimum(np.minimum(self.tokens["r"], self.tokens["g"]), self.tokens["b"])
-        self._createArgList()
-        result = cv2.cvtColor(np.where(self._formattedEval(self.filter), 255, 0).astype(np.uint8), cv2.COLOR_GRAY2BGR)
-        image[roi[0]:roi[1], roi[2]:roi[3]] = cv2.bitwise_and(image[roi[0]:roi[1], roi[2]:roi[3]], result[roi[0]:roi[1], roi[2]:roi[3]])
-        return image
+    def __init__(self, key, build, lutdir = None):
+        """
+        :param key: The unique name of the table, used as the cache file name.
+        :type key: str
+        :param build: A function that returns the table if it is not cached.
+        :type build: function
+        :param lutdir: The directory to cache tables in.
+        :type lutdir: str
+
+        Any per pixel classification that only depends on the color of the pixel
+        can be precomputed for all 256^3 colors, and then applied to an image
+        as a single lookup.  Tables are stored as flat arrays indexed by
+        b * 65536 + g * 256 + r.  Built tables are written to lutdir as
+        key.npy, so every job in a workflow can share them.
+        """
+        self.key = key
+        if key not in ColorTable.tables:
+            path = lutdir + "/" + key + ".npy" if lutdir else None
+            if path and os.path.isfile(path):
+                ColorTable.tables[key] = np.load(path)
+            else:
+                table = build()
+                if path:
+                    if not os.path.isdir(lutdir):
+                        os.makedirs(lutdir)
+                    tmp = path + "." + str(os.getpid())
+                    with open(tmp, "wb") as wh:
+                        np.save(wh, table)
+                    os.rename(tmp, path)
+                ColorTable.tables[key] = table
+        self.table = ColorTable.tables[key]
+        return
 
+    @staticmethod
+    def colors(index):
+        """
+        :param index: Table indices.
+        :type index: numpy.ndarray
+        :return: The colors corresponding to the given table indices.
+        :rtype: numpy.ndarray
+        """
+        return np.column_stack(((index >> 16) & 255, (index >> 8) & 255, index & 255)).astype(np.uint8)
+
+    @staticmethod
+    def index(image):
+        """
+        :param image: A color image.
+        :type image: numpy.ndarray
+        :return: The table index of every pixel in the image.
+        :rtype: numpy.ndarray
+        """
+        index = image[:,:,0].astype(np.int32)
+        index <<= 8
+        index |= image[:,:,1]
+        index <<= 8
+        index |= image[:,:,2]
+        return index
+
+    def lookup(self, image):
+        """
+        :param image: The image to classify.
+        :type image: numpy.ndarray
+        :return: The table value of every pixel in the image.
+        :rtype: numpy.ndarray
+        """
+        return self.table[ColorTable.index(image)]
 
 
 class Image(object):
@@ -127,7 +323,14 @@ class Image(object):
     """
     An individual image.  Each image is loaded in as its own instance of the Image class for processing.
     """
-    def __init__(self, input, outputdir = ".", writename = None, dev = False, db = None, dbid = None):
+
+    # Trained knn models keyed by label file path and modification time, shared by all images in the process.
+    knnModels = {}
+
+    # Kmeans centers of the last image fit under a given name, used to warm start the next image.
+    kmeansCenters = {}
+
+    def __init__(self, input, outputdir = ".", writename = None, dev = False, db = None, dbid = None, writer = None):
         """
         :param input: The input resource, either a path to an image or a raw numpy array.
         :type resource: numpy.ndarray or str
@@ -137,10 +340,13 @@ class Image(object):
         :type writename: str
         :param dev: Dev mode will do something...
         :type dev: bool
+        :param writer: A writer shared between images.  Extracted values are buffered until the writer is flushed.
+        :type writer: :py:class:`~ih.database.DbWriter`
         """
         if os.path.isdir(outputdir):
             self.states = {}
-            self._loadDb(db, dbid)
+            self.rois = {}
+            self._loadDb(db, dbid, writer)
             self.input = input
             self.fname, self.image = self._loadResource(input)
             self.y = self.image.shape[0]
@@ -159,17 +365,18 @@ class Image(object):
         return
 
     def _closeDb(self):
-        if self.conn:
-            self.conn.close()
+        if self.conn and not self.shared:
+            self.writer.close()
         return
 
-    def _loadDb(self, db, dbid):
-        if db:
-            if os.path.isfile(db):
+    def _loadDb(self, db, dbid, writer = None):
+        self.shared = writer is not None
+        if db or writer:
+            if writer or os.path.isfile(db):
                 if dbid:
                     self.dbid = dbid
-                    self.conn = sqlite3.connect(db, check_same_thread = False)
-                    self.conn.row_factory = sqlite3.Row
+                    self.writer = writer if writer else ih.database.DbWriter(db)
+                    self.conn = self.writer.conn
                     result = self.conn.execute("select pegasusid from images where pegasusid=?", (self.dbid,))
                     if not result.fetchone():
                         raise Exception("Invalid pegasusid given!")
@@ -184,9 +391,34 @@ class Image(object):
 
     def _addColumn(self, column, tablename = "images"):
         if self.conn:
-            if column not in [row["name"] for row in self.conn.execute("PRAGMA table_info(" + tablename + ");")]:
-                self.conn.execute("alter table " + tablename + " add column " + column + ";")
-                self.conn.commit()
+            self.writer.addColumns([column])
+        return
+
+    def _writeValues(self, values):
+        """
+        :param values: The (column, value) pairs to write for this image.
+        :type values: list
+
+        Buffers values in the writer.  Unless the writer is shared, the values are
+        written immediately with a single update.
+        """
+        self.writer.add(self.dbid, values)
+        if not self.shared:
+            self.writer.flush()
+        return
+
+    def _writeHistogram(self, kind, hist):
+        """
+        :param kind: The kind of histogram, either 'colors', 'channels', or 'colors3d'.
+        :type kind: str
+        :param hist: A (3, 256) histogram, ordered B, G, R, or the (colors, counts) of a 3-D histogram.
+        :type hist: numpy.ndarray or tuple
+
+        Buffers a packed histogram in the writer, see :py:meth:`~ih.database.DbWriter.addHistogram`.
+        """
+        self.writer.addHistogram(self.dbid, kind, hist)
+        if not self.shared:
+            self.writer.flush()
         return
 
 
@@ -237,12 +469,15 @@ class Image(object):
         :rtype: list
         :raises OSError: if the input path does not exist.
 
-        Loads a region of interest, either a path to an roi or a raw list.
+        Loads a region of interest, either a path to an roi, a raw list, or the
+        name of an roi previously detected by :py:meth:`~ih.imgproc.Image.contourCut`.
         """
         if not roi:
             roi = [-1, -1, -1, -1]
         if isinstance(roi, list):
             return [self._loadROIArg(z, i) for i,z in enumerate(roi)]
+        elif roi in self.rois:
+            return list(self.rois[roi])
         else:
             if os.path.isfile(roi):
                 try:
@@ -321,11 +556,13 @@ class Image(object):
                 raise Exception("Input path to resource does not exist.")
         return
 
-    def _getMergedContour(self):
+    def _getMergedContour(self, binary = None):
         """
         Assumes that image is already binary.
         """
-        if self._isColor():
+        if binary is not None:
+            binary = binary.copy()
+        elif self._isColor():
             binary = cv2.inRange(self.image.copy(), np.array([1, 1, 1], np.uint8), np.array([255, 255, 255], np.uint8))
         else:
             binary = self.image.copy()
@@ -366,10 +603,124 @@ class Image(object):
             returnhist.append(hist)
         return returnhist
 
+    def _colorStats(self, hist, nonzero = True):
+        """
+        :return: Mean & median for each channel of the given histogram.
+        :rtype: list
+        """
+        return [[np.mean(hist[x][np.nonzero(hist[x])] if nonzero else hist[x]), np.median(hist[x][np.nonzero(hist[x])] if nonzero else hist[x])] for x in range(0, 3)]
+
+    def _channelCounts(self):
+        """
+        :return: The number of pixels of each value for each channel, ordered B, G, R.
+        :rtype: numpy.ndarray
+
+        Counts are calculated with a single bincount per channel, and returned
+        as a (3, 256) array.
+        """
+        return np.array([np.bincount(channel.ravel(), minlength = 256) for channel in cv2.split(self.image)])
+
+    def _colorCube(self):
+        """
+        :return: The distinct colors of the image, packed as (B << 16) | (G << 8) | R, and the number of pixels of each.
+        :rtype: tuple
+
+        Black pixels are counted without sorting them, since they are usually
+        most of a processed image.
+        """
+        image = self.image if self._isColor() else cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
+        pixels = image.reshape((-1, 3)).astype(np.uint32)
+        packed = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+        colors, counts = np.unique(packed[packed != 0], return_counts = True)
+        black = len(packed) - np.sum(counts)
+        if black:
+            colors, counts = np.concatenate([[0], colors]), np.concatenate([[black], counts])
+        return colors.astype(np.int64), counts.astype(np.int64)
+
+    def _binCounts(self, binlist):
+        """
+        :return: The loaded bin list, with a 'count' key added to each bin.
+        :rtype: list
+
+        Bins whose bounds only take a few distinct values per channel, such as the grid
+        generated by histogram binning, are all counted in a single pass with
+        :py:meth:`~ih.imgproc.Image._gridBinCounts`.  Other bins are counted one at a time.
+        """
+        binlist = self._loadBins(binlist)
+        counts = self._gridBinCounts(binlist) if self._isColor() and binlist else None
+        for i in range(0, len(binlist)):
+            binlist[i]["count"] = counts[i] if counts is not None else cv2.countNonZero(cv2.inRange(self.image, np.array(binlist[i]["min"], np.uint8), np.array(binlist[i]["max"], np.uint8)))
+        return binlist
+
+    def _gridBinCounts(self, binlist, maxcells = 2 ** 21):
+        """
+        :param binlist: The bins to count.
+        :type binlist: list
+        :param maxcells: The largest number of cells to count at once.
+        :type maxcells: int
+        :return: The number of pixels in each bin, or None if the bins have too many distinct bounds.
+        :rtype: list
+
+        The bounds of all bins split each channel into pieces, so that every bin covers whole pieces.
+        Each pixel value is mapped to its piece through a 256 entry table per channel, the three
+        pieces are combined into a single cell, and all cells are counted with one bincount.  The count
+        of each bin is then the sum of a box of cells, read from the cumulative sums of the counts.
+        Bounds are inclusive, the same as cv2.inRange.
+        """
+        low = np.array([np.array(bin["min"], np.uint8) for bin in binlist], dtype = np.int64)
+        high = np.array([np.array(bin["max"], np.uint8) for bin in binlist], dtype = np.int64) + 1
+        edges = [np.union1d(np.union1d(low[:, c], high[:, c]), [0, 256]) for c in range(0, 3)]
+        shape = [len(edge) - 1 for edge in edges]
+        if np.prod(shape) > maxcells:
+            return None
+        cells = np.zeros(self.image.shape[:2], dtype = np.int32)
+        for c, channel in enumerate(cv2.split(self.image)):
+            # There are at most 256 pieces per channel, so the table fits in uint8.
+            table = (np.searchsorted(edges[c], np.arange(0, 256), side = "right") - 1).astype(np.uint8)
+            cells *= shape[c]
+            cells += cv2.LUT(channel, table)
+        # Padded with a leading zero on every axis, so total[i, j, k] is the number of pixels in cells before (i, j, k).
+        total = np.zeros([x + 1 for x in shape], dtype = np.int64)
+        total[1:, 1:, 1:] = np.bincount(cells.ravel(), minlength = np.prod(shape)).reshape(shape).cumsum(0).cumsum(1).cumsum(2)
+        start = np.array([np.searchsorted(edges[c], low[:, c]) for c in range(0, 3)])
+        stop = np.array([np.searchsorted(edges[c], high[:, c]) for c in range(0, 3)])
+        counts = np.zeros(len(binlist), dtype = np.int64)
+        for corner in itertools.product([0, 1], repeat = 3):
+            index = [stop[c] if corner[c] else start[c] for c in range(0, 3)]
+            counts += (-1) ** (3 - sum(corner)) * total[index[0], index[1], index[2]]
+        # Bins with a minimum above their maximum are empty.
+        counts[np.any(low >= high, axis = 1)] = 0
+        return [int(x) for x in counts]
+
     def _isColor(self, image = None):
         image = self.image if image is None else image
         return len(image.shape) == 3
 
+    def _components(self, binary):
+        """
+        :param binary: The binary image to label.
+        :type binary: np.ndarray
+        :return: The label of every pixel, and the pixel area of every label.
+        :rtype: tuple
+
+        Labels the 8-connected components of the non-zero pixels of the binary image
+        in a single pass.  Label 0 is the background.
+        """
+        from scipy import ndimage
+        labels, count = ndimage.label(binary, structure = np.ones((3, 3)))
+        return labels, np.bincount(labels.ravel(), minlength = count + 1)
+
+    def _maskBounds(self, binary):
+        """
+        :return: The bounding box of the non-zero pixels of the binary image, [miny, maxy, minx, maxx].
+        :rtype: list
+        """
+        rows = np.flatnonzero(np.any(binary, axis = 1))
+        cols = np.flatnonzero(np.any(binary, axis = 0))
+        if rows.size == 0:
+            return [binary.shape[0], 0, binary.shape[1], 0]
+        return [int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1]
+
     def save(self, name):
         """
         :param name: The name to save the image under.
@@ -614,7 +965,47 @@ class Image(object):
         self.image = cv2.merge([b, g, r]).astype(np.uint8)
         return
 
-    def knn(self, k, labels, remove = []):
+    def _knnTrain(self, labels):
+        """
+        Loads the KNearest model trained from a label file, returns the model and the label names.
+        Models are only trained once per label file and modification time.
+        """
+        path = os.path.abspath(labels)
+        key = (path, os.path.getmtime(path))
+        if key not in Image.knnModels:
+            with open(labels, "r") as rh:
+                data = json.load(rh)
+            labelMap = []
+            trainData = []
+            response = []
+            for index,label in enumerate(data.keys()):
+                 labelMap.append(label)
+                 for color in data[label]:
+                     trainData.append(color)
+                     response.append(index)
+            trainData = np.array(trainData, dtype = np.float32)
+            response = np.array(response)
+            knn = cv2.KNearest()
+            knn.train(trainData, response)
+            for old in [x for x in Image.knnModels if x[0] == path]:
+                del Image.knnModels[old]
+            Image.knnModels[key] = (knn, labelMap)
+        return Image.knnModels[key]
+
+    def _knnTable(self, labels, k):
+        """
+        Classifies every possible color, for use as a :py:class:`~ih.imgproc.ColorTable`.
+        """
+        knn, labelMap = self._knnTrain(labels)
+        if len(labelMap) > 256:
+            raise Exception("Label tables support at most 256 labels.")
+        table = np.zeros(ColorTable.size, dtype = np.uint8)
+        for start in xrange(0, ColorTable.size, ColorTable.chunk):
+            ret, results, neighbors, dist = knn.find_nearest(ColorTable.colors(np.arange(start, start + ColorTable.chunk, dtype = np.int32)).astype(np.float32), k)
+            table[start:start + ColorTable.chunk] = results.ravel()
+        return table
+
+    def knn(self, k, labels, remove = [], lutdir = None, unique = False):
         """
         :param k: Number of nearest neighbors to use
         :type k: int
@@ -622,6 +1013,10 @@ class Image(object):
         :type labels: file
         :param remove: Labels to remove from final image.
         :type remove: list
+        :param lutdir: If specified, the classification is precompiled into a lookup table cached in this directory.
+        :type lutdir: str
+        :param unique: If True, only classify each unique color in the image once.
+        :type unique: bool
 
         This function is a wrapper to the OpenCV function `KNearest <http://docs.opencv.org/modules/ml/doc/k_nearest_neighbors.html>`_.
         The label file should contain training data in json format, using the label name of keys, and all
@@ -643,34 +1038,48 @@ class Image(object):
         provides no meaningful information.  The remove list is the list of matched labels to remove from the final image.
         The names to remove should match the names in your label file exactly. For example, let's say you have the labels
         "plant", "pot", "track", and "background" defined, and you only want to keep pixels that match the "plant" label.
-        Your remove list should be specified as ["pot", "track", "background"].
+        Your remove list should be specified as ["pot", "track", "background"].  If lutdir is specified, every possible
+        color is classified once and stored as a :py:class:`~ih.imgproc.ColorTable` keyed by the hash of the label file,
+        so later images only need a single lookup.  Building the table is slow, but only happens once per label file.
+        The trained model is kept for the life of the process, and is only retrained if the label file changes.
+        If unique is set, each distinct color in the image is classified once, and the results are
+        scattered back to the pixels.  Plant images usually have far fewer distinct colors than pixels.
         """
         if (os.path.isfile(labels)):
-            with open(labels, "r") as rh:
-                data = json.load(rh)
-                labelMap = []
-                trainData = []
-                response = []
-                for index,key in enumerate(data.keys()):
-                     labelMap.append(key)
-                     for color in data[key]:
-                         trainData.append(color)
-                         response.append(index)
-                trainData = np.array(trainData, dtype = np.float32)
-                response = np.array(response)
-                knn = cv2.KNearest()
-                knn.train(trainData, response)
+            knn, labelMap = self._knnTrain(labels)
+            if lutdir:
+                with open(labels, "r") as rh:
+                    key = "knn_" + hashlib.sha1(rh.read()).hexdigest() + "_" + str(k)
+                results = ColorTable(key, lambda: self._knnTable(labels, k), lutdir).lookup(self.image)
+            elif unique:
+                colors, inverse = np.unique(ColorTable.index(self.image), return_inverse = True)
+                ret, results, neighbors, dist = knn.find_nearest(ColorTable.colors(colors).astype(np.float32), k)
+                results = results.ravel()[inverse]
+            else:
                 fim = self.image.copy().reshape((-1, 3)).astype(np.float32)
                 ret, results, neighbors, dist = knn.find_nearest(fim, k)
-                ires = np.in1d(results.ravel(), [i for i,x in enumerate(labelMap) if x not in remove])
-                final = cv2.cvtColor(np.where(ires, 255, 0).astype(np.uint8).reshape((self.y, self.x)).astype(np.uint8), cv2.COLOR_GRAY2BGR)
-                self.bitwise_and(final)
+            ires = np.in1d(results.ravel(), [i for i,x in enumerate(labelMap) if x not in remove])
+            final = cv2.cvtColor(np.where(ires, 255, 0).astype(np.uint8).reshape((self.y, self.x)).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+            self.bitwise_and(final)
         else:
             print "Cannot find label file."
         return
 
 
-    def kmeans(self, k, criteria, maxiter = 10, accuracy = 1.0, attempts = 10, flags = "random", labels = None):
+    def _nearestCenter(self, data, center):
+        """
+        Assigns each row of data to the index of its nearest center.
+        """
+        label = np.zeros(data.shape[0], dtype = np.int32)
+        best = np.sum((data - center[0]) ** 2, axis = 1)
+        for i in range(1, center.shape[0]):
+            dist = np.sum((data - center[i]) ** 2, axis = 1)
+            closer = dist < best
+            label[closer] = i
+            best[closer] = dist[closer]
+        return label
+
+    def kmeans(self, k, criteria, maxiter = 10, accuracy = 1.0, attempts = 10, flags = "random", labels = None, sample = None, sampling = "random", warm = None):
         """
         :param k: Number of colors in final image.
         :type k: int
@@ -684,6 +1093,12 @@ class Image(object):
         :type attempts: int
         :param flags: How to determine initial centers should be either 'random' or 'pp'.
         :type flags: str
+        :param sample: If specified, the number of pixels to fit the centers on.
+        :type sample: int
+        :param sampling: How to choose the sampled pixels, either 'random' or 'stratified'.
+        :type sampling: str
+        :param warm: If specified, the name to warm start from and store the fitted centers under, i.e. the imtype.
+        :type warm: str
 
         This function is a wrapper to the OpenCV function `kmeans <http://docs.opencv.org/modules/core/doc/clustering.html>`_
         Adjusts the colors in the image to find the most compact 'central' colors.  The amount of colors
@@ -693,12 +1108,37 @@ class Image(object):
         is specified, the algorithm runs the specified number of iterations.  If 'either' is specified, the algorithm
         runs until one of the conditions is satisfied.  The flags parameter determines the initial central colors,
         and should be either 'random' -- to generate a random initial guess -- or 'pp' to use center initialization by Arthur and Vassilvitskii.
+
+        For large images, the centers can be fit on a subsample of the pixels by specifying sample.  The
+        sampling parameter should be either 'random' -- pixels chosen uniformly at random -- or 'stratified' --
+        one random pixel from each of 'sample' equal sized runs of the image.  All pixels are then assigned
+        to their nearest center.  If warm is specified, the centers fit for the previous image with the same
+        warm name are used as the starting point, and a single attempt is run.
         """
         if flags in conf.centers:
             if criteria in conf.ktermination:
+                if sampling not in ["random", "stratified"]:
+                    raise KeyError(sampling + " is not a valid sampling type.  Should be either 'random' or 'stratified'.")
                 reshaped = self.image.reshape((-1,3))
                 reshaped = np.float32(reshaped)
-                ret, label, center = cv2.kmeans(reshaped, k, (conf.ktermination[criteria], maxiter, accuracy), attempts, conf.centers[flags], bestLabels = labels)
+                if not sample and warm is None:
+                    ret, label, center = cv2.kmeans(reshaped, k, (conf.ktermination[criteria], maxiter, accuracy), attempts, conf.centers[flags], bestLabels = labels)
+                else:
+                    data = reshaped
+                    if sample and sample < reshaped.shape[0]:
+                        if sampling == "random":
+                            data = reshaped[np.random.choice(reshaped.shape[0], sample, replace = False)]
+                        else:
+                            bounds = np.arange(sample + 1) * reshaped.shape[0] // sample
+                            data = reshaped[bounds[:-1] + (np.random.random(sample) * (bounds[1:] - bounds[:-1])).astype(int)]
+                    if warm in Image.kmeansCenters and Image.kmeansCenters[warm].shape[0] == k:
+                        initial = self._nearestCenter(data, Image.kmeansCenters[warm]).reshape((-1, 1))
+                        ret, label, center = cv2.kmeans(data, k, (conf.ktermination[criteria], maxiter, accuracy), 1, cv2.KMEANS_USE_INITIAL_LABELS, bestLabels = initial)
+                    else:
+                        ret, label, center = cv2.kmeans(data, k, (conf.ktermination[criteria], maxiter, accuracy), attempts, conf.centers[flags], bestLabels = None)
+                    if warm is not None:
+                        Image.kmeansCenters[warm] = center.copy()
+                    label = self._nearestCenter(reshaped, center)
                 center = np.uint8(center)
                 res = center[label.flatten()]
                 self.image = res.reshape((self.image.shape))
@@ -709,7 +1149,7 @@ class Image(object):
         return
 
 
-    def meanshift(self, spatial_radius, range_radius, min_density):
+    def meanshift(self, spatial_radius, range_radius, min_density, mode = "full", processes = None, overlap = None, scale = 0.5):
         """
         :param spatial_radius: Spatial Radius
         :type spatial_radius: int
@@ -717,14 +1157,58 @@ class Image(object):
         :type range_radius: int
         :param min_density: Minimum Density.
         :type min_density: int
+        :param mode: How to segment the image, one of 'full', 'tiled', or 'reduced'.
+        :type mode: str
+        :param processes: Number of processes for tiled mode, defaults to the number of cores.
+        :type processes: int
+        :param overlap: Number of rows shared by neighboring tiles, defaults to 4 * spatial_radius.
+        :type overlap: int
+        :param scale: Resize factor for reduced mode.
+        :type scale: float
         :return: The mean-shifted image.
         :rtype: numpy.ndarray
 
         Segments the image into clusters based on nearest neighbors.  This function
         is a wrapper to the `pymeanshift <https://code.google.com/p/pymeanshift/>`_
         module.  For details on the algorithm itself: `Mean shift: A robust approach toward feature space analysis <http://dx.doi.org/10.1109/34.1000236>`_.
-        """
-        (self.image, labels_image, number_regions) = pms.segment(self.image, spatial_radius = spatial_radius, range_radius = range_radius, min_density = min_density)
+        The 'full' mode segments the entire image at once.  The 'tiled' mode splits the image into
+        horizontal strips, one per process, padded by overlap rows on each side, and segments the strips in
+        parallel.  Only the unpadded part of each strip is kept.  The 'reduced' mode segments a copy of
+        the image resized by scale, with the spatial radius scaled to match.  The region labels are then
+        resized back to the full image, and each region is colored with its mean color in the full image.
+        Both modes are approximations of the full segmentation, use the ih-meanshift-bench script to
+        check the speedup and agreement on your own images.
+        """
+        import pymeanshift as pms
+        if mode == "full":
+            (self.image, labels_image, number_regions) = pms.segment(self.image, spatial_radius = spatial_radius, range_radius = range_radius, min_density = min_density)
+        elif mode == "tiled":
+            processes = processes if processes else multiprocessing.cpu_count()
+            overlap = overlap if overlap is not None else 4 * spatial_radius
+            bounds = [self.y * i // processes for i in range(0, processes + 1)]
+            tiles = [(self.image[max(0, bounds[i] - overlap):min(self.y, bounds[i + 1] + overlap)], spatial_radius, range_radius, min_density) for i in range(0, processes)]
+            if processes > 1 and not multiprocessing.current_process().daemon:
+                pool = multiprocessing.Pool(processes)
+                results = pool.map(_meanshiftTile, tiles)
+                pool.close()
+                pool.join()
+            else:
+                results = map(_meanshiftTile, tiles)
+            image = np.zeros(self.image.shape, dtype = self.image.dtype)
+            for i,result in enumerate(results):
+                start = bounds[i] - max(0, bounds[i] - overlap)
+                image[bounds[i]:bounds[i + 1]] = result[start:start + bounds[i + 1] - bounds[i]]
+            self.image = image
+        elif mode == "reduced":
+            small = cv2.resize(self.image, (max(1, int(self.x * scale)), max(1, int(self.y * scale))), interpolation = cv2.INTER_AREA)
+            (segmented, labels_image, number_regions) = pms.segment(small, spatial_radius = max(1, int(round(spatial_radius * scale))), range_radius = range_radius, min_density = max(1, int(round(min_density * scale * scale))))
+            labels = cv2.resize(labels_image.astype(np.float32), (self.x, self.y), interpolation = cv2.INTER_NEAREST).astype(np.int32).ravel()
+            counts = np.maximum(np.bincount(labels, minlength = number_regions), 1)
+            pixels = self.image.reshape((-1, self.image.shape[2])) if self._isColor() else self.image.reshape((-1, 1))
+            means = np.column_stack([np.bincount(labels, weights = pixels[:,ch], minlength = number_regions) / counts for ch in range(0, pixels.shape[1])])
+            self.image = np.uint8(np.around(means))[labels].reshape(self.image.shape)
+        else:
+            raise KeyError(mode + " is not a valid meanshift mode.  Should be one of 'full', 'tiled', or 'reduced'.")
         return
 
     def adaptiveThreshold(self, value, adaptiveType, thresholdType, blockSize, C):
@@ -871,13 +1355,11 @@ class Image(object):
         if self._isColor(binary):
             binary = cv2.cvtColor(binary, cv2.COLOR_BGR2GRAY)
         contours, hierarchy = cv2.findContours(binary, cv2.RETR_EXTERNAL, 2)
-        size = 0
-        select = 0
-        for cnt in contours:
-            if cv2.contourArea(cnt) > size:
-                select = cnt
-                size = cv2.contourArea(cnt)
-        return tuple(select[0][0])
+        if len(contours) == 0:
+            raise Exception("Seed mask '%s' has no foreground pixels, cannot find a seed." % (bname,))
+        # argmax picks the first of the largest contours, the first contour if all are empty.
+        areas = np.array([cv2.contourArea(cnt) for cnt in contours])
+        return tuple(contours[int(areas.argmax())][0][0])
 
     def floodFill(self, mask, low, high, writeColor = (255, 255, 255), connectivity = 4, fixed = False, seed = (0,0), findSeed = False, seedMask = None, binary = False):
         """
@@ -992,25 +1474,43 @@ class Image(object):
         self.convertColor("gray", "bgr")
         return
 
-    def contourChop(self, binary, basemin = 100):
+    def contourChop(self, binary, basemin = 100, components = False):
         """
         :param binary: The binary image to find contours of.
         :type binary: str of np.ndarray
         :param basemin: The minimum area a contour must have to be considered part of the foreground.
         :type basemin: int
+        :param components: If set, compare basemin with the pixel area of connected components instead of the area of contours.
+        :type components: bool
 
         This function works very similiarly to the :py:meth:`~ih.imgproc.Image.contourCut`
         function, except that this function does not crop the image, but removes
-        all contours that fall below the threshold.
+        all contours that fall below the threshold.  Only outer contours are
+        considered, a removed contour is removed along with everything inside it.
+
+        If components is set, the 8-connected components of the binary image are
+        labelled in a single pass instead, and every component whose pixel count falls
+        below the threshold is removed, including small components inside the holes
+        of larger ones.  This is faster on images with many contours, but gives
+        different results, as the pixel count of a component is not the area
+        enclosed by its contour.
         """
 
         bname, binary = self._loadResource(binary)
         if self._isColor(binary):
             binary = cv2.cvtColor(binary, cv2.COLOR_BGR2GRAY)
-        contours = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
-        for cnt in contours:
-            if (cv2.contourArea(cnt) < basemin):
-                cv2.drawContours(self.image, [cnt], -1, (0, 0, 0), -1)
+        if components:
+            labels, areas = self._components(binary)
+            small = areas < basemin
+            small[0] = False
+            self.image[small[labels]] = 0
+        else:
+            contours = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+            areas = np.array([cv2.contourArea(cnt) for cnt in contours])
+            small = [contours[i] for i in np.flatnonzero(areas < basemin)]
+            if small:
+                # Outer contours don't overlap, so they can all be filled in a single call.
+                cv2.drawContours(self.image, small, -1, (0, 0, 0), -1)
         return
 
     def getBounds(self):
@@ -1018,30 +1518,15 @@ class Image(object):
         :return: The bounding box of the image.
         :rtype: list
 
-        This function finds the bounding box of all contours in the image, and
+        This function finds the bounding box of all non-black pixels in the image, and
         returns a list of the form [miny, maxy, minx, maxx]
         """
-        binary = self.image.copy()
+        binary = self.image
         if self._isColor(binary):
             binary = cv2.cvtColor(binary, cv2.COLOR_BGR2GRAY)
-        contours = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
-        minx = binary.shape[1]
-        miny = binary.shape[0]
-        maxx = 0
-        maxy = 0
-        for cnt in contours:
-            x,y,w,h = cv2.boundingRect(cnt)
-            if (x < minx):
-                minx = x
-            if (y < miny):
-                miny = y
-            if (x + w > maxx):
-                maxx = x + w
-            if (y + h > maxy):
-                maxy = y + h
-        return [miny, maxy, minx, maxx]
-
-    def contourCut(self, binary, basemin = 100, padding = [0, 0, 0, 0], resize = False, returnBound = False, roiwrite = "roi.json"):
+        return self._maskBounds(binary)
+
+    def contourCut(self, binary, basemin = 100, padding = [0, 0, 0, 0], resize = False, returnBound = False, roiwrite = "roi.json", components = False):
         """
         :param binary: The binary image to find contours of.
         :type binary: str or np.ndarray
@@ -1053,38 +1538,39 @@ class Image(object):
         :type returnBound: bool
         :param resize: Whether or not to resize the image.
         :type resize: bool
+        :param components: If set, compare basemin with the pixel area of connected components instead of the area of contours.
+        :type components: bool
 
         This function crops an image based on the size of detected contours in the image --
         clusters of pixels in the image.  The image is cropped such that all contours
         that are greater than the specified area are included in the final output image.
-        image is cropped such that all contours that are greater than the specified area are
-        included in the final output image.  If returnBound is set, instead of actually
+        If components is set, connected components whose pixel count is greater than
+        the specified area are used instead, see :py:meth:`~ih.imgproc.Image.contourChop`.  If returnBound is set, instead of actually
         cropping the image, the detected roi is written to a file instead.  Otherwise,
         the detected roi is passed into the :py:meth:`~ih.imgproc.Image.crop` function,
         with the given resize value.  This function is useful for getting accurate
         height and width of a specific plant, as well as removing outlying clusters
-        of non-important pixels.
+        of non-important pixels.  The detected roi is also kept under the roiwrite
+        name, so it can be used as the roi of later steps on the same image.
         """
         bname, binary = self._loadResource(binary)
         if self._isColor(binary):
             binary = cv2.cvtColor(binary, cv2.COLOR_BGR2GRAY)
-        contours = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
-        minx = binary.shape[1]
-        miny = binary.shape[0]
-        maxx = 0
-        maxy = 0
-        for cnt in contours:
-            x,y,w,h = cv2.boundingRect(cnt)
-            if (basemin < cv2.contourArea(cnt)):
-                if (x < minx):
-                    minx = x
-                if (y < miny):
-                    miny = y
-                if (x + w > maxx):
-                    maxx = x + w
-                if (y + h > maxy):
-                    maxy = y + h
+        if components:
+            labels, areas = self._components(binary)
+            keep = areas > basemin
+            keep[0] = False
+            miny, maxy, minx, maxx = self._maskBounds(keep[labels])
+        else:
+            contours = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+            areas = np.array([cv2.contourArea(cnt) for cnt in contours])
+            rects = np.array([cv2.boundingRect(contours[i]) for i in np.flatnonzero(areas > basemin)], dtype = int).reshape(-1, 4)
+            if rects.size:
+                miny, maxy, minx, maxx = int(rects[:, 1].min()), int((rects[:, 1] + rects[:, 3]).max()), int(rects[:, 0].min()), int((rects[:, 0] + rects[:, 2]).max())
+            else:
+                miny, maxy, minx, maxx = binary.shape[0], 0, binary.shape[1], 0
         roi = [0 if miny - padding[0] < 0 else miny - padding[0], binary.shape[0] if maxy + padding[1] > binary.shape[0] else maxy + padding[1], 0 if minx - padding[2] < 0 else minx - padding[2], binary.shape[1] if maxx + padding[3] > binary.shape[1] else maxx + padding[3]]
+        self.rois[roiwrite] = roi
         if returnBound:
             self._writeROI(roi, roiwrite)
         self.crop(roi, resize)
@@ -1106,12 +1592,14 @@ class Image(object):
         self.image = cv2.Canny(self.image, threshold1, threshold2, apertureSize = apertureSize, L2gradient = L2gradient)
         return
 
-    def colorFilter(self, logic, roi = None):
+    def colorFilter(self, logic, roi = None, lutdir = None):
         """
         :param logic: The logic you want to run on the image.
         :type logic: str
         :param roi: The roi you want to apply the filter to
         :type roi: list or roi file
+        :param lutdir: If specified, the logic is precompiled into a lookup table cached in this directory.
+        :type lutdir: str
 
         This function applies a color filter defined by the input logic, to a
         targeted region defined by the input roi. The logic string itself is fairly complicated.
@@ -1128,11 +1616,20 @@ class Image(object):
         '((((r + g) + b) < 100) or ((r > 150) and (b > 150)))'.  The more complex
         your logic is the harder it is to read, so you may want to consider breaking
         up complex filtering into multiple steps for readability.  Finally, despite
-        the fact this function solves arbitrary logic, it is very fast.
+        the fact this function solves arbitrary logic, it is very fast.  Each logic
+        string is only parsed once, and is only evaluated inside the given roi.
+        If lutdir is specified, the logic is evaluated once for every possible color
+        and stored as a :py:class:`~ih.imgproc.ColorTable`, so applying the filter
+        is a single lookup.  This is worthwhile when the same logic is used on many images.
         """
         filter = ColorFilter(logic)
         roi = self._loadROI(roi)
-        self.image = filter.apply(self.image, roi)
+        if lutdir:
+            table = ColorTable("filter_" + hashlib.sha1(filter.filterString).hexdigest(), filter.table, lutdir)
+            region = self.image[roi[0]:roi[1], roi[2]:roi[3]]
+            region *= table.lookup(region)[:,:,None]
+        else:
+            self.image = filter.apply(self.image, roi)
         return
 
     def bitwise_not(self):
@@ -1240,9 +1737,7 @@ class Image(object):
         """
         if self.conn:
              finalpath = "/".join(os.path.abspath(self.input).split("/")[-6:])
-             self._addColumn("outputPath")
-             self.conn.execute("update images set outputPath=? where pegasusid=?", (finalpath, self.dbid))
-             self.conn.commit()
+             self._writeValues([("outputPath", finalpath)])
         return
 
     def extractMoments(self):
@@ -1257,10 +1752,7 @@ class Image(object):
         """
         moments = cv2.moments(cv2.inRange(self.image, np.array([1, 1, 1], np.uint8), np.array([255, 255, 255], np.uint8)))
         if self.conn:
-            for id in moments:
-                self._addColumn(id)
-                self.conn.execute("update images set " + id + "=? where pegasusid=?", (moments[id], self.dbid))
-            self.conn.commit()
+            self._writeValues(sorted(moments.items()))
             return
         else:
             return moments
@@ -1284,10 +1776,7 @@ class Image(object):
         height = pot[0] - plant[0]
         width = plant[3] - plant[2]
         if self.conn:
-            self._addColumn("height")
-            self._addColumn("width")
-            self.conn.execute("update images set height=?,width=? where pegasusid=?", (height, width, self.dbid))
-            self.conn.commit()
+            self._writeValues([("height", height), ("width", width)])
             return
         else:
             return [height, self.x]
@@ -1304,10 +1793,7 @@ class Image(object):
         height = bounds[1] - bounds[0]
         width = bounds[3] - bounds[2]
         if self.conn:
-            self._addColumn("height")
-            self._addColumn("width")
-            self.conn.execute("update images set height=?,width=? where pegasusid=?", (height, width, self.dbid))
-            self.conn.commit()
+            self._writeValues([("height", height), ("width", width)])
             return
         else:
             return [height, width]
@@ -1324,11 +1810,7 @@ class Image(object):
         """
         circle = cv2.minEnclosingCircle(self._getMergedContour())
         if self.conn:
-            self._addColumn("circle_centerx")
-            self._addColumn("circle_centery")
-            self._addColumn("circle_radius")
-            self.conn.execute("update images set circle_centerx=?, circle_centery=?, circle_radius=? where pegasusid=?", (circle[0][0], circle[0][1], circle[1], self.dbid))
-            self.conn.commit()
+            self._writeValues([("circle_centerx", circle[0][0]), ("circle_centery", circle[0][1]), ("circle_radius", circle[1])])
         else:
             return circle
 
@@ -1348,9 +1830,7 @@ class Image(object):
                     ), 0.001, True
                 ))
         if self.conn:
-            self._addColumn("convex_hull_area")
-            self.conn.execute("update images set convex_hull_area=? where pegasusid=?", (hull, self.dbid))
-            self.conn.commit()
+            self._writeValues([("convex_hull_area", hull)])
         else:
             return hull
 
@@ -1366,17 +1846,17 @@ class Image(object):
         """
         pixelCount = cv2.countNonZero(cv2.inRange(self.image, np.array([1, 1, 1], np.uint8), np.array([255, 255, 255], np.uint8)))
         if self.conn:
-            self._addColumn("pixels")
-            self.conn.execute("update images set pixels=? where pegasusid=?", (pixelCount, self.dbid))
-            self.conn.commit()
+            self._writeValues([("pixels", pixelCount)])
             return
         else:
             return pixelCount
 
-    def extractColorData(self, nonzero = True, returnhist = False):
+    def extractColorData(self, nonzero = True, returnhist = False, packed = False):
         """
         :param nonzero: Whether or not to look at only nonzero pixelsself.  Default true.
         :type nonzero: bool
+        :param packed: Store the histogram as a single packed row in the histograms table instead of 768 columns.
+        :type packed: bool
         :return: Mean & median for each channel.
         :rtype: list
 
@@ -1388,67 +1868,66 @@ class Image(object):
         Mean values always come before median values.  If nonzero is set to true (default)
         the function will only calculate mediapytn and means based on the non-black pixels.
         If you are connected to a database, the entire histogram is saved to the database,
-        not just the mean and median.
+        not just the mean and median.  With packed set, the histogram is saved as
+        kind 'colors' in the histograms table, see :py:class:`~ih.database.DbWriter`.
         """
         hist = self._colorHistogram()
         if returnhist:
             return hist
-        colors = [    [np.mean(hist[0][np.nonzero(hist[0])] if nonzero else hist[0]), np.median(hist[0][np.nonzero(hist[0])] if nonzero else hist[0])],
-                    [np.mean(hist[1][np.nonzero(hist[1])] if nonzero else hist[1]), np.median(hist[1][np.nonzero(hist[1])] if nonzero else hist[1])],
-                    [np.mean(hist[2][np.nonzero(hist[2])] if nonzero else hist[2]), np.median(hist[2][np.nonzero(hist[2])] if nonzero else hist[2])]
-                ]
+        colors = self._colorStats(hist, nonzero)
         if self.conn:
-            self._addColumn("rmean")
-            self._addColumn("rmed")
-            self._addColumn("gmean")
-            self._addColumn("gmed")
-            self._addColumn("bmean")
-            self._addColumn("bmed")
-            query = "update images set rmean=?,rmed=?,gmean=?,gmed=?,bmean=?,bmed=?"
-            values = [colors[2][0], colors[2][1], colors[1][0], colors[1][1], colors[0][0], colors[0][1]]
-            for x,c in enumerate(["bhist", "ghist", "rhist"]):
-                for i in range(0, 256):
-                    self._addColumn(c + str(i))
-                    query += "," + c + str(i) + "=?"
-                    values.append(int(hist[x][i]))
-            query += " where pegasusid=?"
-            values.append(self.dbid)
-            self.conn.execute(query, tuple(values))
-            self.conn.commit()
+            values = [("rmean", colors[2][0]), ("rmed", colors[2][1]), ("gmean", colors[1][0]), ("gmed", colors[1][1]), ("bmean", colors[0][0]), ("bmed", colors[0][1])]
+            if packed:
+                self._writeHistogram("colors", hist)
+            else:
+                values += [(c + str(i), int(hist[x][i])) for x,c in enumerate(["bhist", "ghist", "rhist"]) for i in range(0, 256)]
+            self._writeValues(values)
             return
         else:
             return colors
 
-    def extractColorChannels(self):
-    	"""
-    	This function extracts the total number of pixels of each color value
-        for each channel.
-    	"""
-        b, g, r = cv2.split(self.image)
-        bdata, gdata, rdata = [], [], []
-        for i in range(0, 256):
-            bdata.append(np.count_nonzero(np.where(b == i, True, False)))
-            gdata.append(np.count_nonzero(np.where(g == i, True, False)))
-            rdata.append(np.count_nonzero(np.where(r == i, True, False)))
-        data = [bdata, gdata, rdata]
+    def extractColorChannels(self, asarray = False, packed = False):
+        """
+        :param asarray: If True, return the counts as a single (3, 256) numpy array.
+        :type asarray: bool
+        :param packed: Store the counts as a single packed row in the histograms table instead of 768 columns.
+        :type packed: bool
+        :return: The number of pixels of each value for each channel, ordered B, G, R.
+        :rtype: tuple or numpy.ndarray
+
+        This function extracts the total number of pixels of each color value
+        for each channel.  Each channel is counted in a single pass.
+        """
+        data = self._channelCounts()
         if self.conn:
-            query = "update images set "
-            values = []
-            for x,c in enumerate(["b", "g", "r"]):
-                for i in range(0, 256):
-                    self._addColumn(c + str(i))
-                    if i == 0 and c == "b":
-                        query += c + str(i) + "=?"
-                    else:
-                        query += "," + c + str(i) + "=?"
-                    values.append(data[x][i])
-            query += " where pegasusid=?"
-            values.append(self.dbid)
-            self.conn.execute(query, tuple(values))
-            self.conn.commit()
+            if packed:
+                self._writeHistogram("channels", data)
+            else:
+                self._writeValues([(c + str(i), int(data[x][i])) for x,c in enumerate(["b", "g", "r"]) for i in range(0, 256)])
             return
+        elif asarray:
+            return data
         else:
-            return (bdata, gdata, rdata)
+            return tuple([[int(count) for count in channel] for channel in data])
+
+    def extractColorCube(self):
+        """
+        :return: The distinct colors of the image, packed as (B << 16) | (G << 8) | R, and the number of pixels of each.
+        :rtype: tuple
+
+        This function extracts a 3-D color histogram of the image.  Only colors
+        that are present in the image are kept, so the histogram is exact and still
+        small for processed images.  If you are connected to a database, the histogram
+        is saved as kind 'colors3d' in the histograms table, see :py:class:`~ih.database.DbWriter`.
+        The number of pixels in any color range can then be counted from the database without
+        reading the image again, which is how histogram binning counts the pixels of each bin.
+        """
+        cube = self._colorCube()
+        if self.conn:
+            self._writeHistogram(ih.database.DbWriter.cube, cube)
+            return
+        else:
+            return cube
 
     def extractBins(self, binlist):
         """
@@ -1496,14 +1975,416 @@ class Image(object):
         database, and the name you specify for you bin will be
         the column name in the database.
         """
-        binlist = self._loadBins(binlist)
-        for i in range(0, len(binlist)):
-            binlist[i]["count"] = cv2.countNonZero(cv2.inRange(self.image, np.array(binlist[i]["min"], np.uint8), np.array(binlist[i]["max"], np.uint8)))
+        binlist = self._binCounts(binlist)
         if self.conn:
-            for bin in binlist:
-                self._addColumn(bin["name"])
-                self.conn.execute("update images set " + bin["name"] + "=? where pegasusid=?", (bin["count"], self.dbid))
-            self.conn.commit()
+            self._writeValues([(bin["name"], bin["count"]) for bin in binlist])
             return
         else:
             return binlist
+
+    def extractAll(self, features = ["dimensions", "pixels", "moments", "colors", "channels", "hull", "circle"], dimfromroi = None, bins = None, packed = False):
+        """
+        :param features: The features to extract, any of 'dimensions', 'pixels', 'moments', 'colors', 'channels', 'hull', 'circle', and 'colors3d'.
+        :type features: list
+        :param dimfromroi: If specified, dimensions are calculated from this roi instead.
+        :type dimfromroi: list or roi file
+        :param bins: If specified, the bins (color ranges) to count.
+        :type bins: list or bin file
+        :param packed: Store the 'colors' and 'channels' histograms as packed rows in the histograms table.
+        :type packed: bool
+        :return: A dictionary of column name to value for every extracted feature.
+        :rtype: dict
+
+        This function extracts all requested features in a single pass.  The binary mask,
+        the merged contour, the bounds, and the color histogram are each calculated only
+        once, and shared between all the features that need them.  The extracted
+        values are identical to calling the individual extract functions, i.e. 'pixels' corresponds
+        to :py:meth:`~ih.imgproc.Image.extractPixels`, 'hull' corresponds to
+        :py:meth:`~ih.imgproc.Image.extractConvexHull` and so on.  If you are connected to a
+        database, all values are written with a single update (or buffered, if the image shares a
+        :py:class:`~ih.database.DbWriter`), otherwise the values are returned.
+        """
+        for feature in features:
+            if feature not in conf.features:
+                raise Exception("Invalid feature '%s'." % (feature,))
+        values = []
+        packed = packed and self.conn
+        mask = cv2.inRange(self.image, np.array([1, 1, 1], np.uint8), np.array([255, 255, 255], np.uint8)) if self._isColor() else cv2.inRange(self.image, 1, 255)
+        if dimfromroi is not None or "dimensions" in features:
+            bounds = self.getBounds()
+            if dimfromroi is not None:
+                pot = self._loadROI(dimfromroi)
+                values += [("height", pot[0] - bounds[0]), ("width", bounds[3] - bounds[2])]
+            else:
+                values += [("height", bounds[1] - bounds[0]), ("width", bounds[3] - bounds[2])]
+        if "pixels" in features:
+            values.append(("pixels", cv2.countNonZero(mask)))
+        if "moments" in features:
+            values += sorted(cv2.moments(mask).items())
+        if "colors" in features:
+            hist = self._colorHistogram()
+            colors = self._colorStats(hist)
+            values += [("rmean", colors[2][0]), ("rmed", colors[2][1]), ("gmean", colors[1][0]), ("gmed", colors[1][1]), ("bmean", colors[0][0]), ("bmed", colors[0][1])]
+            if packed:
+                self._writeHistogram("colors", hist)
+            else:
+                values += [(c + str(i), int(hist[x][i])) for x,c in enumerate(["bhist", "ghist", "rhist"]) for i in range(0, 256)]
+        if "channels" in features:
+            data = self._channelCounts()
+            if packed:
+                self._writeHistogram("channels", data)
+            else:
+                values += [(c + str(i), int(data[x][i])) for x,c in enumerate(["b", "g", "r"]) for i in range(0, 256)]
+        if "hull" in features or "circle" in features:
+            merged = self._getMergedContour(mask)
+            if "circle" in features:
+                circle = cv2.minEnclosingCircle(merged)
+                values += [("circle_centerx", circle[0][0]), ("circle_centery", circle[0][1]), ("circle_radius", circle[1])]
+            if "hull" in features:
+                values.append(("convex_hull_area", cv2.contourArea(cv2.approxPolyDP(cv2.convexHull(merged), 0.001, True))))
+        if bins is not None:
+            values += [(bin["name"], bin["count"]) for bin in self._binCounts(bins)]
+        if "colors3d" in features:
+            if self.conn:
+                self._writeHistogram(ih.database.DbWriter.cube, self._colorCube())
+            else:
+                values.append(("colors3d", self._colorCube()))
+        if self.conn:
+            self._writeValues(values)
+            return
+        else:
+            return dict(values)
+
+
+class Chain(object):
+
+    """
+    Runs all the steps of a single image type workflow in one Image instance.
+    """
+    def __init__(self, input, jobs, outputdir = ".", prefix = None, save = False, keep = [], db = None, dbid = None, writer = None, cache = None):
+        """
+        :param input: The input resource, either a path to an image or a raw numpy array.
+        :type input: numpy.ndarray or str
+        :param jobs: The validated job list of a single image type.
+        :type jobs: list
+        :param outputdir: The directory to write output files.
+        :type outputdir: str
+        :param prefix: Prefix of all written files, outputs are written as prefix_name.png.
+        :type prefix: str
+        :param save: If True, write every intermediate output to disk.
+        :type save: bool
+        :param keep: Output names to write to disk even if save is False.
+        :type keep: list
+        :param db: The database to write errors to.
+        :type db: str
+        :param dbid: The pegasusid of the image in the database.
+        :type dbid: str
+        :param writer: A writer shared between images, see :py:class:`~ih.database.DbWriter`.
+        :type writer: :py:class:`~ih.database.DbWriter`
+        :param cache: A step result cache, only used if input is a path.
+        :type cache: :py:class:`~ih.cache.StepCache`
+
+        The job list should be the list defined for a single image type after validation,
+        that is, ih.validator.ImageProcessor(...).workflow.data["workflows"][imtype].
+        Each job is run against the same :py:class:`~ih.imgproc.Image` instance.  Every
+        output is saved as a state under its output name, so later steps load their inputs
+        from memory instead of from disk.  Outputs are only written when save is set
+        (the 'save-steps' option), or when they are listed in keep.  With a cache,
+        steps whose results are cached load their outputs from the cache instead
+        of running, and steps whose outputs aren't needed are skipped.
+        """
+        self.input = input
+        self.jobs = jobs
+        self.outputdir = outputdir
+        self.prefix = prefix
+        self.save = save
+        self.keep = keep
+        self.db = db
+        self.dbid = dbid
+        self.writer = writer
+        self.cache = cache
+        self.plant = None
+        self.steps = {
+            "ih-resize": self._resize,
+            "ih-color-filter": self._colorFilter,
+            "ih-edges": self._edges,
+            "ih-contour-chop": self._contourChop,
+            "ih-contour-cut": self._contourCut,
+            "ih-mask": self._mask,
+            "ih-crop": self._crop,
+            "ih-split": self._split,
+            "ih-equalize-hist": self._equalizeHist,
+            "ih-flood-fill": self._floodFill,
+            "ih-fill": self._fill,
+            "ih-morphology": self._morphology,
+            "ih-normalize-intensity": self._normalizeIntensity,
+            "ih-gaussian-blur": self._gaussianBlur,
+            "ih-median-blur": self._medianBlur,
+            "ih-blur": self._blur,
+            "ih-adaptive-threshold": self._adaptiveThreshold,
+            "ih-meanshift": self._meanshift,
+            "ih-convert-color": self._convertColor,
+            "ih-threshold": self._threshold,
+            "ih-bitwise-and": self._bitwiseAnd,
+            "ih-bitwise-or": self._bitwiseOr,
+            "ih-bitwise-xor": self._bitwiseXor,
+            "ih-bitwise-not": self._bitwiseNot,
+            "ih-add-weighted": self._addWeighted
+        }
+        return
+
+    def _fname(self, name, extension):
+        return (self.prefix + "_" + name if self.prefix else name) + extension
+
+    def _arg(self, job, arg, default = None, type = None):
+        if arg in job["arguments"] and job["arguments"][arg] != "":
+            value = job["arguments"][arg]
+            if isinstance(value, basestring):
+                value = value.strip('"')
+            return type(value) if type else value
+        return default
+
+    def _flag(self, job, arg):
+        return arg in job["arguments"]
+
+    def _tuple(self, job, arg):
+        value = self._arg(job, arg)
+        if isinstance(value, list):
+            return tuple([int(x) for x in value])
+        return tuple([int(x) for x in str(value).replace(",", " ").split()])
+
+    def _resource(self, job, index):
+        """
+        Returns the image input at the given index, either a saved state or a raw file.
+        """
+        if index < len(job["inputs"]):
+            return job["inputs"][index]
+        return None
+
+    def _roi(self, job, index):
+        """
+        Returns the roi input at the given index, either a detected roi or a raw file.
+        """
+        if index < len(job["inputs"]):
+            name = job["inputs"][index]
+            return name if os.path.isfile(name) else self._fname(name, ".json")
+        return None
+
+    def _resize(self, job):
+        self.plant.resizeSelf(self._arg(job, "--scale", type = float), self._arg(job, "--width", type = int), self._arg(job, "--height", type = int))
+        return
+
+    def _colorFilter(self, job):
+        self.plant.colorFilter(self._arg(job, "--logic"), self._roi(job, 1), self._arg(job, "--lutdir"))
+        return
+
+    def _edges(self, job):
+        self.plant.edges(self._arg(job, "--threshold1", type = int), self._arg(job, "--threshold2", type = int), self._arg(job, "--apertureSize", 3, int), self._flag(job, "--L2gradient"))
+        return
+
+    def _contourChop(self, job):
+        self.plant.contourChop(self._resource(job, 1), self._arg(job, "--basemin", 100, int), self._flag(job, "--components"))
+        return
+
+    def _contourCut(self, job):
+        padding = [self._arg(job, "--padminy", 0, int), self._arg(job, "--padmaxy", 0, int), self._arg(job, "--padminx", 0, int), self._arg(job, "--padmaxx", 0, int)]
+        # Like the script, the image is always cropped, and the roi is written if returnBound
+        # is set.  A named roi output is only written when it is saved or kept, later steps
+        # read it from memory.
+        if len(job["outputs"]) > 1:
+            roiwrite = self._fname(job["outputs"][1], ".json")
+            returnBound = self._flag(job, "--returnBound") and (self.save or job["outputs"][1] in self.keep)
+        else:
+            roiwrite = self._arg(job, "--roiwrite", "roi.json")
+            returnBound = self._flag(job, "--returnBound")
+        if returnBound:
+            self._makeDirs(roiwrite)
+        self.plant.contourCut(self._resource(job, 1), self._arg(job, "--basemin", 100, int), padding, self._flag(job, "--resize"), returnBound, roiwrite, self._flag(job, "--components"))
+        return
+
+    def _mask(self, job):
+        self.plant.mask()
+        return
+
+    def _crop(self, job):
+        self.plant.crop(self._roi(job, 1), self._flag(job, "--resize"))
+        return
+
+    def _split(self, job):
+        self.plant.split(self._arg(job, "--channel", type = int))
+        return
+
+    def _equalizeHist(self, job):
+        self.plant.equalizeHist()
+        return
+
+    def _floodFill(self, job):
+        self.plant.floodFill(self._resource(job, 1),
+                            self._tuple(job, "--low"),
+                            self._tuple(job, "--high"),
+                            writeColor = self._tuple(job, "--writeColor"),
+                            connectivity = self._arg(job, "--connectivity", 4, int),
+                            fixed = self._flag(job, "--fixed"),
+                            seed = (self._arg(job, "--seedx", 0, int), self._arg(job, "--seedy", 0, int)),
+                            findSeed = self._flag(job, "--findSeed"),
+                            seedMask = self._resource(job, 2),
+                            binary = self._flag(job, "--binary")
+                            )
+        return
+
+    def _fill(self, job):
+        self.plant.fill(self._roi(job, 1), [self._arg(job, "--b", 0, int), self._arg(job, "--g", 0, int), self._arg(job, "--r", 0, int)])
+        return
+
+    def _morphology(self, job):
+        self.plant.morphology(self._arg(job, "--morphType"), self._arg(job, "--ktype"), (self._arg(job, "--kwidth", type = int), self._arg(job, "--kheight", type = int)), (self._arg(job, "--anchorx", -1, int), self._arg(job, "--anchory", -1, int)), self._arg(job, "--iterations", 1, int), self._arg(job, "--border", "default"))
+        return
+
+    def _normalizeIntensity(self, job):
+        self.plant.normalizeByIntensity()
+        return
+
+    def _gaussianBlur(self, job):
+        self.plant.gaussianBlur((self._arg(job, "--kwidth", type = int), self._arg(job, "--kheight", type = int)), self._arg(job, "--sigmax", 0, int), self._arg(job, "--sigmay", 0, int), self._arg(job, "--border", "default"))
+        return
+
+    def _medianBlur(self, job):
+        self.plant.medianBlur(self._arg(job, "--ksize", type = int))
+        return
+
+    def _blur(self, job):
+        self.plant.blur((self._arg(job, "--kwidth", type = int), self._arg(job, "--kheight", type = int)), (self._arg(job, "--anchorx", -1, int), self._arg(job, "--anchory", -1, int)), self._arg(job, "--border", "default"))
+        return
+
+    def _adaptiveThreshold(self, job):
+        self.plant.adaptiveThreshold(self._arg(job, "--value", type = int), self._arg(job, "--adaptiveType"), self._arg(job, "--thresholdType"), self._arg(job, "--blockSize", type = int), self._arg(job, "--C", type = int))
+        return
+
+    def _meanshift(self, job):
+        self.plant.meanshift(self._arg(job, "--spatial_radius", type = int), self._arg(job, "--range_radius", type = int), self._arg(job, "--min_density", type = int), self._arg(job, "--mode", "full"), self._arg(job, "--processes", type = int), self._arg(job, "--overlap", type = int), self._arg(job, "--scale", 0.5, float))
+        return
+
+    def _convertColor(self, job):
+        self.plant.convertColor(self._arg(job, "--intype"), self._arg(job, "--outtype"))
+        return
+
+    def _threshold(self, job):
+        self.plant.threshold(self._arg(job, "--thresh", 127, int), self._arg(job, "--max", 255, int), self._arg(job, "--type", "binary"))
+        return
+
+    def _bitwiseAnd(self, job):
+        if self._flag(job, "--mask"):
+            self.plant.mask()
+        self.plant.bitwise_and(self._resource(job, 1))
+        return
+
+    def _bitwiseOr(self, job):
+        self.plant.bitwise_or(self._resource(job, 1))
+        return
+
+    def _bitwiseXor(self, job):
+        self.plant.bitwise_xor(self._resource(job, 1))
+        return
+
+    def _bitwiseNot(self, job):
+        self.plant.bitwise_not()
+        return
+
+    def _addWeighted(self, job):
+        self.plant.addWeighted(self._resource(job, 1), self._arg(job, "--weight1", type = float), self._arg(job, "--weight2", type = float))
+        return
+
+    def _makeDirs(self, fname):
+        dirname = os.path.dirname(self.plant.outputdir + "/" + fname)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        return
+
+    def _write(self, name):
+        fname = self._fname(name, ".png")
+        self._makeDirs(fname)
+        self.plant.write(fname)
+        return
+
+    def _runJob(self, job):
+        if job["executable"] not in self.steps:
+            raise Exception("Executable '%s' cannot be run in a chain." % (job["executable"],))
+        if job["inputs"][0] not in self.plant.states:
+            raise Exception("Job '%s' input '%s' is not a saved state." % (job["name"], job["inputs"][0]))
+        self.plant.restore(job["inputs"][0])
+        self.steps[job["executable"]](job)
+        for i,output in enumerate(job["outputs"]):
+            if conf.valid[job["executable"]]["outputs"][i] == "image":
+                if self.plant.image.size == 0:
+                    raise Exception("Job '%s' output '%s' is an empty image." % (job["name"], output))
+                self.plant.states[output] = self._normalise(self.plant.image)
+                if self.save or output in self.keep:
+                    self._write(output)
+        return
+
+    def _normalise(self, image):
+        """
+        Returns the image cv2.imread gives for an output once it is written, an 8 bit,
+        3 channel image.  Every output is converted, so that later steps get the same
+        input they would get as separate scripts.  For example, a grayscale threshold
+        is loaded as bgr by a following ih-bitwise-and.
+        """
+        if image.dtype == np.uint8 and image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] == 3:
+            return image.copy()
+        return cv2.imdecode(cv2.imencode(".png", image)[1], cv2.IMREAD_COLOR)
+
+    def _loadCached(self, job, paths):
+        """
+        Loads the cached outputs of a job as saved states.  Returns False if
+        any of them can't be read, in which case the job should run instead.
+        """
+        images = [cv2.imread(path) for path in paths]
+        if any(image is None for image in images):
+            return False
+        for i,output in enumerate(job["outputs"]):
+            self.plant.states[output] = images[i]
+            if self.save or output in self.keep:
+                fname = self._fname(output, ".png")
+                self._makeDirs(fname)
+                shutil.copyfile(paths[i], self.plant.outputdir + "/" + fname)
+        return True
+
+    def _storeCached(self, job, key):
+        """
+        Adds the outputs of a job that just ran to the cache.
+        """
+        for i,output in enumerate(job["outputs"]):
+            tmp = self.cache.file(key, i) + "." + str(os.getpid()) + ".png"
+            if not os.path.isdir(os.path.dirname(tmp)):
+                os.makedirs(os.path.dirname(tmp))
+            cv2.imwrite(tmp, self.plant.states[output])
+            self.cache.store(key, i, tmp, True)
+        return
+
+    def run(self):
+        """
+        :return: The image instance all steps were run on.
+        :rtype: :py:class:`~ih.imgproc.Image`
+
+        Runs every job in dependency order.  The raw input image is saved under
+        the image input names of the first job to run (usually 'base').
+        """
+        jobs = ih.cache.order(self.jobs)
+        self.plant = Image(self.input, self.outputdir, db = self.db, dbid = self.dbid, writer = self.writer)
+        for i,type in enumerate(conf.valid[jobs[0]["executable"]]["inputs"]):
+            if type == "image" and i < len(jobs[0]["inputs"]):
+                self.plant.save(jobs[0]["inputs"][i])
+        if self.cache and isinstance(self.input, basestring):
+            keys, cached, run = self.cache.plan(self.jobs, self.input, self.keep, self.save)
+        else:
+            keys, cached, run = {}, {}, set([job["name"] for job in jobs])
+        for job in jobs:
+            if job["name"] in cached and self._loadCached(job, cached[job["name"]]):
+                continue
+            if job["name"] in run or job["name"] in cached:
+                self._runJob(job)
+                if job["name"] in keys and self.cache.cacheable(job):
+                    self._storeCached(job, keys[job["name"]])
+        return self.plant
@@ -20,15 +20,12 @@ import sqlite3
 import conf
 import datetime
 import numpy as np
-import pandas
-import ih.imgproc
-import cv2
+import ih.database
 import json
 import traceback
 import shutil
 import subprocess
 import itertools
-from scipy import stats
 
 class Stats:
 
@@ -40,21 +37,22 @@ class Stats:
     def _openConnection(self, db = None):
         db = self.db if not db else db
         if os.path.isfile(db):
-            conn = sqlite3.connect(db, check_same_thread = False)
-            conn.row_factory = sqlite3.Row
-            result = conn.execute("select pegasusid from images limit 0,1")
-            if not result.fetchone():
-                raise Exception("Database '%s' has no entries!" % (db,))
-            # Have to enable foreign keys EVERY time.
-            conn.execute("PRAGMA foreign_keys = ON")
-            conn.commit()
+            # Connections are reused, only check new ones.
+            check = not ih.database.isOpen(db)
+            # Foreign keys are enabled by the master role.
+            conn = ih.database.connect(db, "master")
+            if check:
+                result = conn.execute("select pegasusid from images limit 0,1")
+                if not result.fetchone():
+                    ih.database.close(conn)
+                    raise Exception("Database '%s' has no entries!" % (db,))
         else:
             raise Exception("Database file '%s' does not exist." % (db,))
         return conn
 
     def _closeConnection(self, conn = None):
         conn = self.conn if not conn else conn
-        conn.close()
+        ih.database.close(conn)
         return
 
     def _tableExists(self, tablename, conn = None):
@@ -111,17 +109,19 @@ class Stats:
         conn = self.conn if not conn else conn
         if parentCol not in [row["name"] for row in conn.execute("PRAGMA table_info('" + parent + "');")] and childCol in [row["name"] for row in conn.execute("PRAGMA table_info('" + child + "');")]:
             conn.execute("alter table '" + parent + "' add column '" + parentCol + "' REFERENCES '" + child + "'('" + childCol + "');")
+            # Without an index, every delete from the child table scans the parent table.
+            conn.execute("create index if not exists " + parent + "_" + parentCol + " on " + parent + " (" + parentCol + ")")
             conn.commit()
         return
 
     def _createTable(self, funcname, intable, outtable, overwrite, conn = None):
         conn = self.conn if not conn else conn
         tablestr = "(pegasusid INTEGER PRIMARY KEY"
-        cols = [x[1] for x in conn.execute("pragma table_info('" + intable + "')")]
+        info = [(x[1], x[2]) for x in conn.execute("pragma table_info('" + intable + "')")]
         if "all" not in conf.statsColumns[funcname]["exclude"]:
-            for col in cols:
+            for col, type in info:
                 if col not in conf.statsColumns[funcname]["exclude"] and col[:3] != "ref":
-                    tablestr += "," + str(col)
+                    tablestr += "," + str(col) + (" " + str(type) if type else "")
         for col in conf.statsColumns[funcname]["add"]:
             tablestr += "," + str(col)
         tablestr += ")"
@@ -134,6 +134,8 @@ class Stats:
             conn.commit()
         conn.execute("CREATE TABLE " + outtable + " " + tablestr)
         conn.commit()
+        ih.database.createIndexes(conn, intable)
+        ih.database.createIndexes(conn, outtable)
         if conf.statsColumns[funcname]["ref"]:
             self._addKeyColumn(intable, "ref_" + outtable, outtable, "pegasusid", conn)
         return
@@ -214,22 +216,149 @@ class Stats:
             raise Exception("Data File: " + dataFile + " does not exist!")
         return
 
-    def loadSql(self, dblist):
-        for i,f in enumerate(dblist):
+    def _loadHistograms(self, kind, table = "images", imtypes = None, conn = None):
+        """
+        :param kind: The kind of histogram to load, either 'colors', 'channels', or 'colors3d'.
+        :type kind: str
+        :param table: The table to match image types against.
+        :type table: str
+        :param imtypes: If specified, only load histograms of images with these types.
+        :type imtypes: list
+        :return: A list of (pegasusid, histogram) pairs, each histogram is a (3, 256) array, or (colors, counts) for 'colors3d'.
+        :rtype: list
+
+        Loads packed histograms written by :py:meth:`~ih.database.DbWriter.addHistogram`.
+        """
+        conn = self.conn if not conn else conn
+        histtable = ih.database.DbWriter.histtable
+        if not self._tableExists(histtable, conn):
+            return []
+        query = "select h.pegasusid,h.data from " + histtable + " h join " + table + " t on h.pegasusid=t.pegasusid where h.kind=?"
+        values = (kind,)
+        if imtypes:
+            query += " and (" + " or ".join(["t.imtype=?" for x in imtypes]) + ")"
+            values += tuple(imtypes)
+        return [(row[0], ih.database.DbWriter.unpackCube(row[1]) if kind == ih.database.DbWriter.cube else ih.database.DbWriter.unpack(row[1])) for row in conn.execute(query, values)]
+
+    def _expandHistograms(self, frame, conn = None):
+        """
+        :param frame: The data to add histogram columns to, must have a pegasusid column.
+        :type frame: pandas.DataFrame
+        :return: The data with a column for every histogram value.
+        :rtype: pandas.DataFrame
+
+        Expands packed histograms back to the wide columns written by
+        :py:meth:`~ih.imgproc.Image.extractColorData` and :py:meth:`~ih.imgproc.Image.extractColorChannels`.
+        """
+        import pandas
+        conn = self.conn if not conn else conn
+        histtable = ih.database.DbWriter.histtable
+        if not self._tableExists(histtable, conn):
+            return frame
+        for kind, prefixes in sorted(ih.database.DbWriter.histograms.items()):
+            rows = [(row[0], ih.database.DbWriter.unpack(row[1])) for row in conn.execute("select pegasusid,data from " + histtable + " where kind=?", (kind,))]
+            if rows:
+                columns = [c + str(i) for c in prefixes for i in range(0, 256)]
+                wide = pandas.DataFrame(np.vstack([hist.reshape(1, -1) for id, hist in rows]), columns = columns)
+                wide.insert(0, "pegasusid", [id for id, hist in rows])
+                frame = frame.merge(wide, how = "left", on = "pegasusid")
+        return frame
+
+    def loadSql(self, dblist, batch = 8, append = False):
+        """
+        :param dblist: The databases to merge into this database.
+        :type dblist: list
+        :param batch: The number of databases to attach at once.
+        :type batch: int
+        :param append: Whether or not to insert rows that are not already in this database.
+        :type append: bool
+
+        Merges the images (and histograms) tables of many small databases, such as
+        the per cluster extraction databases, into this database.  Each image row in this
+        database is updated with every column of the matching row in the small databases.
+        The union of all columns is added up front in a single transaction.  Databases are then
+        attached in groups of batch, and every group is merged with one set based statement per
+        database, within a single transaction.  Existing rows are updated in place, with an upsert
+        if the sqlite version supports it (3.24 and later), and with an update otherwise.  Rows are copied inside sqlite, so no
+        database is ever loaded into memory.  By default, rows that are not already in this
+        database are skipped.  If append is set they are inserted instead, which is used
+        to combine disjoint databases in intermediate steps of a merge tree.
+        """
+        shards = []
+        for f in dblist:
             if os.path.isfile(f):
-                conn = self._openConnection(f)
-                headers = self._getHeaders("images", conn)
-                for cols in (headers[pos:pos + 500] for pos in xrange(0, len(headers), 500)):
-                    for col in cols:
-                        self._addColumn(col, "images")
-                    result = conn.execute("select pegasusid," + ",".join(cols) + " from images")
-                    query = "update images set " + ",".join([col + "=?" for col in cols]) + " where pegasusid=?"
-                    values = [tuple([row[col] for col in cols] + [row["pegasusid"]]) for row in result]
-                    self.conn.executemany(query, values)
-                    self.conn.commit()
-                self._closeConnection(conn)
+                shards.append(f)
             else:
                 print "DB File: '%s' does not exist." % (f,)
+        histtable = ih.database.DbWriter.histtable
+        groups = [shards[pos:pos + batch] for pos in xrange(0, len(shards), batch)]
+        # Rows are never replaced, replacing deletes the old row first, which would fire the ref_ foreign keys.
+        upsert = sqlite3.sqlite_version_info >= (3, 24, 0)
+        isolation = self.conn.isolation_level
+        self.conn.isolation_level = None
+        try:
+            headers = self._getHeaders("images")
+            shardHeaders = {}
+            types = {}
+            hists = set()
+            for group in groups:
+                self._attach(group)
+                for i,f in enumerate(group):
+                    info = [(str(row[1]), str(row[2])) for row in self.conn.execute("PRAGMA shard" + str(i) + ".table_info(images)") if row[1] != "pegasusid"]
+                    shardHeaders[f] = [col for col, type in info]
+                    for col, type in info:
+                        types.setdefault(col, type)
+                    if self.conn.execute("select name from shard" + str(i) + ".sqlite_master where type='table' and name=?", (histtable,)).fetchone():
+                        hists.add(f)
+                self._detach(group)
+            columns = []
+            for f in shards:
+                for col in shardHeaders[f]:
+                    if col not in headers and col not in columns:
+                        columns.append(col)
+            self.conn.execute("begin")
+            for col in columns:
+                self.conn.execute("alter table images add column " + col + (" " + types[col] if types[col] else "") + ";")
+            if hists:
+                self.conn.execute("create table if not exists " + histtable + " (pegasusid, kind, data BLOB, PRIMARY KEY (pegasusid, kind))")
+            self.conn.execute("commit")
+            headers += columns
+            for group in groups:
+                self._attach(group)
+                self.conn.execute("begin")
+                for i,f in enumerate(group):
+                    name = "shard" + str(i)
+                    cols = shardHeaders[f]
+                    select = "select " + ",".join(["pegasusid"] + cols) + " from " + name + ".images"
+                    if upsert and cols:
+                        self.conn.execute("insert into images (" + ",".join(["pegasusid"] + cols) + ") " + select + " where " + ("1" if append else "pegasusid in (select pegasusid from main.images)") + " on conflict(pegasusid) do update set " + ",".join([col + "=excluded." + col for col in cols]))
+                    else:
+                        if cols:
+                            self.conn.execute("update images set " + ",".join([col + "=(select " + col + " from " + name + ".images s where s.pegasusid=images.pegasusid)" for col in cols]) + " where pegasusid in (select pegasusid from " + name + ".images)")
+                        if append:
+                            self.conn.execute("insert or ignore into images (" + ",".join(["pegasusid"] + cols) + ") " + select)
+                    if f in hists:
+                        self.conn.execute("insert or replace into " + histtable + " (pegasusid, kind, data) select pegasusid,kind,data from " + name + "." + histtable)
+                self.conn.execute("commit")
+                self._detach(group)
+        except:
+            try:
+                self.conn.execute("rollback")
+            except sqlite3.OperationalError:
+                pass
+            raise
+        finally:
+            self.conn.isolation_level = isolation
+        return
+
+    def _attach(self, dblist):
+        for i,f in enumerate(dblist):
+            self.conn.execute("attach database ? as shard" + str(i), (f,))
+        return
+
+    def _detach(self, dblist):
+        for i,f in enumerate(dblist):
+            self.conn.execute("detach database shard" + str(i))
         return
 
     def logErrors(self, logfile, table = "images"):
@@ -332,47 +461,28 @@ class Stats:
         headers = self._getHeaders(outtable)
         dataHeaders = [header for header in headers if header not in conf.allHeaders and "ref" not in header]
         start = len(headers) - len(dataHeaders)
-        """
-        map = {
-            "genotype": {
-                "date": {
-                    "treatment": {
-                        "writeback": [],
-                        "values": ()
-                    }
-                }
-            }
-        }
-        """
-        dataMap = {}
-        result = self.conn.execute("select pegasusid," + ",".join(headers) + " from " + intable + " where " + " or ".join(["imtype=?" for x in grouping]), tuple([x for x in grouping]))
-        for row in result:
-            if row["genotype"] not in dataMap:
-                dataMap[row["genotype"]] = {}
-            if row["date"] not in dataMap[row["genotype"]]:
-                dataMap[row["genotype"]][row["date"]] = {}
-            if row["treatment"] not in dataMap[row["genotype"]][row["date"]]:
-                dataMap[row["genotype"]][row["date"]][row["treatment"]] = {"writeback": [row["pegasusid"]], "values": tuple([row[x] for x in headers])}
-            else:
-                dataMap[row["genotype"]][row["date"]][row["treatment"]]["writeback"].append(row["pegasusid"])
-                values = []
-                for i,(x,y) in enumerate(zip(dataMap[row["genotype"]][row["date"]][row["treatment"]]["values"], tuple([row[x] for x in headers]))):
-                    if i < start:
-                        values.append(x)
+        ids, columns, groups, index = self._loadGroups(intable, headers, ["genotype", "date", "treatment"], " where " + " or ".join(["imtype=?" for x in grouping]), tuple(grouping))
+        first = self._groupFirst(index, len(groups))
+        values = [[column[i] for i in first] for column in columns]
+        kinds = [set(map(type, column)) for column in columns]
+        numeric = [i for i in range(start, len(headers)) if kinds[i] <= set([int, long, float, type(None)])]
+        sums = self._fromMatrix(self._groupSum(self._toMatrix([columns[i] for i in numeric]), index, len(groups)), [j for j,i in enumerate(numeric) if float not in kinds[i]])
+        for j,i in enumerate(numeric):
+            values[i] = sums[j]
+        # Columns that aren't numbers are still added value by value.
+        for i in range(start, len(headers)):
+            if i not in numeric:
+                totals = {}
+                for group, value in zip(index.tolist(), columns[i]):
+                    if group not in totals:
+                        totals[group] = value
                     else:
                         try:
-                            values.append(x + y)
+                            totals[group] = totals[group] + value
                         except:
-                            values.append(None)
-                dataMap[row["genotype"]][row["date"]][row["treatment"]]["values"] = tuple(values)
-
-        #Loop through dataMap, insert values and writeback accordingly
-        for genotype in dataMap:
-            for date in dataMap[genotype]:
-                for treatment in dataMap[genotype][date]:
-                    lastid = self.conn.execute("insert into " + outtable + " (" + ",".join(headers) + ") values (" + ",".join(["?"] * len(headers)) + ")", dataMap[genotype][date][treatment]["values"]).lastrowid
-                    self.conn.executemany("update " + intable + " set ref_" + outtable + "=? where pegasusid=?", tuple([(lastid, x) for x in dataMap[row["genotype"]][row["date"]][row["treatment"]]["writeback"]]))
-        self.conn.commit()
+                            totals[group] = None
+                values[i] = [totals[group] for group in range(len(groups))]
+        self._insertGroups(intable, outtable, headers, values, self._groupIds(ids, index, len(groups)))
         return
 
     def normalize(self, intable, outtable, column = "pixels", overwrite = False):
@@ -394,41 +504,295 @@ class Stats:
             conf.statsColumns["normalize"]["exclude"] += [column]
             self._createTable("normalize", intable, outtable, overwrite)
             headers = self._getHeaders(outtable)
-            dataHeaders = [header for header in headers if header not in conf.allHeaders and "ref" not in header]
-            result = self.conn.execute("select pegasusid," + column + "," + ",".join(headers) + " from " + intable)
-            vals = ()
-            for row in result:
-                vals = []
-                for x in headers:
-                    if x in conf.allHeaders:
-                        vals.append(row[x])
-                    else:
-                        if not self._checkNull(row[x]):
-                            if not self._checkNull(row[column]) and row[column]:
-                                vals.append(float(row[x]) / float(row[column]))
-                            else:
-                                vals.append(None)
-                        else:
-                            vals.append(None)
-                lastid = self.conn.execute("insert into " + outtable + " (" + ",".join(headers) + ") values (" + ",".join(["?"] * len(headers)) + ")", tuple(vals)).lastrowid
-                self.conn.execute("update " + intable + " set ref_" + outtable + "=? where pegasusid=?", (lastid, row["pegasusid"]))
-            self.conn.commit()
+            def prepare(rows):
+                # Rows with a null or zero column value are set to null, the same as null values.
+                return np.array([None if self._checkNull(row[1]) or not row[1] else float(row[1]) for row in rows], dtype = float)
+            def kernel(values, divisor):
+                numbers = self._toFloat(values, np.isnan(divisor))
+                with np.errstate(invalid = "ignore", divide = "ignore"):
+                    result = (numbers / divisor).astype(object)
+                result[np.isnan(numbers) | np.isnan(divisor)] = None
+                return result.tolist()
+            self._applyKernel(intable, outtable, headers, kernel, [column], prepare)
+        return
+
+    def _toFloat(self, values, skip = None):
+        """
+        :param values: The values of a single column.
+        :type values: list
+        :param skip: Values that are never used, and so are not converted.
+        :type skip: numpy.ndarray
+        :return: The values as floats, with nan for null values.
+        :rtype: numpy.ndarray
+
+        Converts values the same way as checking them with _checkNull and calling float on them,
+        but converts the entire column at once when possible.
+        """
+        try:
+            return np.array(values, dtype = float)
+        except (ValueError, TypeError):
+            skip = skip if skip is not None else np.zeros(len(values), dtype = bool)
+            return np.array([None if s or self._checkNull(value) else float(value) for value, s in zip(values, skip)], dtype = float)
+
+    def _applyKernel(self, intable, outtable, headers, kernel, columns = [], prepare = None, chunk = 5000):
+        """
+        :param intable: The input table to load information from
+        :type intable: str
+        :param outtable: The output table to write information to.
+        :type outtable: str
+        :param headers: The columns of the output table.
+        :type headers: list
+        :param kernel: The function to apply to each numeric column.
+        :type kernel: function
+        :param columns: Additional columns to load for the kernel.
+        :type columns: list
+        :param prepare: A function called once per chunk with the loaded rows, (pegasusid, columns...).
+        :type prepare: function
+        :param chunk: The number of rows to process at once.
+        :type chunk: int
+
+        Writes one row to outtable for every row in intable, and sets the
+        ref_outtable column of intable to the new row.  Metadata columns are copied,
+        and every numeric column is replaced by kernel(values, prepared), where values are the values of the column
+        for a chunk of rows, and prepared is the result of prepare for the chunk.
+        Each chunk is written with a single executemany for the output rows and a single executemany
+        for the back references.
+        """
+        numeric = [i for i,x in enumerate(headers) if x not in conf.allHeaders]
+        offset = 1 + len(columns)
+        lastid = self.conn.execute("select max(pegasusid) from " + outtable).fetchone()[0] or 0
+        insert = "insert into " + outtable + " (pegasusid," + ",".join(headers) + ") values (" + ",".join(["?"] * (len(headers) + 1)) + ")"
+        update = "update " + intable + " set ref_" + outtable + "=? where pegasusid=?"
+        result = self.conn.execute("select " + ",".join(["pegasusid"] + columns + headers) + " from " + intable)
+        rows = result.fetchmany(chunk)
+        while rows:
+            values = [list(x) for x in zip(*[tuple(row)[offset:] for row in rows])]
+            prepared = prepare(rows) if prepare else None
+            for i in numeric:
+                values[i] = kernel(values[i], prepared)
+            ids = range(lastid + 1, lastid + len(rows) + 1)
+            self.conn.executemany(insert, zip(ids, *values))
+            self.conn.executemany(update, zip(ids, [row[0] for row in rows]))
+            lastid += len(rows)
+            rows = result.fetchmany(chunk)
+        self.conn.commit()
+        return
+
+    def _loadGroups(self, intable, columns, keys, where = "", params = ()):
+        """
+        :param intable: The input table to load information from
+        :type intable: str
+        :param columns: The columns to load.
+        :type columns: list
+        :param keys: The columns to group rows by, which must be loaded.
+        :type keys: list
+        :param where: An optional where clause for the query.
+        :type where: str
+        :param params: Parameters for the where clause.
+        :type params: tuple
+        :return: (ids, columns, groups, index)
+        :rtype: tuple
+
+        Loads the given columns of intable with a single query.  Returns the pegasusid of each row,
+        the values of each column as a list, the distinct key tuples in order of appearance, and
+        an array containing the group number of each row.  The first row of each group is
+        the first row written to intable.
+        """
+        # Rows are loaded in the order they were written, whichever index is used for the where clause.
+        result = self.conn.execute("select " + ",".join(["pegasusid"] + columns) + " from " + intable + where + " order by rowid", params)
+        values = [list(x) for x in zip(*[tuple(row) for row in result])] or [[] for x in range(1 + len(columns))]
+        groups = {}
+        order = []
+        index = []
+        for key in zip(*[values[1 + columns.index(key)] for key in keys]):
+            if key not in groups:
+                groups[key] = len(order)
+                order.append(key)
+            index.append(groups[key])
+        return values[0], values[1:], order, np.array(index, dtype = np.int64)
+
+    def _groupFirst(self, index, count):
+        """
+        :param index: The group number of each row.
+        :type index: numpy.ndarray
+        :param count: The number of groups.
+        :type count: int
+        :return: The position of the first row of each group, or -1 for groups without rows.
+        :rtype: numpy.ndarray
+        """
+        first = np.full(count, -1, dtype = np.int64)
+        groups, positions = np.unique(index, return_index = True)
+        first[groups] = positions
+        return first
+
+    def _groupIds(self, ids, index, count):
+        """
+        :param ids: The pegasusid of each row.
+        :type ids: list
+        :param index: The group number of each row.
+        :type index: numpy.ndarray
+        :param count: The number of groups.
+        :type count: int
+        :return: The pegasusids of the rows in each group.
+        :rtype: list
+        """
+        groups = [[] for x in range(count)]
+        for group, id in zip(index.tolist(), ids):
+            groups[group].append(id)
+        return groups
+
+    def _toMatrix(self, columns, convert = False):
+        """
+        :param columns: The values of each column.
+        :type columns: list
+        :param convert: Whether or not to convert values that aren't numbers with float.
+        :type convert: bool
+        :return: A rows x columns array of floats.
+        :rtype: numpy.ndarray
+
+        Null values, and values that aren't numbers, are nan.
+        """
+        matrix = np.empty((len(columns[0]) if columns else 0, len(columns)))
+        for i, column in enumerate(columns):
+            if set(map(type, column)) <= set([int, long, float, type(None)]):
+                matrix[:, i] = np.array(column, dtype = float)
+            else:
+                for j, value in enumerate(column):
+                    try:
+                        matrix[j, i] = value if isinstance(value, (int, long, float)) else (float(value) if convert else np.nan)
+                    except (ValueError, TypeError):
+                        matrix[j, i] = np.nan
+        return matrix
+
+    def _fromMatrix(self, matrix, ints = []):
+        """
+        :param matrix: A rows x columns array of floats.
+        :type matrix: numpy.ndarray
+        :param ints: The positions of columns to write as integers.
+        :type ints: list
+        :return: The values of each column, with None for nan.
+        :rtype: list
+        """
+        null = np.isnan(matrix)
+        result = matrix.astype(object)
+        for i in ints:
+            result[:, i] = np.where(null[:, i], 0, matrix[:, i]).astype(np.int64).astype(object)
+        result[null] = None
+        return [column.tolist() for column in result.T]
+
+    def _groupSum(self, matrix, index, count):
+        """
+        :param matrix: A rows x columns array of floats.
+        :type matrix: numpy.ndarray
+        :param index: The group number of each row.
+        :type index: numpy.ndarray
+        :param count: The number of groups.
+        :type count: int
+        :return: A groups x columns array of sums.
+        :rtype: numpy.ndarray
+
+        Sums every column of every group at once.  Rows are added in order, so the
+        sums are the same as adding the values one by one, and a nan value makes
+        the sum of its group nan.
+        """
+        columns = matrix.shape[1]
+        cells = (index[:, np.newaxis] * columns + np.arange(columns)).ravel()
+        return np.bincount(cells, weights = matrix.ravel(), minlength = count * columns).reshape((count, columns))
+
+    def _groupTTest(self, matrix, index, count, a, b):
+        """
+        :param matrix: A rows x columns array of floats.
+        :type matrix: numpy.ndarray
+        :param index: The group number of each row.
+        :type index: numpy.ndarray
+        :param count: The number of groups.
+        :type count: int
+        :param a: Which rows belong to the first sample.
+        :type a: numpy.ndarray
+        :param b: Which rows belong to the second sample.
+        :type b: numpy.ndarray
+        :return: A groups x columns array of p values.
+        :rtype: numpy.ndarray
+
+        Computes the same two sided t test as scipy.stats.ttest_ind for every column of every
+        group at once.  Groups missing a sample, or with a nan value, have a nan p value.
+        """
+        from scipy import stats
+        moments = []
+        for sample in [a, b]:
+            n = np.bincount(index[sample], minlength = count).astype(float)[:, np.newaxis]
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                mean = self._groupSum(matrix[sample], index[sample], count) / n
+                var = self._groupSum((matrix[sample] - mean[index[sample]]) ** 2, index[sample], count) / (n - 1)
+            moments.append((n, mean, var))
+        (n1, mean1, var1), (n2, mean2, var2) = moments
+        df = n1 + n2 - 2
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            svar = ((n1 - 1) * var1 + (n2 - 1) * var2) / df
+            t = (mean1 - mean2) / np.sqrt(svar * (1.0 / n1 + 1.0 / n2))
+            return stats.t.sf(np.abs(t), np.broadcast_to(df, t.shape)) * 2
+
+    def _groupCorrelation(self, matrix, vector, index, count):
+        """
+        :param matrix: A rows x columns array of floats.
+        :type matrix: numpy.ndarray
+        :param vector: The values to correlate every column with.
+        :type vector: numpy.ndarray
+        :param index: The group number of each row.
+        :type index: numpy.ndarray
+        :param count: The number of groups.
+        :type count: int
+        :return: A groups x columns array of correlation coefficients.
+        :rtype: numpy.ndarray
+
+        Computes the same correlation coefficient as numpy.corrcoef for every column of
+        every group at once.  Columns with a nan value in a group have a nan coefficient.
+        """
+        n = np.bincount(index, minlength = count).astype(float)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            dx = matrix - (self._groupSum(matrix, index, count) / n[:, np.newaxis])[index]
+            dy = vector - (np.bincount(index, weights = vector, minlength = count) / n)[index]
+            cov = self._groupSum(dx * dy[:, np.newaxis], index, count)
+            var = self._groupSum(dx ** 2, index, count) * np.bincount(index, weights = dy ** 2, minlength = count)[:, np.newaxis]
+            return np.clip(cov / np.sqrt(var), -1, 1)
+
+    def _insertGroups(self, intable, outtable, headers, values, writeback):
+        """
+        :param intable: The input table to load information from
+        :type intable: str
+        :param outtable: The output table to write information to.
+        :type outtable: str
+        :param headers: The columns of the output table.
+        :type headers: list
+        :param values: The values of each column, one per output row.
+        :type values: list
+        :param writeback: The pegasusids of the input rows of each output row.
+        :type writeback: list
+
+        Writes every output row with a single executemany, and sets the ref_outtable column
+        of the input rows to their output row with another.
+        """
+        lastid = self.conn.execute("select max(pegasusid) from " + outtable).fetchone()[0] or 0
+        ids = range(lastid + 1, lastid + len(writeback) + 1)
+        self.conn.executemany("insert into " + outtable + " (pegasusid," + ",".join(headers) + ") values (" + ",".join(["?"] * (len(headers) + 1)) + ")", zip(ids, *values))
+        self.conn.executemany("update " + intable + " set ref_" + outtable + "=? where pegasusid=?", [(id, x) for id, rows in zip(ids, writeback) for x in rows])
+        self.conn.commit()
         return
 
     def extractAll(self, options):
+        import ih.imgproc
         basepath = os.path.dirname(os.path.dirname(os.path.abspath(self.db) + "/"))
         if "workflows" in options:
+            writer = ih.database.DbWriter(self.db, role = "master")
             for type in options["workflows"]:
-                self._openConnection()
                 tmp = self.conn.execute("select pegasusid,experiment,id,date,imtype,imgname from images where imtype=?", (type,))
                 result = tmp.fetchall()
                 for row in result:
                     finalpath = row["experiment"].replace(" ","") + "/" + row["id"].replace(" ","") + "/" + row["date"].replace(" ","") + "/" + row["imtype"].replace(" ","") + "/" + row["imgname"].replace(" ","") + "/" + row["pegasusid"] + "_" + options["workflows"][type]["inputs"][0] + ".png"
                     #finalpath = row["pegasusid"] + "_" + options["workflows"][type]["inputs"][0] + ".png"
-                    self._closeConnection()
                     if os.path.isfile(finalpath):
                         try:
-                            plant = ih.imgproc.Image(finalpath, db = self.db, dbid = row["pegasusid"])
+                            plant = ih.imgproc.Image(finalpath, dbid = row["pegasusid"], writer = writer)
                             plant.extractFinalPath()
                             if "--dimensions" in options["workflows"][type]["arguments"]:
                                 plant.extractDimensions()
@@ -446,12 +810,34 @@ class Stats:
                             print traceback.format_exc()
                     else:
                         print "PATH DOES NOT EXIST: %s." % (finalpath,)
+                writer.flush()
+            writer.close()
         if "histogram-bin" in options:
-            self._openConnection()
             self.histogramBinning("images", "histogramBins", dict((type,options["workflows"][type]["inputs"][0]) for type in options["workflows"]), options["histogram-bin"]["--group"], options["histogram-bin"]["--chunks"], options["histogram-bin"]["--channels"], True)
         return
 
-    def histogramBinning(self, intable, outtable, grouping, chunks, channels, jsonwrite = False, overwrite = False):
+    def histogramBinning(self, intable, outtable, grouping, chunks, channels, jsonwrite = False, overwrite = False, counts = False):
+        """
+        :param intable: The input table to load information from
+        :type intable: str
+        :param outtable: The suffix of the output tables, one is written per group.
+        :type outtable: str
+        :param grouping: The image types of each group.
+        :type grouping: dict
+        :param chunks: The number of chunks of each channel, per group.
+        :type chunks: dict
+        :param channels: The channels to split, per group.
+        :type channels: dict
+        :param jsonwrite: Whether or not to write the bins of each group to name_hist_bins.json.
+        :type jsonwrite: bool
+        :param counts: Whether or not to count the pixels of each image in each bin.
+        :type counts: bool
+
+        Sums the color histograms of each group, and splits them into bins.  With counts set,
+        the number of pixels of every image in every bin of its group is written to intable, exactly as
+        :py:meth:`~ih.imgproc.Image.extractBins` would, but counted from the 'colors3d' histograms
+        stored during extraction instead of reading every image again.
+        """
         color_vector = {}
         for name in grouping:
             self._validate("histogramBins", intable, name + "_" + outtable, overwrite)
@@ -459,20 +845,26 @@ class Stats:
             self._createTable("histogramBins", intable, name + "_" + outtable, overwrite)
             color_vector[name] = [0, 0, 0]
         map = dict((type, name) for name in grouping for type in grouping[name])
-        basequery = "select "
-        for x,c in enumerate(["bhist", "ghist", "rhist"]):
-            for i in range(0, 256):
-                if i == 0 and x == 0:
-                    basequery += "SUM(" + c + str(i) + ")"
-                else:
-                    basequery += ",SUM(" + c + str(i) + ")"
-        basequery += " from images where "
+        wide = self._columnExists("bhist0", intable)
+        if wide:
+            basequery = "select "
+            for x,c in enumerate(["bhist", "ghist", "rhist"]):
+                for i in range(0, 256):
+                    if i == 0 and x == 0:
+                        basequery += "SUM(" + c + str(i) + ")"
+                    else:
+                        basequery += ",SUM(" + c + str(i) + ")"
+            basequery += " from " + intable + " where "
         for name in grouping:
-            query = basequery + " or ".join(["imtype=?" for x in grouping[name]])
-            result = self.conn.execute(query, tuple(grouping[name]))
-            data = list(result.fetchone())
+            total = np.zeros((3, 256), dtype = np.int64)
+            if wide:
+                query = basequery + " or ".join(["imtype=?" for x in grouping[name]])
+                result = self.conn.execute(query, tuple(grouping[name]))
+                total += np.array([0 if x is None else x for x in result.fetchone()], dtype = np.int64).reshape((3, 256))
+            for id, hist in self._loadHistograms("colors", intable, grouping[name]):
+                total += hist
             for i in range(0, 3):
-                color_vector[name][i] = data[i*256:(i + 1)*256]
+                color_vector[name][i] = total[i].tolist()
         bins = {}
         for name in grouping:
             bins[name] = self._generateBins(self._splitHist(color_vector[name], chunks[name], channels[name]), name)
@@ -485,8 +877,47 @@ class Stats:
             for name in grouping:
                 with open(name + "_hist_bins.json", "w") as wh:
                     json.dump(bins[name], wh)
+        if counts:
+            writer = ih.database.DbWriter(self.db, intable, "master")
+            for name in grouping:
+                for id, cube in self._loadHistograms(ih.database.DbWriter.cube, intable, grouping[name]):
+                    writer.add(id, zip([bin["name"] for bin in bins[name]], self._cubeBinCounts(cube, bins[name])))
+                writer.flush()
+            writer.close()
         return
 
+    def _cubeBinCounts(self, cube, bins):
+        """
+        :param cube: The (colors, counts) of an image, see :py:meth:`~ih.imgproc.Image.extractColorCube`.
+        :type cube: tuple
+        :param bins: The bins to count, see :py:meth:`~ih.imgproc.Image.extractBins`.
+        :type bins: list
+        :return: The number of pixels in each bin.
+        :rtype: list
+
+        Bin ranges include both their minimum and maximum, the same as cv2.inRange.
+        The colors are sorted once, so that the colors within the first channel range
+        of a bin are a single slice, and only that slice is checked against the other
+        two channels.
+        """
+        colors, counts = cube
+        order = np.argsort(colors, kind = "mergesort")
+        colors = colors[order]
+        counts = counts[order]
+        first = colors >> 16
+        result = []
+        for bin in bins:
+            start = np.searchsorted(first, bin["min"][0], "left")
+            end = np.searchsorted(first, bin["max"][0], "right")
+            if start >= end:
+                result.append(0)
+                continue
+            second = (colors[start:end] >> 8) & 255
+            third = colors[start:end] & 255
+            inside = (second >= bin["min"][1]) & (second <= bin["max"][1]) & (third >= bin["min"][2]) & (third <= bin["max"][2])
+            result.append(int(counts[start:end][inside].sum()))
+        return result
+
 
     def _splitHist(self, hist, chunks, channels):
         returnlist = [ [1], [1], [1] ]
@@ -537,39 +968,33 @@ class Stats:
         be column names.  Id corresponds to the lemnaTec style identifier ex: '023535-S'.
         All dates are converted into Y-m-d form, you must provide a valid format in 'dateFormat',
         that way the dates can be converted correctly.  The 'metric' column is the actual value you
-        want to correlate to.
+        want to correlate to.  Every plant and image type gets one output row, which
+        takes its metadata from the plant's latest image, and every row on a date in the
+        data file is used for the correlation.
         """
         self._validate("correlation", intable, outtable, overwrite)
         lemnaData = self._loadLemnaData(dataFile, dataHeaders)
         self._createTable("correlation", intable, outtable, overwrite)
         headers = self._getHeaders(outtable)
         numeric = [h for h in headers if h not in conf.allHeaders]
-        for id in lemnaData:
-            for imtype in self._getImageTypes(intable):
-                x = {}
-                y = []
-                corr = {}
-                result = self.conn.execute("select pegasusid," + ",".join(headers + ["date"]) + " from " + intable + " where id=? and imtype=? order by date", (id,imtype))
-                if result.fetchone():
-                    for row in result:
-                        if row["date"] in lemnaData[id]:
-                            y.append(lemnaData[id][row["date"]]["metric"])
-                            for header in numeric:
-                                if header not in x:
-                                    x[header] = []
-                                try:
-                                    x[header].append(float(row[header]))
-                                except:
-                                    pass
-                    if any([x[header] for header in numeric]):
-                        for header in numeric:
-                            if len(x[header]) == len(y):
-                                corr[header] = np.corrcoef(x[header], y)[0][1]
-                            else:
-                                corr[header] = None
-                        lastid = self.conn.execute("insert into " + outtable + " (" + ",".join(headers) + ") values (" + ",".join(["?"] * len(headers)) + ")", tuple([row[header] if header in conf.allHeaders else corr[header] for header in headers])).lastrowid
-                        self.conn.execute("update " + intable + " set ref_" + outtable + "=? where id=? and imtype=?", (lastid, id, imtype))
-        self.conn.commit()
+        positions = [i for i,h in enumerate(headers) if h in numeric]
+        ids, columns, groups, index = self._loadGroups(intable, headers + ["date"], ["id", "imtype"])
+        dates = columns.pop()
+        metric = np.array([lemnaData[id][date]["metric"] if id in lemnaData and date in lemnaData[id] else np.nan for id, date in zip(columns[headers.index("id")], dates)], dtype = float)
+        matched = ~np.isnan(metric)
+        matrix = self._toMatrix([columns[i] for i in positions], convert = True)[matched]
+        # Groups are only written if at least one column has a value on a date in the data file.
+        keep = self._groupSum((~np.isnan(matrix)).astype(float), index[matched], len(groups)).any(axis = 1)
+        corr = self._fromMatrix(self._groupCorrelation(matrix, metric[matched], index[matched], len(groups))[keep])
+        # Metadata comes from the latest row of each group, the later written row on equal dates.
+        last = {}
+        for i,(group, date) in enumerate(zip(index.tolist(), dates)):
+            if group not in last or date >= dates[last[group]]:
+                last[group] = i
+        values = [[column[last[group]] for group in np.flatnonzero(keep)] for column in columns]
+        for j,i in enumerate(positions):
+            values[i] = corr[j]
+        self._insertGroups(intable, outtable, headers, values, [x for x,k in zip(self._groupIds(ids, index, len(groups)), keep) if k])
         return
 
     def anova(self, intable, outtable, grouping, overwrite = False):
@@ -586,37 +1011,49 @@ class Stats:
         different than the rest of the stats functions, in that a lot of information is
         lost after running it.  The results themselves correspond to columns (pixels, rmed, binx...)
         instead of actual images.
+
+        Only rows of intable whose imtype is in grouping are used, and each image type is analysed
+        separately.  The output table holds one row per image type and factor, in the order of grouping,
+        with the imtype column set to the image type, the factors column set to 'date', 'treatment' or
+        'date_treatment', and every numeric column set to the p value of a one way anova of that column.
+        For 'date' the levels are the dates, for 'treatment' they are Control and Stress, and for
+        'date_treatment' they are the (date, treatment) pairs.  Missing values are left out of the
+        analysis of their column only, and columns with fewer than two levels holding values are null.
         """
+        from scipy import stats
         self._validate("anova", intable, outtable, overwrite)
-        headers = self._getHeaders(intable)
-        numeric = [h for h in headers if h not in conf.allHeaders]
         self._createTable("anova", intable, outtable, overwrite)
+        grouping = grouping if isinstance(grouping, list) else [grouping]
         outHeaders = self._getHeaders(outtable)
-        result = self.conn.execute("select * from images")
-        rowdata = []
-        for row in result:
-            rowdata.append(dict(row))
-        data = pandas.DataFrame(rowdata).dropna()
-        anova = {}
-        for col in numeric:
-            anova[col] = {}
-            dateT = []
-            treatmentT = []
-            date_treatmentT = []
-            for date in self._getDates(intable):
-                dateT.append(data[data["date"] == date][col])
-                for treatment in ["Control", "Stress"]:
-                    treatmentT.append(data[data["treatment"] == treatment][col])
-                    date_treatmentT.append(data[np.where(np.logical_and(data["treatment"] == treatment,data["date"] == date), True, False)][col])
-            f_val, d_pval = stats.f_oneway(*dateT)
-            f_val, t_pval = stats.f_oneway(*treatmentT)
-            f_val, dt_pval = stats.f_oneway(*date_treatmentT)
-            anova[col]["date"] = d_pval
-            anova[col]["treatment"] = t_pval
-            anova[col]["date_treatment"] = dt_pval
-        for type in ["date", "treatment", "date_treatment"]:
-            vals = [group] + [anova[x][type] for x in numeric] + [type]
-            self.conn.execute("insert into " + outtable + " (" + ",".join(outHeaders) + ") values (" + ",".join(["?"] * len(outHeaders)) + ")", tuple(vals))
+        numeric = [h for h in outHeaders if h not in conf.allHeaders and h != "factors"]
+        keys = ["imtype", "date", "treatment"]
+        ids, columns, groups, index = self._loadGroups(intable, keys + numeric, keys, " where " + " or ".join(["imtype=?" for x in grouping]), tuple(grouping))
+        matrix = self._toMatrix(columns[len(keys):])
+        valid = ~np.isnan(matrix)
+        # The rows of every (imtype, date, treatment) group, computed once for all columns.
+        members = np.split(np.argsort(index, kind = "mergesort"), np.cumsum(np.bincount(index, minlength = len(groups)))[:-1])
+        dates = sorted(set([key[1] for key in groups]))
+        rows = []
+        for group in grouping:
+            factors = {
+                "date": [[k for k,key in enumerate(groups) if key[0] == group and key[1] == date] for date in dates],
+                "treatment": [[k for k,key in enumerate(groups) if key[0] == group and key[2] == treatment] for treatment in ["Control", "Stress"]],
+                "date_treatment": [[k] for k,key in enumerate(groups) if key[0] == group and key[2] in ["Control", "Stress"]]
+            }
+            for type in ["date", "treatment", "date_treatment"]:
+                levels = [np.concatenate([members[k] for k in level]) for level in factors[type] if level]
+                pvals = {}
+                for j,col in enumerate(numeric):
+                    # Missing values are dropped per column, and levels without values are skipped.
+                    samples = [matrix[level[valid[level, j]], j] for level in levels]
+                    samples = [x for x in samples if len(x)]
+                    pvals[col] = None
+                    if len(samples) > 1:
+                        with np.errstate(invalid = "ignore", divide = "ignore"):
+                            pval = stats.f_oneway(*samples)[1]
+                        pvals[col] = None if np.isnan(pval) else pval
+                rows.append(tuple([group if h == "imtype" else type if h == "factors" else pvals.get(h) for h in outHeaders]))
+        self.conn.executemany("insert into " + outtable + " (" + ",".join(outHeaders) + ") values (" + ",".join(["?"] * len(outHeaders)) + ")", rows)
         self.conn.commit()
         return
 
@@ -643,32 +1080,15 @@ class Stats:
         headers = self._getHeaders(outtable)
         numeric = [h for h in headers if h not in conf.allHeaders]
         meta = [h for h in headers if h not in numeric]
-        data = {}
-        result = self.conn.execute("select pegasusid,treatment," + ",".join(headers) + " from " + intable)
-        for row in result:
-            if row[comp] not in data:
-                data[row[comp]] = {}
-            if row["date"] not in data[row[comp]]:
-                data[row[comp]][row["date"]] = {"meta": dict(row), "id": [], "values": {}}
-            data[row[comp]][row["date"]]["id"].append(row["pegasusid"])
-            if row["treatment"] not in data[row[comp]][row["date"]]["values"]:
-                data[row[comp]][row["date"]]["values"][row["treatment"]] = [[row[h]] for h in numeric]
-            else:
-                for i,h in enumerate(numeric):
-                    data[row[comp]][row["date"]]["values"][row["treatment"]][i].append(row[h])
-        for comp in data:
-            for date in data[comp]:
-                vals = [data[comp][date]["meta"][x] for x in meta]
-                for a,b in zip(data[comp][date]["values"]["Control"], data[comp][date]["values"]["Stress"]):
-                    try:
-                        res = stats.ttest_ind(a, b)[1]
-                    except:
-                        res = None
-                    vals += [res]
-                lastid = self.conn.execute("insert into " + outtable + " (" + ",".join(headers) + ") values (" + ",".join(["?"] * len(headers)) + ")", vals).lastrowid
-                updateVals = (lastid,) + tuple(data[comp][date]["id"])
-                self.conn.execute("update " + intable + " set ref_" + outtable + "=? where id in (" + ",".join(["?"] * len(data[comp][date]["id"])) + ")", updateVals)
-        self.conn.commit()
+        ids, columns, groups, index = self._loadGroups(intable, headers + ["treatment"], [comp, "date"])
+        treatment = np.array(columns.pop(), dtype = object)
+        first = self._groupFirst(index, len(groups))
+        values = [[column[i] for i in first] for column in columns]
+        positions = [i for i,h in enumerate(headers) if h in numeric]
+        pvals = self._fromMatrix(self._groupTTest(self._toMatrix([columns[i] for i in positions]), index, len(groups), treatment == "Control", treatment == "Stress"))
+        for j,i in enumerate(positions):
+            values[i] = pvals[j]
+        self._insertGroups(intable, outtable, headers, values, self._groupIds(ids, index, len(groups)))
         return
 
     def treatmentComp(self, intable, outtable, type = "ratio", direction = "Control", comp = "imtype", overwrite = False):
@@ -688,7 +1108,9 @@ class Stats:
         except for treatment, and computes either a ratio or difference between them.  Direction
         is specified as the column you want first, so direction = "Control" will compute C ~ S, and
         direction = "Stress" will compute S ~ C.  If you have already normalized your table, difference
-        will provide better information than ratio.
+        will provide better information than ratio.  One row is written per genotype, comparison and date,
+        with the metadata of the group's first row, and every input row references the row of its own group.
+        Groups missing a treatment are written with null values.
         """
         t1 = "Stress" if direction == "Stress" else "Control"
         t2 = "Stress" if direction == "Control" else "Control"
@@ -702,33 +1124,23 @@ class Stats:
         headers = self._getHeaders(outtable)
         numeric = [h for h in headers if h not in conf.allHeaders]
         meta = [h for h in headers if h not in numeric]
-        data = {}
-        result = self.conn.execute("select pegasusid," + ",".join(headers) + " from " + intable)
-        for row in result:
-            if row["genotype"] not in data:
-                data[row["genotype"]] = {"id": [], "values": {}, "meta": {}}
-            data[row["genotype"]]["meta"][row[comp]] = dict(row)
-            data[row["genotype"]]["id"].append(row["pegasusid"])
-            if row[comp] not in data[row["genotype"]]["values"]:
-                data[row["genotype"]]["values"][row[comp]] = {}
-            if row["date"] not in data[row["genotype"]]["values"][row[comp]]:
-                data[row["genotype"]]["values"][row[comp]][row["date"]] = {}
-            if row["treatment"] not in data[row["genotype"]]["values"][row[comp]][row["date"]]:
-                data[row["genotype"]]["values"][row[comp]][row["date"]][row["treatment"]] = [row[h] for h in numeric]
-        for genotype in data:
-            for comp in data[genotype]["values"]:
-                for date in data[genotype]["values"][comp]:
-                    vals = [data[genotype]["meta"][comp][x] for x in meta]
-                    for a,b in zip(data[genotype]["values"][comp][date][t1], data[genotype]["values"][comp][date][t2]):
-                        try:
-                            res = op(float(a), float(b))
-                        except:
-                            res = None
-                        vals.append(res)
-                    lastid = self.conn.execute("insert into " + outtable + " (" + ",".join(headers) + ") values (" + ",".join(["?"] * len(headers)) + ")", vals).lastrowid
-                    updateVals = (lastid,) + tuple(data[genotype]["id"])
-                    self.conn.execute("update " + intable + " set ref_" + outtable + "=? where id in (" + ",".join(["?"] * len(data[genotype]["id"])) + ")", updateVals)
-        self.conn.commit()
+        ids, columns, groups, index = self._loadGroups(intable, headers + ["treatment"], ["genotype", comp, "date"])
+        treatment = np.array(columns.pop(), dtype = object)
+        first = self._groupFirst(index, len(groups))
+        values = [[column[i] for i in first] for column in columns]
+        positions = [i for i,h in enumerate(headers) if h in numeric]
+        matrix = self._toMatrix([columns[i] for i in positions], convert = True)
+        # The first row of each treatment is compared, groups missing a treatment are null.
+        rows = [self._groupFirst(np.where(treatment == t, index, len(groups)), len(groups) + 1)[:-1] for t in [t1, t2]]
+        left, right = [np.where((x >= 0)[:, np.newaxis], matrix[x], np.nan) for x in rows]
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            result = op(left, right)
+        if type == "ratio":
+            result[right == 0] = np.nan
+        result = self._fromMatrix(result)
+        for j,i in enumerate(positions):
+            values[i] = result[j]
+        self._insertGroups(intable, outtable, headers, values, self._groupIds(ids, index, len(groups)))
         return
 
     def threshold(self, intable, outtable, thresh = 0.01, overwrite = False):
@@ -747,27 +1159,17 @@ class Stats:
         self._validate("threshold", intable, outtable, overwrite)
         self._createTable("threshold", intable, outtable, overwrite)
         headers = self._getHeaders(outtable)
-        numeric = [h for h in headers if h not in conf.allHeaders]
-        result = self.conn.execute("select pegasusid," + ",".join(headers) + " from " + intable)
-        for row in result:
-            vals = []
-            for x in headers:
-                if x in conf.allHeaders:
-                    vals.append(row[x])
-                else:
-                    if not self._checkNull(row[x]):
-                        if float(row[x]) > thresh:
-                            vals.append(row[x])
-                        else:
-                            vals.append(None)
-                    else:
-                        vals.append(None)
-            lastid = self.conn.execute("insert into " + outtable + " (" + ",".join(headers) + ") values (" + ",".join(["?"] * len(headers)) + ")", tuple(vals)).lastrowid
-            self.conn.execute("update " + intable + " set ref_" + outtable + "=? where pegasusid=?", (lastid, row["pegasusid"]))
-        self.conn.commit()
+        def kernel(values, prepared):
+            with np.errstate(invalid = "ignore"):
+                keep = self._toFloat(values) > thresh
+            result = np.empty(len(values), dtype = object)
+            result[:] = values
+            result[~keep] = None
+            return result.tolist()
+        self._applyKernel(intable, outtable, headers, kernel)
         return
 
-    def export(self, table, processed = True, group = None, fname = None):
+    def export(self, table, processed = True, group = None, fname = None, histograms = False):
         """
         :param table: The table to write to csv
         :type table: str
@@ -777,14 +1179,19 @@ class Stats:
         :type group: list
         :param fname: The file name to write to.
         :type fname: str
+        :param histograms: Whether or not to expand packed histograms into wide columns.
+        :type histograms: bool
 
         This function simply extracts data from a database and writes it to csv format.
         Default functionality is to extract only data that has been processed.  This is
         checked by finding if an outputPath has been set.  Additionally,
         you can specify a list of image types to extract, if not, the default list contains
         all rgb and fluo images.  Finally, if no file name is specified, the name
-        of the table is used as the filename.
+        of the table is used as the filename.  Histograms stored in the histograms table
+        are only written if histograms is set, with one column per value, named the same
+        as unpacked histograms (bhist0 ... rhist255, b0 ... r255).
         """
+        import pandas
         group = group if isinstance(group, list) else self._getImageTypes(table)
         fname = fname if fname else table + ".csv"
         query = "select * from " + table
@@ -798,5 +1205,7 @@ class Stats:
             query += " where " + " or ".join(["imtype=?" for x in group])
             values = tuple([x for x in group])
         table = pandas.io.sql.read_sql(sql = query, params = values, con = self.conn)
+        if histograms:
+            table = self._expandHistograms(table)
         table.to_csv(fname)
         return
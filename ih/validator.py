@@ -16,6 +16,7 @@ along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
 import conf
+import ih.database
 import sys
 import json
 import re
@@ -45,8 +46,7 @@ class Validator(object):
                     except Exception as e:
                         self.err += "Json Error: File '%s', %s\n" % (f, str(e))
             elif type == "db":
-                self.conn = sqlite3.connect(f)
-                self.conn.row_factory = sqlite3.Row
+                self.conn = ih.database.connect(f, "master")
                 try:
                     result = self.conn.execute("select * from images")
                     if not result.fetchone():
@@ -271,6 +271,14 @@ class Workflow(object):
                 for key in self.config.data:
                     if key not in conf.templateKeys["config"]["required"] and key not in conf.templateKeys["config"]["optional"]:
                         self.err += "Config, Key Error: Invalid key '%s' specified.  Allowed keys are '%s'. \n" % (key, conf.templateKeys["config"]["required"] + conf.templateKeys["config"]["optional"])
+                if "aggregate" in self.config.data:
+                    if not isinstance(self.config.data["aggregate"], int) or self.config.data["aggregate"] < 2:
+                        self.err += "Config, Value Error: 'aggregate' must be an integer of at least 2, given '%s'. \n" % (self.config.data["aggregate"],)
+                if "worker" in self.config.data:
+                    if not isinstance(self.config.data["worker"], bool):
+                        self.err += "Config, Value Error: 'worker' must be true or false, given '%s'. \n" % (self.config.data["worker"],)
+                    elif self.config.data["worker"] and "cluster" not in self.config.data:
+                        self.err += "Config, Key Error: 'worker' requires 'cluster' to be specified. \n"
                 if "maxwalltime" in self.config.data:
                     for key in self.config.data["maxwalltime"]:
                         if key not in conf.templateKeys["config"]["maxwalltime"]["optional"]:
@@ -0,0 +1,351 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import runpy
+import signal
+import traceback
+import tempfile
+import subprocess
+import StringIO
+
+"""
+Environment variable holding the socket of the worker.  Scripts only
+forward their arguments when it is set.  A socket name that isn't an
+absolute path is placed in a private directory under the node's
+temporary directory, see :py:meth:`~ih.worker.socketPath`.
+"""
+variable = "IH_WORKER"
+
+"""
+Seconds an idle worker waits for a request before exiting.
+"""
+idle = 60
+
+"""
+Seconds a client waits for a worker it started to accept connections.
+"""
+startup = 30
+
+"""
+Whether this process is a worker, in which case scripts run in-process.
+"""
+serving = False
+
+def forward():
+    """
+    Runs the calling script in a worker instead of the current process.
+    Called by :py:meth:`~ih.commands.main` before the command imports anything.  If
+    the IH_WORKER environment variable is not set, or no worker can be
+    reached or started, this returns and the script runs as usual.
+    Otherwise the script's output is printed and the process exits with
+    the script's status, so the remaining imports never happen.  Once the
+    request is sent the script may have run, so a worker that doesn't
+    answer properly fails the script instead of running it again.
+    """
+    if serving or not os.environ.get(variable):
+        return
+    try:
+        path = socketPath(os.environ[variable])
+    except OSError:
+        return
+    script = os.path.abspath(sys.argv[0])
+    sock = _connect(path)
+    if not sock and not os.path.exists(path):
+        _spawn(path, os.path.join(os.path.dirname(script), "ih-worker"))
+        sock = _connect(path, startup)
+    if not sock:
+        return
+    try:
+        result = request(sock, [script] + sys.argv[1:], os.getcwd())
+        status, stdout, stderr = int(result["status"]), result["stdout"], result["stderr"]
+    except (socket.error, ValueError, KeyError, TypeError) as e:
+        sys.stderr.write("Worker at '%s' did not return a result: %s\n" % (path, e))
+        sys.stderr.flush()
+        os._exit(1)
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(status)
+
+def socketPath(name):
+    """
+    :param name: The socket name or path.
+    :type name: str
+    :return: The absolute path of the socket.
+    :rtype: str
+
+    Absolute paths are used as given.  Other names are placed in a directory
+    under the node's temporary directory that only the current user can access,
+    so workers are local to the node and can't be used by other users.
+    """
+    if os.path.isabs(name):
+        return name
+    folder = os.path.join(tempfile.gettempdir(), "ih-worker-" + str(os.getuid()))
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder, 0700)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+    return os.path.join(folder, name)
+
+def request(sock, argv, cwd):
+    """
+    :param sock: A socket connected to a worker.
+    :type sock: socket.socket
+    :param argv: The argument vector to run, starting with the script.
+    :type argv: list
+    :param cwd: The directory to run the script in.
+    :type cwd: str
+    :return: The result, with keys 'status', 'stdout' and 'stderr'.
+    :rtype: dict
+
+    Sends a single request to a worker and waits for its result.
+    """
+    handle = sock.makefile("rw")
+    handle.write(json.dumps({"argv": argv, "cwd": cwd}) + "\n")
+    handle.flush()
+    line = handle.readline()
+    handle.close()
+    sock.close()
+    return json.loads(line)
+
+def run(argv, cwd = None):
+    """
+    :param argv: The argument vector to run, starting with the script.
+    :type argv: list
+    :param cwd: The directory to run the script in.
+    :type cwd: str
+    :return: The result, with keys 'status', 'stdout' and 'stderr'.
+    :rtype: dict
+
+    Runs an ih-* script in this process exactly as it would run from the
+    command line, and captures its output.  Modules the script imports stay
+    loaded for the next request.  Database connections the script leaves
+    open are closed afterwards, so the next request sees the files on disk.
+    The image processing caches the script filled are cleared as well, and
+    the working directory and streams are always restored, so the next
+    request starts like a new process.
+    """
+    global serving
+    serving = True
+    script = resolve(argv[0])
+    if not script:
+        return {"status": 127, "stdout": "", "stderr": "Script '%s' not found.\n" % (argv[0],)}
+    home = os.getcwd()
+    saved = (sys.argv, sys.stdout, sys.stderr)
+    opened = set(sys.modules["ih.database"].connections.keys()) if "ih.database" in sys.modules else set()
+    sys.argv = [script] + list(argv[1:])
+    sys.stdout = StringIO.StringIO()
+    sys.stderr = StringIO.StringIO()
+    status = 0
+    try:
+        if cwd:
+            os.chdir(cwd)
+        runpy.run_path(script, run_name = "__main__")
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            sys.stderr.write(str(e.code) + "\n")
+            status = 1
+    except:
+        sys.stderr.write(traceback.format_exc())
+        status = 1
+    finally:
+        result = {"status": status, "stdout": sys.stdout.getvalue(), "stderr": sys.stderr.getvalue()}
+        sys.argv, sys.stdout, sys.stderr = saved
+        if "ih.database" in sys.modules:
+            database = sys.modules["ih.database"]
+            for key in database.connections.keys():
+                if key not in opened and key in database.connections:
+                    conn = database.connections.pop(key)[0]
+                    conn.commit()
+                    conn.close()
+        if "ih.imgproc" in sys.modules:
+            imgproc = sys.modules["ih.imgproc"]
+            imgproc.ColorFilter.compiled.clear()
+            imgproc.Image.knnModels.clear()
+            imgproc.Image.kmeansCenters.clear()
+        os.chdir(home)
+    return result
+
+def resolve(name):
+    """
+    :param name: The name or path of a script.
+    :type name: str
+    :return: The absolute path to the script, or None if it can't be found.
+    :rtype: str
+
+    Scripts are looked up as given, then next to the worker script, then on the PATH.
+    """
+    if os.path.isfile(name):
+        return os.path.abspath(name)
+    for folder in [os.path.dirname(os.path.abspath(sys.argv[0]))] + os.environ.get("PATH", "").split(os.pathsep):
+        if os.path.isfile(os.path.join(folder, name)):
+            return os.path.join(folder, name)
+    return None
+
+def serve(path, timeout = idle):
+    """
+    :param path: The socket path to listen on.
+    :type path: str
+    :param timeout: Seconds to wait for a request before exiting.
+    :type timeout: int
+
+    Listens on a unix socket and runs each request in turn.  Each request is a
+    single line of json with the keys 'argv' and 'cwd', and is answered with
+    a single line of json holding the result of :py:meth:`~ih.worker.run`.
+    An invalid request is answered with status 2 and logged to stderr.
+    If the path already exists this returns immediately.  The socket is
+    removed on exit, including when the worker is terminated, unless it has
+    been replaced by another one.
+    """
+    path = socketPath(path)
+    server = _bind(path)
+    if not server:
+        return
+    created = os.stat(path).st_ino
+    def terminate(signum, frame):
+        _remove(path, created)
+        os._exit(128 + signum)
+    signal.signal(signal.SIGTERM, terminate)
+    server.settimeout(timeout)
+    try:
+        while True:
+            try:
+                sock, address = server.accept()
+            except socket.timeout:
+                break
+            sock.settimeout(None)
+            handle = sock.makefile("rw")
+            try:
+                line = handle.readline()
+                try:
+                    job = json.loads(line)
+                    result = run(job["argv"], job.get("cwd"))
+                except (ValueError, KeyError, IndexError, TypeError):
+                    result = _invalid(line)
+                handle.write(json.dumps(result) + "\n")
+                handle.flush()
+            except socket.error as e:
+                _log("Could not answer a request: %s" % (e,))
+            handle.close()
+            sock.close()
+    finally:
+        server.close()
+        _remove(path, created)
+    return
+
+def serveStream(instream, outstream):
+    """
+    :param instream: The stream to read requests from.
+    :type instream: file
+    :param outstream: The stream to write results to.
+    :type outstream: file
+
+    Runs one request per line until the input ends.  A line is either a json
+    list holding the argument vector, or a json object as in :py:meth:`~ih.worker.serve`.
+    Each result is written as a single line of json.
+    """
+    for line in iter(instream.readline, ""):
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            result = run(job) if isinstance(job, list) else run(job["argv"], job.get("cwd"))
+        except (ValueError, KeyError, IndexError, TypeError):
+            result = _invalid(line)
+        outstream.write(json.dumps(result) + "\n")
+        outstream.flush()
+    return
+
+def _invalid(line):
+    """
+    Logs a request that couldn't be read, and returns the result to answer it with.
+    """
+    _log("Invalid request '%s'." % (line.strip(),))
+    return {"status": 2, "stdout": "", "stderr": "Invalid request '%s'.\n" % (line.strip(),)}
+
+def _log(message):
+    """
+    Writes a message to the worker's stderr.
+    """
+    sys.stderr.write(message + "\n")
+    sys.stderr.flush()
+    return
+
+def _connect(path, wait = 0):
+    """
+    Connects to the worker at path, retrying for up to wait seconds.
+    Returns None if no worker answers.
+    """
+    end = time.time() + wait
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return sock
+        except socket.error:
+            sock.close()
+        if time.time() >= end:
+            return None
+        time.sleep(0.05)
+
+def _bind(path):
+    """
+    Binds a listening socket at path.  Returns None if the path already
+    exists, since a file the worker didn't create is never removed.
+    """
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+    except socket.error:
+        server.close()
+        return None
+    server.listen(5)
+    return server
+
+def _remove(path, inode):
+    """
+    Removes the socket at path if it is still the one with the given inode,
+    the socket this worker created.
+    """
+    try:
+        if os.stat(path).st_ino == inode:
+            os.remove(path)
+    except OSError:
+        pass
+    return
+
+def _spawn(path, exe):
+    """
+    Starts a detached worker listening on path.  The worker doesn't keep
+    any of the client's streams open, so the job isn't held up waiting on it.
+    """
+    if not os.path.isfile(exe):
+        return
+    with open(os.devnull, "r+") as null:
+        subprocess.Popen([sys.executable, exe, "--socket", path], stdin = null, stdout = null, stderr = null, close_fds = True, preexec_fn = os.setsid)
+    return
@@ -27,8 +27,13 @@ import shutil
 import errno
 import textwrap
 import copy
+import hashlib
 import ih.validator
+import ih.database
+import ih.cache
 import getpass
+import traceback
+import multiprocessing
 import xml.dom.minidom
 from Pegasus.DAX3 import *
 
@@ -161,6 +166,9 @@ class Workflow(object):
                 self.jobs[dax][jobname].profile(Namespace.PEGASUS, "label", label)
             if walltime:
                 self.jobs[dax][jobname].profile(Namespace.GLOBUS, "maxwalltime", walltime)
+            if label and self.config.get("worker"):
+                # One worker per cluster, named after the workflow so that workflows sharing a node don't share workers.
+                self.jobs[dax][jobname].profile(Namespace.ENV, "IH_WORKER", hashlib.sha1(self.basepath).hexdigest()[:10] + "_" + label + ".sock")
         return
 
     def create(self):
@@ -617,7 +625,11 @@ class ImageProcessor(Workflow):
     def _createDax(self, loc):
         """
             Loads all jobs into the dax, and then writes the dax
-            to input/workflow.dax
+            to input/workflow.dax.  If the 'cache' option is specified,
+            jobs whose results are in the step cache are left out, and their
+            cached outputs are used as input files instead.  The outputs of the
+            remaining cacheable jobs are transferred to the output folder, and
+            are added to the cache by the next run.
         """
         exDep = {}
         exInput = {}
@@ -634,6 +646,7 @@ class ImageProcessor(Workflow):
             maxwalltime = None
 
         save = True if "save-steps" in self.workflow["options"] else False
+        self.cache = ih.cache.StepCache(self.jobhome + "/" + conf.cacheDir) if "cache" in self.workflow["options"] else None
         for type in self.workflow["workflows"]:
             exDep[type] = [[]]
             exInput[type] = [{}]
@@ -659,12 +672,11 @@ class ImageProcessor(Workflow):
                 extension = "." + infile.split(".")[1]
                 realname = self.files[self.dax][type]["input"][infile]["path"].split("/")[-1].split(".")[0]
                 derivedPath = self.files[self.dax][type]["input"][infile]["derivedPath"]
+                if self.cache:
+                    keys, cached, run = self.cache.plan(self.workflow["workflows"][type], self.files[self.dax][type]["input"][infile]["path"], self.workflow["extract"]["workflows"][type]["inputs"], save)
                 for stepnum,job in enumerate(self.workflow["workflows"][type]):
                     jobname = derivedPath + "_" + job["name"]
-                    inputs = self._loadJobInputs(job, type, derivedPath, extension)
                     if job["name"] in exNames:
-                        outputs = self._loadJobOutputs(job, type, derivedPath, True)
-                        exDep[type][excluster[type]].append(jobname)
                         reqFile = derivedPath + "_" + self.workflow["extract"]["workflows"][type]["inputs"][0] + ".png"
                         exInput[type][excluster[type]][reqFile] = {"file": reqFile, "transfer": save}
                         if "--dimfromroi" in self.workflow["extract"]["workflows"][type]["arguments"]:
@@ -673,9 +685,22 @@ class ImageProcessor(Workflow):
                             else:
                                 roiFile = derivedPath + "_" + self.workflow["extract"]["workflows"][type]["arguments"]["--dimfromroi"] + ".json"
                             exInput[type][excluster[type]][roiFile] = {"file": roiFile, "transfer": save}
+                    if self.cache and job["name"] not in run:
+                        if job["name"] in cached:
+                            self._addCached(job, type, derivedPath, cached[job["name"]], save or job["name"] in exNames)
+                        continue
+                    inputs = self._loadJobInputs(job, type, derivedPath, extension)
+                    if job["name"] in exNames:
+                        outputs = self._loadJobOutputs(job, type, derivedPath, True)
+                        exDep[type][excluster[type]].append(jobname)
                     else:
-                        outputs = self._loadJobOutputs(job, type, derivedPath, save)
+                        outputs = self._loadJobOutputs(job, type, derivedPath, save or bool(self.cache and self.cache.cacheable(job)))
                     depends = [derivedPath + "_" + depend for depend in job["depends"]] if "depends" in job else []
+                    if self.cache:
+                        depends = [depend for depend in depends if self._isJob(depend, self.dax)]
+                        if self.cache.cacheable(job):
+                            for i,output in enumerate(job["outputs"]):
+                                self.cache.expect(keys[job["name"]], i, self.basepath + "/output/" + outputs[output]["file"])
                     if job["executable"] == "ih-meanshift":
                         self._addJob(jobname, job["executable"], inputs, outputs, job["arguments"], depends, label = type + "_step" + str(stepnum) + "_cluster" + str(meancluster[type]) if "cluster" in self.config else None, walltime = maxwalltime)
                     else:
@@ -683,9 +708,7 @@ class ImageProcessor(Workflow):
 
 
         maprc = open(self.basepath + "/" + loc + "/map.rc", "a")
-        binDep = []
-        aggIn = {}
-        aggIn2 = {}
+        shards = []
         for type in self.workflow["workflows"]:
             for q in range(0, excluster[type] + 1):
                 arguments = self.workflow["extract"]["workflows"][type]["arguments"]
@@ -697,58 +720,85 @@ class ImageProcessor(Workflow):
                 if "histogram-bin" in self.workflow["extract"]:
                     if type in [imtype for key in self.workflow["extract"]["histogram-bin"]["--group"] for imtype in self.workflow["extract"]["histogram-bin"]["--group"][key]]:
                         arguments["--colors"] = ""
+                        arguments["--colors3d"] = ""
                 arguments["--db"] = "db"
                 arguments["--createdb"] = ""
                 arguments["--inputs"] = " ".join([x for x in exInput[type][q].keys() if ".png" in x])
                 self._addFile(type + str(q) + ".db", type, "output")
-                self._addFile(type + str(q) + "_2.db", type, "output")
                 self._addJob(type + "_extract" + str(q), "ih-extract-multi", exInput[type][q], {"db": {"file": type + str(q) + ".db", "transfer": False}}, arguments, exDep[type][q], walltime = 180)
                 self._addJob(type + "_extract" + str(q), "ih-extract-multi", exInput[type][q], {"db": {"file": type + str(q) + ".db", "transfer": False}}, arguments, [], dax = self.exdax, walltime = 180)
                 maprc.write(type + str(q) + ".db" + " file://" + self.basepath + "/output/" + type + str(q) + ".db" + " pool=\"local\"\n")
-                binDep.append(type + "_extract" + str(q))
-                aggIn[type + str(q) + ".db"] = {"file": type + str(q) + ".db", "transfer": False}
-                aggIn2[type + str(q) + "_2.db"] = {"file": type + str(q) + "_2.db", "transfer": False}
-        aggIn["db"] = {"file": "img.db", "transfer": False}
-        self._addJob("sql_aggregate1", "ih-sql-aggregate", aggIn, {"img2.db": {"file": "img2.db", "transfer": False if "histogram-bin" in self.workflow["extract"] else True}}, {"--db": "db", "--output": "img2.db", "--inputs": " ".join([aggIn[x]["file"] for x in aggIn if x != "db"])}, binDep, walltime = 180)
-        self._addJob("sql_aggregate1", "ih-sql-aggregate", aggIn, {"img2.db": {"file": "img2.db", "transfer": False if "histogram-bin" in self.workflow["extract"] else True}}, {"--db": "db", "--output": "img2.db", "--inputs": " ".join([aggIn[x]["file"] for x in aggIn if x != "db"])}, binDep, dax = self.exdax, walltime = 180)
+                shards.append((type + str(q) + ".db", type + "_extract" + str(q)))
+        self._addAggregate("sql_aggregate1", shards, "img.db", "img2.db", False if "histogram-bin" in self.workflow["extract"] else True)
 
         if "histogram-bin" in self.workflow["extract"]:
-            outputs = {}
+            # Bin counts are computed from the 3-D color histograms stored during extraction, so images are only read once.
+            outputs = {"output": {"file": "img3.db", "transfer": True}}
             for name in self.workflow["extract"]["histogram-bin"]["--group"]:
                 self._addFile(name + "_hist_bins.json", "raw", "output")
                 maprc.write(name + "_hist_bins.json" + " file://" + self.basepath + "/output/" + name + "_hist_bins.json" + " pool=\"local\"\n")
                 outputs[name + "_hist_bins.json"] = {"file": name + "_hist_bins.json", "transfer": True}
-            self._addJob("bin_creation", "ih-stats-histogram-bin", {"db": {"file": "img2.db", "transfer": True}, "extract.json": {"file": "extract.json", "transfer": False}}, outputs, {"--db": "db", "--options": "extract.json", "--intable": "images", "--outtable": "histogramBins", "--jsonwrite": "", "--overwrite": ""}, ["sql_aggregate1"])
-            self._addJob("bin_creation", "ih-stats-histogram-bin", {"db": {"file": "img2.db", "transfer": True}, "extract.json": {"file": "extract.json", "transfer": False}}, outputs, {"--db": "db", "--options": "extract.json", "--intable": "images", "--outtable": "histogramBins", "--jsonwrite": "", "--overwrite": ""}, ["sql_aggregate1"], dax = self.exdax)
-
-            binDep = []
-            map = {}
+            for dax in [self.dax, self.exdax]:
+                self._addJob("bin_creation", "ih-stats-histogram-bin", {"db": {"file": "img2.db", "transfer": True}, "extract.json": {"file": "extract.json", "transfer": False}}, outputs, {"--db": "db", "--output": "output", "--options": "extract.json", "--intable": "images", "--outtable": "histogramBins", "--jsonwrite": "", "--overwrite": "", "--counts": ""}, ["sql_aggregate1"], dax = dax)
 
-            for group in self.workflow["extract"]["histogram-bin"]["--group"]:
-                for type in self.workflow["extract"]["histogram-bin"]["--group"][group]:
-                    map[type] = group
-
-            for type in self.workflow["workflows"]:
-                for q in range(0, excluster[type] + 1):
-                    arguments = {}
-                    arguments["--db"] = "db"
-                    arguments["--copydb"] = "copydb"
-                    arguments["--inputs"] = " ".join(exInput[type][q].keys())
-                    exInput[type][q]["db"] = {"file": type + str(q) + ".db", "transfer": False}
-                    exInput[type][q]["binfile"] = {"file": map[type] + "_hist_bins.json", "transfer": False}
-                    arguments["--bins"] = "binfile"
-                    self._addJob(type + "_extractBins" + str(q), "ih-extract-multi", exInput[type][q], {"copydb": {"file": type + str(q) + "_2.db", "transfer": False}}, arguments, ["bin_creation"], walltime = 300)
-                    self._addJob(type + "_extractBins" + str(q), "ih-extract-multi", exInput[type][q], {"copydb": {"file": type + str(q) + "_2.db", "transfer": False}}, arguments, ["bin_creation"], dax = self.exdax, walltime = 300)
-                    binDep.append(type + "_extractBins" + str(q))
-            aggIn2["db"] = {"file": "img2.db", "transfer": False}
-            self._addJob("sql_aggregate2", "ih-sql-aggregate", aggIn2, {"img3.db": {"file": "img3.db", "transfer": True}}, {"--db": "db", "--output": "img3.db", "--inputs": " ".join([aggIn2[x]["file"] for x in aggIn2 if x != "db"])}, binDep, walltime = 180)
-            self._addJob("sql_aggregate2", "ih-sql-aggregate", aggIn2, {"img3.db": {"file": "img3.db", "transfer": True}}, {"--db": "db", "--output": "img3.db", "--inputs": " ".join([aggIn2[x]["file"] for x in aggIn2 if x != "db"])}, binDep, dax = self.exdax, walltime = 180)
-
-        z = 2 if "histogram-bin" in self.workflow["extract"] else 1
+        last = "bin_creation" if "histogram-bin" in self.workflow["extract"] else "sql_aggregate1"
         indb = "img3.db" if "histogram-bin" in self.workflow["extract"] else "img.db"
-        self._addJob("error-log", "ih-error-log", {"db": {"file": indb, "transfer": True}}, {"output": {"file": "img.log", "transfer": True}}, {"--db": "db", "--output": "output"}, ["sql_aggregate" + str(z)])
+        self._addJob("error-log", "ih-error-log", {"db": {"file": indb, "transfer": True}}, {"output": {"file": "img.log", "transfer": True}}, {"--db": "db", "--output": "output"}, [last])
         with open(self.basepath + "/" + loc + "/workflow.dax", "w") as wh:
             self.dax.writeXML(wh)
+        if self.cache:
+            self.cache.close()
+        return
+
+    def _addCached(self, job, type, basename, paths, transfer):
+        """
+            Adds the cached outputs of a skipped job to the dax as input files.
+            Outputs that would have been transferred are linked into the output
+            folder, the same as if the job had run.
+        """
+        outputs = self._loadJobOutputs(job, type, basename, transfer)
+        for i,output in enumerate(job["outputs"]):
+            path = paths[i]
+            if transfer:
+                path = self.basepath + "/output/" + outputs[output]["file"]
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                try:
+                    os.link(paths[i], path)
+                except OSError:
+                    shutil.copyfile(paths[i], path)
+            self._addFile(outputs[output]["file"], type, "input", path)
+        return
+
+    def _addAggregate(self, jobname, shards, db, output, transfer):
+        """
+            Adds the jobs that merge shards, a list of (file, job) pairs, into db
+            and write the result to output.  By default a single job merges every shard.
+            If 'aggregate' is defined in the config, shards are first merged by a tree of
+            jobs that each combine at most 'aggregate' databases, so that merging is spread
+            across the pool and the final job only merges 'aggregate' databases.
+        """
+        level = 0
+        while "aggregate" in self.config and len(shards) > self.config["aggregate"]:
+            merged = []
+            for i,pos in enumerate(xrange(0, len(shards), self.config["aggregate"])):
+                group = shards[pos:pos + self.config["aggregate"]]
+                if len(group) == 1:
+                    merged.append(group[0])
+                else:
+                    name = jobname + "_" + str(level) + "_" + str(i)
+                    self._addFile(name + ".db", "raw", "output")
+                    inputs = dict((f, {"file": f, "transfer": False}) for f, job in group)
+                    arguments = {"--db": group[0][0], "--output": "output", "--inputs": " ".join([f for f, job in group[1:]]), "--append": ""}
+                    for dax in [self.dax, self.exdax]:
+                        self._addJob(name, "ih-sql-aggregate", inputs, {"output": {"file": name + ".db", "transfer": False}}, arguments, [job for f, job in group], dax = dax, walltime = 180)
+                    merged.append((name + ".db", name))
+            shards = merged
+            level += 1
+        inputs = dict((f, {"file": f, "transfer": False}) for f, job in shards)
+        inputs["db"] = {"file": db, "transfer": False}
+        for dax in [self.dax, self.exdax]:
+            self._addJob(jobname, "ih-sql-aggregate", inputs, {output: {"file": output, "transfer": transfer}}, {"--db": "db", "--output": output, "--inputs": " ".join([f for f, job in shards])}, [job for f, job in shards], dax = dax, walltime = 180)
         return
 
     def _createExtract(self, loc):
@@ -913,6 +963,130 @@ class ImageProcessor(Workflow):
         self._createSubmit(loc)
         return
 
+    def runLocal(self, processes = 1, chunk = None):
+        """
+            :param processes: The number of worker processes to use.
+            :type processes: int
+            :param chunk: The number of images per chunk.
+            :type chunk: int
+
+            Runs the full image processing workflow on the current machine instead of
+            writing a pegasus submission.  Images of each type are split into chunks, and
+            chunks are processed by a pool of worker processes.  If chunk isn't given, each
+            type is split into about four chunks per process, so that processes finishing early
+            can pick up more work, with at most conf.localChunk images per chunk.  All steps for
+            a single image are run with :py:class:`~ih.imgproc.Chain`, so intermediate
+            images stay in memory unless 'save-steps' is specified.  Extraction,
+            aggregation and histogram binning then write the same img2.db, img3.db,
+            and imgproc.log outputs as the pegasus workflow.  If the 'cache' option
+            is specified, steps whose results are in the step cache are skipped.
+            Images that fail have their error and traceback written to the error column, and are
+            listed in imgproc.log.  Returns the number of images that failed.
+        """
+        import ih.statistics
+        print "Running workflow locally.  Please wait."
+        self._createSetup()
+        self._copyFiles()
+        outputdir = self.basepath + "/output"
+        save = True if "save-steps" in self.workflow["options"] else False
+        cache = self.jobhome + "/" + conf.cacheDir if "cache" in self.workflow["options"] else None
+        extract = self.workflow["extract"]
+        map = dict((type, group) for group in extract["histogram-bin"]["--group"] for type in extract["histogram-bin"]["--group"][group]) if "histogram-bin" in extract else {}
+        tasks = []
+        for type in self.workflow["workflows"]:
+            typeExtract = copy.deepcopy(extract["workflows"][type])
+            if type in map:
+                typeExtract["arguments"]["--colors"] = ""
+                typeExtract["arguments"]["--colors3d"] = ""
+            rows = []
+            for row in self.metadata.execute("select pegasusid, experiment, id, date, imgname, path from images where imtype=?", (type,)):
+                derivedPath = row["experiment"].replace(" ","") + "/" + row["id"].replace(" ","") + "/" + row["date"].replace(" ","") + "/" + type + "/" + row["imgname"].replace(" ","") + "/"
+                rows.append({"pegasusid": row["pegasusid"], "path": row["path"], "derivedPath": derivedPath})
+            size = chunk if chunk else max(1, min(conf.localChunk, -(-len(rows) // (4 * processes))))
+            for q,pos in enumerate(xrange(0, len(rows), size)):
+                tasks.append((rows[pos:pos + size], self.workflow["workflows"][type], typeExtract, outputdir, save, outputdir + "/" + type + str(q) + ".db", cache))
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_localShard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        shards = [db for db, failures in results]
+        failures = sum([failures for db, failures in results])
+
+        final = outputdir + "/img2.db"
+        shutil.copyfile(outputdir + "/output.db", final)
+        stats = ih.statistics.Stats(final)
+        stats.loadSql(shards)
+        stats._closeConnection()
+
+        if "histogram-bin" in extract:
+            shutil.copyfile(final, outputdir + "/img3.db")
+            final = outputdir + "/img3.db"
+            cwd = os.getcwd()
+            os.chdir(outputdir)
+            try:
+                stats = ih.statistics.Stats(final)
+                stats.histogramBinning("images", "histogramBins", extract["histogram-bin"]["--group"], extract["histogram-bin"]["--chunks"], extract["histogram-bin"]["--channels"], True, True, True)
+                stats._closeConnection()
+            finally:
+                os.chdir(cwd)
+
+        stats = ih.statistics.Stats(final)
+        stats.logErrors(outputdir + "/imgproc.log")
+        stats._closeConnection()
+        if failures:
+            print "%s images were not processed successfully, see %s." % (failures, outputdir + "/imgproc.log")
+        return failures
+
+
+def _localShard(task):
+    """
+        Runs the image processing chain and extraction for a chunk of images
+        of a single type, writing results to the chunk's database.  Used by
+        :py:meth:`~ih.workflow.ImageProcessor.runLocal`, must be top level to
+        be sent to worker processes.  An image that fails has its error written
+        to the error column.  Returns the chunk's database, and the number of
+        images that failed.
+    """
+    import ih.imgproc
+    rows, jobs, extract, outputdir, save, db, cache = task
+    conn = ih.database.connect(db)
+    conn.execute("drop table if exists images")
+    conn.execute("create table images (pegasusid PRIMARY KEY)")
+    conn.executemany("insert into images (pegasusid) values (?)", [(row["pegasusid"],) for row in rows])
+    ih.database.close(conn)
+    keep = [output for job in jobs if job["name"] in extract["depends"] for output in job["outputs"]]
+    arguments = extract["arguments"]
+    features = ih.imgproc.extractFeatures(arguments)
+    writer = ih.database.DbWriter(db, role = "scratch")
+    writer.addColumns(["error"])
+    cache = ih.cache.StepCache(cache) if cache else None
+    failures = 0
+    for row in rows:
+        try:
+            prefix = row["derivedPath"] + row["pegasusid"]
+            plant = ih.imgproc.Chain(row["path"], jobs, outputdir, prefix, save, keep, db = db, dbid = row["pegasusid"], writer = writer, cache = cache).run()
+            plant.restore(extract["inputs"][0])
+            plant.input = outputdir + "/" + prefix + "_" + extract["inputs"][0] + ".png"
+
+            plant.extractFinalPath()
+
+            if "--dimfromroi" in arguments:
+                roi = arguments["--dimfromroi"]
+                dimfromroi = roi if os.path.isfile(roi) else prefix + "_" + roi + ".json"
+            else:
+                dimfromroi = None
+            plant.extractAll(features, dimfromroi, packed = "--packed" in arguments)
+        except Exception as e:
+            # Workers share stdout, so the traceback is kept with the image instead of printed.
+            writer.add(row["pegasusid"], [("error", "Processing Error, %s" % (traceback.format_exc(),))])
+            failures += 1
+    writer.close()
+    if cache:
+        cache.close()
+    return (db, failures)
+
 
 class ImageLoader:
     """
@@ -1106,7 +1280,7 @@ class ImageLoader:
             Writes the data loaded from crawl into csv format based on 'order'
         """
         if self.data:
-            conn = sqlite3.connect(self.output + "/images.db")
+            conn = ih.database.connect(self.output + "/images.db", "master")
             tablestr = "(pegasusid PRIMARY KEY"
             for x in self.template["order"]:
                 if x != "pegasusid":
@@ -1122,6 +1296,8 @@ class ImageLoader:
             query = "insert into images " + str(tuple([str(x) for x in self.template["order"]])) + " values (" + ("?," * len(self.template["order"]))[:-1] + ")"
             conn.executemany(query, writedata)
             conn.commit()
+            ih.database.createIndexes(conn, "images")
+            ih.database.close(conn)
             if not self.overwrite:
                 shutil.copyfile(self.templatePath, self.output + "/crawl.json")
         else:
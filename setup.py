@@ -12,6 +12,7 @@ setup(
 		"scripts/ih-bitwise-xor",
 		"scripts/ih-convert-color",
 		"scripts/ih-meanshift",
+		"scripts/ih-meanshift-bench",
 		"scripts/ih-threshold",
 		"scripts/ih-extract",
 		"scripts/ih-adaptive-threshold",
@@ -44,6 +45,8 @@ setup(
 		"scripts/ih-extract-multi",
 		"scripts/ih-sql-aggregate",
 		"scripts/osg-wrapper.sh",
+		"scripts/ih-worker",
+		"scripts/ih",
 
 		"scripts/ih-data",
 
@@ -0,0 +1,77 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import random
+import unittest
+import cv2
+import numpy as np
+import ih.imgproc
+import ih.database
+import ih.statistics
+
+def grid(vector):
+    """
+    Bins covering the grid given by the split points of each channel, the same
+    shape as the bins generated by histogram binning.
+    """
+    bins = []
+    for i in range(0, len(vector[0]) - 1):
+        for j in range(0, len(vector[1]) - 1):
+            for k in range(0, len(vector[2]) - 1):
+                bins.append({"name": "bin" + str(len(bins) + 1), "min": [vector[0][i], vector[1][j], vector[2][k]], "max": [vector[0][i + 1], vector[1][j + 1], vector[2][k + 1]]})
+    return bins
+
+class BinCountTest(unittest.TestCase):
+
+    """
+    Checks that bins counted in a single pass over the image, and bins counted
+    from the stored 3-D color histogram, match counting every bin with cv2.inRange.
+    """
+
+    def setUp(self):
+        rand = np.random.RandomState(2)
+        random.seed(2)
+        self.image = np.zeros((80, 100, 3), np.uint8)
+        self.image[10:70, 20:90] = np.clip(rand.normal(120, 60, (60, 70, 3)), 0, 255).astype(np.uint8)
+        self.image[0, 0] = 255
+        self.bins = {
+            "grid": grid([[1] + sorted(random.sample(range(2, 255), n - 1)) + [255] for n in [4, 3, 5]]),
+            "arbitrary": [{"name": "b" + str(i), "min": [random.randint(0, 255) for c in range(0, 3)], "max": [random.randint(0, 255) for c in range(0, 3)]} for i in range(0, 30)],
+            "edges": [{"name": "all", "min": [0, 0, 0], "max": [255, 255, 255]}, {"name": "black", "min": [0, 0, 0], "max": [0, 0, 0]}, {"name": "white", "min": [255, 255, 255], "max": [255, 255, 255]}, {"name": "inverted", "min": [200, 0, 0], "max": [100, 255, 255]}]
+        }
+        return
+
+    def _expected(self, image, bins):
+        return [cv2.countNonZero(cv2.inRange(image, np.array(bin["min"], np.uint8), np.array(bin["max"], np.uint8))) for bin in bins]
+
+    def test_grid(self):
+        plant = ih.imgproc.Image(self.image)
+        for name in self.bins:
+            self.assertEqual(plant._gridBinCounts(self.bins[name]), self._expected(self.image, self.bins[name]), "%s bins differ." % (name,))
+        self.assertEqual(plant._gridBinCounts(self.bins["arbitrary"], 8), None)
+
+    def test_extract(self):
+        for name in self.bins:
+            result = ih.imgproc.Image(self.image.copy()).extractBins([dict(bin) for bin in self.bins[name]])
+            self.assertEqual([bin["count"] for bin in result], self._expected(self.image, self.bins[name]), "%s bins differ." % (name,))
+
+    def test_cube(self):
+        cube = ih.database.DbWriter.unpackCube(ih.database.DbWriter.packCube(ih.imgproc.Image(self.image).extractColorCube()))
+        for name in self.bins:
+            self.assertEqual(ih.statistics.Stats._cubeBinCounts.im_func(None, cube, self.bins[name]), self._expected(self.image, self.bins[name]), "%s bins differ." % (name,))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+import ih.cache
+
+jobs = [
+    {"name": "gray", "executable": "ih-convert-color", "inputs": ["base"], "outputs": ["gray"], "arguments": {"--intype": "bgr", "--outtype": "gray"}},
+    {"name": "thresh", "executable": "ih-threshold", "inputs": ["gray"], "outputs": ["thresh"], "arguments": {"--thresh": 100, "--max": 255, "--type": "binary"}, "depends": ["gray"]},
+    {"name": "chop", "executable": "ih-contour-chop", "inputs": ["base", "thresh"], "outputs": ["chop"], "arguments": {"--basemin": 100}, "depends": ["thresh"]},
+    {"name": "blur", "executable": "ih-blur", "inputs": ["chop"], "outputs": ["final"], "arguments": {"--kwidth": 5, "--kheight": 5}, "depends": ["chop"]},
+    {"name": "cut", "executable": "ih-contour-cut", "inputs": ["gray", "thresh"], "outputs": ["cut", "roi"], "arguments": {"--basemin": 100, "--returnBound": ""}, "depends": ["thresh"]}
+]
+
+def named(jobs, name):
+    return [job for job in jobs if job["name"] == name][0]
+
+class StepCacheTest(unittest.TestCase):
+
+    """
+    Checks the keys of :py:class:`~ih.cache.StepCache`, which steps :py:meth:`~ih.cache.StepCache.plan`
+    runs, and how results are added to the cache.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.image = self.folder + "/image.png"
+        self._png(self.image, "base")
+        self.caches = []
+        return
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.folder)
+        return
+
+    def _png(self, path, content):
+        with open(path, "wb") as wh:
+            wh.write(ih.cache.signature + content)
+        return path
+
+    def _cache(self, name = "cache"):
+        self.caches.append(ih.cache.StepCache(self.folder + "/" + name))
+        return self.caches[-1]
+
+    def _run(self, cache, jobs, keep = ["final"]):
+        """
+        Plans the jobs, and stores a result for every cacheable job that runs, as a run would.
+        Returns the names of the jobs that ran.
+        """
+        keys, cached, run = cache.plan(jobs, self.image, keep)
+        for job in jobs:
+            if job["name"] in run and cache.cacheable(job):
+                for i,output in enumerate(job["outputs"]):
+                    cache.store(keys[job["name"]], i, self._png(self.folder + "/" + output + ".png", job["name"] + str(job["arguments"])), True)
+        return run
+
+    def test_keys(self):
+        keys = self._cache().keys(jobs, self.image)
+        self.assertEqual(len(set(keys.values())), len(jobs))
+        # The same image and arguments give the same keys in another run, whatever the cache.
+        self.assertEqual(self._cache("other").keys(copy.deepcopy(jobs), self.image), keys)
+        # Equivalent spellings of arguments, and output names, don't change the keys.
+        renamed = copy.deepcopy(jobs)
+        named(renamed, "thresh")["arguments"]["--thresh"] = ' "100" '
+        named(renamed, "thresh")["outputs"] = ["binary"]
+        named(renamed, "chop")["inputs"] = ["base", "binary"]
+        named(renamed, "cut")["inputs"] = ["gray", "binary"]
+        self.assertEqual(self._cache().keys(renamed, self.image), keys)
+        # A different image changes every key.
+        self._png(self.image, "other")
+        os.utime(self.image, (0, 0))
+        self.assertFalse(set(self._cache().keys(jobs, self.image).values()) & set(keys.values()))
+
+    def test_plan(self):
+        cache = self._cache()
+        self.assertEqual(self._run(cache, jobs), set(["gray", "thresh", "chop", "blur", "cut"]))
+        # Everything is cached, except the job with a roi output.
+        self.assertEqual(self._run(self._cache(), jobs), set(["cut"]))
+        # Changing --basemin of chop runs chop and the steps after it.
+        changed = copy.deepcopy(jobs)
+        named(changed, "chop")["arguments"]["--basemin"] = 200
+        self.assertEqual(self._run(cache, changed), set(["chop", "blur", "cut"]))
+        self.assertEqual(self._run(cache, changed), set(["cut"]))
+        # Cached jobs whose outputs aren't needed are skipped entirely.
+        keys, cached, run = cache.plan([job for job in jobs if job["name"] != "cut"], self.image, ["final"])
+        self.assertEqual((sorted(cached), run), (["blur"], set()))
+
+    def test_uncacheable(self):
+        cache = self._cache()
+        self.assertFalse(cache.cacheable(named(jobs, "cut")))
+        # Results that aren't png images, such as blank files, are never stored.
+        key = cache.keys(jobs, self.image)["blur"]
+        path = self.folder + "/blank.png"
+        with open(path, "w") as wh:
+            wh.write("not an image.")
+        cache.store(key, 0, path, True)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(cache.fetch(key, 1), None)
+
+    def test_expect(self):
+        cache = self._cache()
+        key = cache.keys(jobs, self.image)["blur"]
+        path = self.folder + "/later.png"
+        cache.expect(key, 0, path)
+        self.assertEqual(cache.fetch(key, 1), None)
+        # Once the expected output is written, the next run takes it into the cache.
+        self._png(path, "blurred")
+        self.assertEqual(self._cache().fetch(key, 1), [cache.file(key, 0)])
+        with open(cache.file(key, 0), "rb") as rh:
+            self.assertEqual(rh.read(), ih.cache.signature + "blurred")
+
+if __name__ == "__main__":
+    unittest.main()
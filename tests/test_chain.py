@@ -0,0 +1,206 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import json
+import copy
+import shutil
+import tempfile
+import unittest
+import cv2
+import numpy as np
+import ih.conf as conf
+import ih.imgproc
+import ih.worker
+import ih.commands
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def plant(y = 120, x = 160):
+    """
+    A small synthetic plant image: a noisy gray background, a pot, a stem and a round green top.
+    """
+    rand = np.random.RandomState(1)
+    image = np.full((y, x, 3), 170, np.uint8) + rand.randint(0, 25, (y, x, 3)).astype(np.uint8)
+    image[int(y * 0.7):int(y * 0.95), int(x * 0.3):int(x * 0.7)] = (150, 70, 60)
+    image[int(y * 0.3):int(y * 0.7), int(x * 0.45):int(x * 0.55)] = (40, 150, 60)
+    cv2.circle(image, (x / 2, int(y * 0.3)), y / 6, (30, 190, 50), -1)
+    return image
+
+def prepare(jobs, folder):
+    """
+    Fills in the derived and fixed arguments of each job the way the validator does,
+    and replaces the raw roi files of the example with a roi written to folder.  Pot
+    rois cover the pot of :py:func:`plant`, other rois the image without its edges.
+    """
+    jobs = copy.deepcopy(jobs)
+    for job in jobs:
+        for i,input in enumerate(job["inputs"]):
+            if "/" in input:
+                job["inputs"][i] = os.path.join(folder, os.path.basename(input))
+                with open(job["inputs"][i], "w") as wh:
+                    if "pot" in os.path.basename(input):
+                        json.dump({"ystart": 84, "yend": -1, "xstart": 48, "xend": 112}, wh)
+                    else:
+                        json.dump({"ystart": 5, "yend": "y - 5", "xstart": 5, "xend": "x - 5"}, wh)
+        for arg,spec in conf.valid[job["executable"]]["arguments"].items():
+            if spec["type"] == "derived" and spec["index"] < len(job.get(spec["key"], [])):
+                job["arguments"][arg] = spec["value"] if "value" in spec else job[spec["key"]][spec["index"]]
+            elif spec["type"] == "overwrite" and ("required" in spec or arg in job["arguments"]):
+                job["arguments"][arg] = spec["value"]
+            elif arg in job["arguments"] and isinstance(job["arguments"][arg], list) and "join" in spec:
+                job["arguments"][arg] = spec["join"].join(job["arguments"][arg])
+    return jobs
+
+def files(job, prefix):
+    """
+    The file names each input and output of a job is written to, as in a pegasus workflow.
+    """
+    names = {}
+    for key in ["inputs", "outputs"]:
+        for i,name in enumerate(job[key]):
+            if not os.path.isfile(name):
+                names[name] = prefix + "_" + name + conf.fileExtensions[conf.valid[job["executable"]][key][i]]
+    return names
+
+class ChainTest(unittest.TestCase):
+
+    """
+    Runs the example workflows both as separate scripts, the way a pegasus workflow
+    runs them, and as a :py:class:`~ih.imgproc.Chain`, and checks that every step
+    gives the same image.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        cv2.imwrite(self.folder + "/x_base.png", plant())
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def _scripts(self, jobs):
+        """
+        Runs every job as its own script, and returns the written image of every output.
+        The example workflows list every job after the jobs it depends on.
+        """
+        folder = self.folder + "/scripts"
+        os.makedirs(folder)
+        shutil.copy(self.folder + "/x_base.png", folder)
+        for job in jobs:
+            names = files(job, "x")
+            argv = [os.path.join(root, "scripts", job["executable"])]
+            for arg,value in job["arguments"].items():
+                argv.append(arg)
+                if value != "":
+                    argv.append(names.get(unicode(value), str(value).strip('"')))
+            result = ih.worker.run(argv, folder)
+            self.assertEqual(result["status"], 0, "%s failed: %s" % (job["name"], result["stderr"]))
+        return dict((output, cv2.imread(folder + "/x_" + output + ".png")) for job in jobs for i,output in enumerate(job["outputs"]) if conf.valid[job["executable"]]["outputs"][i] == "image")
+
+    def _check(self, name, imtype):
+        with open(os.path.join(root, "examples", "workflows", name, "imgproc.json")) as rh:
+            jobs = prepare(json.load(rh)["workflows"][imtype], self.folder)
+        expected = self._scripts(jobs)
+        os.makedirs(self.folder + "/chain")
+        chain = ih.imgproc.Chain(self.folder + "/x_base.png", jobs, self.folder + "/chain", "x")
+        if any(image is None for image in expected.values()):
+            # A script failed and wrote a blank file, so the chain should fail as well.
+            self.assertRaises(Exception, chain.run)
+        else:
+            chain.run()
+        for output in expected:
+            if expected[output] is not None and output in chain.plant.states:
+                self.assertTrue(np.array_equal(chain.plant.states[output], expected[output]), "%s %s output '%s' differs." % (name, imtype, output))
+        return
+
+    def test_alexmac_rgbsv(self):
+        self._check("alexmac", "rgbsv")
+
+    def test_alexmac_rgbtv(self):
+        self._check("alexmac", "rgbtv")
+
+    def test_alexmac_fluosv(self):
+        self._check("alexmac", "fluosv")
+
+    def test_blecha_rgbsv(self):
+        self._check("blecha", "rgbsv")
+
+    def test_blecha_rgbtv(self):
+        self._check("blecha", "rgbtv")
+
+    def test_current_rgbsv(self):
+        self._check("current", "rgbsv")
+
+    def test_current_rgbtv(self):
+        self._check("current", "rgbtv")
+
+    def test_current_fluosv(self):
+        self._check("current", "fluosv")
+
+class ChainStepTest(unittest.TestCase):
+
+    """
+    Checks that every image processing script can be run in a :py:class:`~ih.imgproc.Chain`,
+    and the outputs of a chained contour cut.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        cv2.imwrite(self.folder + "/x_base.png", plant())
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def _cut(self, outputs, arguments, keep = []):
+        jobs = [
+            {"name": "gray", "executable": "ih-convert-color", "inputs": ["base"], "outputs": ["gray"], "arguments": {"--intype": "bgr", "--outtype": "gray"}},
+            {"name": "thresh", "executable": "ih-threshold", "inputs": ["gray"], "outputs": ["thresh"], "arguments": {"--thresh": 100, "--max": 255, "--type": "inverse"}, "depends": ["gray"]},
+            {"name": "cut", "executable": "ih-contour-cut", "inputs": ["base", "thresh"], "outputs": outputs, "arguments": arguments, "depends": ["thresh"]}
+        ]
+        return ih.imgproc.Chain(self.folder + "/x_base.png", jobs, self.folder, "x", keep = keep).run()
+
+    def test_handlers(self):
+        chain = ih.imgproc.Chain(self.folder + "/x_base.png", [])
+        for name,spec in conf.valid.items():
+            if spec["type"] == "imgproc" and "inputs" in spec:
+                self.assertIn(name, chain.steps, "'%s' has no chain step." % (name,))
+        return
+
+    def test_cut_single_output(self):
+        plant = self._cut(["cut"], {"--basemin": 100, "--resize": "", "--returnBound": ""})
+        self.assertTrue(os.path.isfile(self.folder + "/roi.json"))
+        self.assertEqual(plant.states["cut"].shape[:2], (plant.rois["roi.json"][1] - plant.rois["roi.json"][0], plant.rois["roi.json"][3] - plant.rois["roi.json"][2]))
+        return
+
+    def test_cut_roi_kept(self):
+        plant = self._cut(["cut", "bound"], {"--basemin": 100, "--resize": "", "--returnBound": ""}, keep = ["bound"])
+        self.assertTrue(os.path.isfile(self.folder + "/x_bound.json"))
+        self.assertIn("x_bound.json", plant.rois)
+        return
+
+    def test_cut_roi_not_kept(self):
+        plant = self._cut(["cut", "bound"], {"--basemin": 100, "--resize": "", "--returnBound": ""})
+        self.assertFalse(os.path.isfile(self.folder + "/x_bound.json"))
+        self.assertIn("x_bound.json", plant.rois)
+        self.assertLess(plant.states["cut"].shape[:2], plant.states["base"].shape[:2])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
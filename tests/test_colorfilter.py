@@ -0,0 +1,108 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import cv2
+import numpy as np
+import ih.imgproc
+
+class Reference(object):
+
+    """
+    The original color filter, which evaluates the logic string by repeatedly
+    replacing the innermost parentheses with their result, on float planes of
+    the whole image.
+    """
+
+    def __init__(self, filter):
+        self.tokens = {
+            "and": np.logical_and, "or": np.logical_or,
+            ">": lambda left, right: left > right,
+            "<": lambda left, right: left < right,
+            ">=": lambda left, right: left >= right,
+            "<=": lambda left, right: left <= right,
+            "=": lambda left, right: left == right,
+            "+": lambda left, right: left + right,
+            "-": lambda left, right: left - right,
+            ".": lambda left, right: left * right,
+            "/": lambda left, right: left / right,
+            "max": np.maximum, "min": np.minimum,
+            "(": "(", ")": ")"
+        }
+        self.filterString = filter
+        return
+
+    def apply(self, image, roi):
+        self.tokens["r"] = image[:,:,2].astype(float)
+        self.tokens["g"] = image[:,:,1].astype(float)
+        self.tokens["b"] = image[:,:,0].astype(float)
+        self.tokens["i"] = self.tokens["r"] + self.tokens["g"] + self.tokens["b"]
+        self.tokens["high"] = np.maximum(np.maximum(self.tokens["r"], self.tokens["g"]), self.tokens["b"])
+        self.tokens["low"] = np.minimum(np.minimum(self.tokens["r"], self.tokens["g"]), self.tokens["b"])
+        filter = [self.tokens[x] if x in self.tokens else int(x) for x in self.filterString.replace("(", " ( ").replace(")", " ) ").split()]
+        while len(filter) > 1:
+            left = max([i for i,x in enumerate(filter) if x is "("] or [-1])
+            right = filter.index(")", left + 2) if left >= 0 else len(filter)
+            group = filter[left + 1:right]
+            filter[max(left, 0):right + 1] = [group[1](group[0], group[2]) if len(group) == 3 else group[0]]
+        result = cv2.cvtColor(np.where(filter[0], 255, 0).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+        image[roi[0]:roi[1], roi[2]:roi[3]] = cv2.bitwise_and(image[roi[0]:roi[1], roi[2]:roi[3]], result[roi[0]:roi[1], roi[2]:roi[3]])
+        return image
+
+class ColorFilterTest(unittest.TestCase):
+
+    """
+    Checks that the compiled color filter gives the same image as the original
+    evaluator, for logic that uses every plane and operator.
+    """
+
+    logic = [
+        "r > 30",
+        "((r - g) > 30) and ((b / 2) < 60)",
+        "(i > 300) or (high < 80)",
+        "((r max g) - (b min g)) > 40",
+        "((r . 2) - (g + b)) >= 10",
+        "(r = g) or ((low / 3) <= 20)",
+        "((i - (r . 3)) < 0) or (b > 200)",
+        "(((g - r) . (g - b)) > 500) and (i < 700)"
+    ]
+
+    def setUp(self):
+        rand = np.random.RandomState(0)
+        self.image = rand.randint(0, 256, (40, 60, 3)).astype(np.uint8)
+        self.image[:5] = 255
+        self.image[5:10] = 0
+        return
+
+    def test_apply(self):
+        for logic in self.logic:
+            for roi in [[0, 40, 0, 60], [3, 31, 7, 52]]:
+                expected = Reference(logic).apply(self.image.copy(), roi)
+                result = ih.imgproc.ColorFilter(logic).apply(self.image.copy(), roi)
+                self.assertTrue(np.array_equal(result, expected), "'%s' differs in roi %s." % (logic, roi))
+
+    def test_table(self):
+        logic = self.logic[1]
+        table = ih.imgproc.ColorFilter(logic).table()
+        expected = Reference(logic).apply(self.image.copy(), [0, 40, 0, 60])
+        self.assertTrue(np.array_equal(self.image * table[ih.imgproc.ColorTable.index(self.image)][:,:,None], expected))
+
+    def test_invalid(self):
+        for logic in ["r >", "(r > 3", "r > 3)", "r > x"]:
+            self.assertRaises(Exception, ih.imgproc.ColorFilter, logic)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import re
+import unittest
+import ih.commands
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class CommandsTest(unittest.TestCase):
+
+    """
+    Checks that every installed ih-* script runs its own command in :py:mod:`ih.commands`.
+    """
+
+    def test_scripts(self):
+        with open(os.path.join(root, "setup.py")) as rh:
+            installed = [os.path.basename(path) for path in re.findall(r'"(scripts/ih-[^"]+)"', rh.read())]
+        self.assertEqual(sorted(installed), sorted(ih.commands.handlers.keys()))
+        for name in installed:
+            with open(os.path.join(root, "scripts", name)) as rh:
+                self.assertIn('ih.commands.main("%s")' % (name,), rh.read())
+        return
+
+    def test_local(self):
+        self.assertTrue(ih.commands.local <= set(ih.commands.handlers.keys()))
+        return
+
+    def test_invalid(self):
+        self.assertRaises(Exception, ih.commands.script, "not-a-command")
+        self.assertEqual(os.path.basename(ih.commands.script("convert-color")), "ih-convert-color")
+        return
+
+if __name__ == "__main__":
+    unittest.main()
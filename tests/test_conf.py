@@ -0,0 +1,50 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import cv2
+import ih.conf as conf
+
+class ConfTest(unittest.TestCase):
+
+    """
+    conf stores cv2 codes as plain values, so that importing it doesn't load opencv.
+    Checks that each value is the code of the installed opencv.
+    """
+
+    def test_colors(self):
+        self.assertEqual(conf.colors["bgr"]["gray"], [cv2.COLOR_BGR2GRAY])
+        self.assertEqual(conf.colors["bgr"]["hsv"], [cv2.COLOR_BGR2HSV])
+        self.assertEqual(conf.colors["bgr"]["lab"], [cv2.COLOR_BGR2LAB])
+        self.assertEqual(conf.colors["bgr"]["ycrcb"], [cv2.COLOR_BGR2YCR_CB])
+        self.assertEqual(conf.colors["gray"]["bgr"], [cv2.COLOR_GRAY2BGR])
+        self.assertEqual(conf.colors["hsv"]["bgr"], [cv2.COLOR_HSV2BGR])
+        self.assertEqual(conf.colors["lab"]["bgr"], [cv2.COLOR_LAB2BGR])
+        self.assertEqual(conf.colors["ycrcb"]["bgr"], [cv2.COLOR_YCR_CB2BGR])
+        return
+
+    def test_codes(self):
+        self.assertEqual(conf.thresholds, {"binary": cv2.THRESH_BINARY, "inverse": cv2.THRESH_BINARY_INV, "truncate": cv2.THRESH_TRUNC, "tozero": cv2.THRESH_TOZERO, "otsu": cv2.THRESH_BINARY + cv2.THRESH_OTSU})
+        self.assertEqual(conf.adaptives, {"mean": cv2.ADAPTIVE_THRESH_MEAN_C, "gauss": cv2.ADAPTIVE_THRESH_GAUSSIAN_C, "gaussian": cv2.ADAPTIVE_THRESH_GAUSSIAN_C})
+        self.assertEqual(conf.borders, {"default": cv2.BORDER_DEFAULT, "constant": cv2.BORDER_CONSTANT, "reflect": cv2.BORDER_REFLECT, "replicate": cv2.BORDER_REPLICATE, "transparent": cv2.BORDER_TRANSPARENT, "wrap": cv2.BORDER_WRAP})
+        self.assertEqual(conf.morph, {"dilate": cv2.MORPH_DILATE, "erode": cv2.MORPH_ERODE, "open": cv2.MORPH_OPEN, "close": cv2.MORPH_CLOSE, "gradient": cv2.MORPH_GRADIENT, "tophat": cv2.MORPH_TOPHAT, "blackhat": cv2.MORPH_BLACKHAT})
+        self.assertEqual(conf.kernels, {"rect": cv2.MORPH_RECT, "ellipse": cv2.MORPH_ELLIPSE, "cross": cv2.MORPH_CROSS})
+        self.assertEqual(conf.centers, {"random": cv2.KMEANS_RANDOM_CENTERS, "pp": cv2.KMEANS_PP_CENTERS})
+        self.assertEqual(conf.ktermination, {"accuracy": cv2.TERM_CRITERIA_EPS, "iteration": cv2.TERM_CRITERIA_MAX_ITER, "either": cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER})
+        return
+
+if __name__ == "__main__":
+    unittest.main()
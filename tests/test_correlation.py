@@ -0,0 +1,106 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import ih.database
+import ih.statistics
+
+class CorrelationTest(unittest.TestCase):
+
+    """
+    Pins the output of :py:meth:`~ih.statistics.Stats.correlation`: one row per plant
+    and image type, with metadata from the plant's latest image, and coefficients
+    over every image on a date in the data file.
+    """
+
+    # pegasusid, experiment, id, date, imtype, pixels, height, genotype
+    rows = [
+        ("1", "a", "000001-S", "2015-01-03", "rgbsv", 30, 5, "g1"),
+        ("2", "b", "000001-S", "2015-01-01", "rgbsv", 12, 3, "g1"),
+        ("3", "c", "000001-S", "2015-01-04", "rgbsv", 99, 1, "g1"),
+        ("4", "d", "000001-S", "2015-01-02", "rgbsv", 25, None, "g1"),
+        ("5", "e", "000001-S", "2015-01-01", "rgbtv", 8, 2, "g1"),
+        ("6", "f", "000001-S", "2015-01-02", "rgbtv", 9, 4, "g1"),
+        ("7", "g", "000001-S", "2015-01-03", "rgbtv", 15, 5, "g1"),
+        ("8", "h", "000002-S", "2015-01-02", "rgbsv", 40, 7, "g2"),
+        ("9", "i", "000002-S", "2015-01-01", "rgbsv", 20, 6, "g2"),
+        ("10", "j", "000002-S", "2015-01-02", "rgbsv", 41, 8, "g2"),
+        ("11", "k", "000003-S", "2015-01-01", "rgbsv", 1, 1, "g3")
+    ]
+
+    # id, date, metric
+    data = [
+        ("000001-S", "01/01/15", 10),
+        ("000001-S", "01/02/15", 21),
+        ("000001-S", "01/03/15", 29),
+        ("000002-S", "01/01/15", 5),
+        ("000002-S", "01/02/15", 9)
+    ]
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db = self.folder + "/images.db"
+        conn = sqlite3.connect(self.db)
+        conn.execute("create table images (pegasusid PRIMARY KEY, experiment, id, date, imtype, pixels, height, genotype)")
+        conn.executemany("insert into images values (?,?,?,?,?,?,?,?)", self.rows)
+        conn.commit()
+        conn.close()
+        with open(self.folder + "/data.csv", "w") as wh:
+            wh.write("Snapshot ID Tag,Snapshot Time Stamp,Area\n")
+            for id, date, metric in self.data:
+                wh.write("%s,%s 10:00,%s\n" % (id, date, metric))
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def test_correlation(self):
+        stats = ih.statistics.Stats(self.db)
+        stats.correlation("images", "corr", self.folder + "/data.csv", {"id": "Snapshot ID Tag", "date": "Snapshot Time Stamp", "dateFormat": "%m/%d/%y", "metric": "Area"})
+        ih.database.close(stats.conn)
+        conn = sqlite3.connect(self.db)
+        conn.row_factory = sqlite3.Row
+        result = dict(((row["id"], row["imtype"]), row) for row in conn.execute("select * from corr"))
+        # 000003-S has no data, so it has no row.
+        self.assertEqual(sorted(result.keys()), [("000001-S", "rgbsv"), ("000001-S", "rgbtv"), ("000002-S", "rgbsv")])
+        metric = {"2015-01-01": 10, "2015-01-02": 21, "2015-01-03": 29}
+        # The earliest image is used as well.
+        row = result[("000001-S", "rgbsv")]
+        self.assertAlmostEqual(row["pixels"], np.corrcoef([30, 12, 25], [metric["2015-01-03"], metric["2015-01-01"], metric["2015-01-02"]])[0][1])
+        self.assertEqual(row["height"], None)
+        self.assertEqual(row["genotype"], None)
+        self.assertEqual(row["experiment"], "c")
+        row = result[("000001-S", "rgbtv")]
+        self.assertAlmostEqual(row["pixels"], np.corrcoef([8, 9, 15], [10, 21, 29])[0][1])
+        self.assertAlmostEqual(row["height"], np.corrcoef([2, 4, 5], [10, 21, 29])[0][1])
+        self.assertEqual(row["experiment"], "g")
+        # Images on the same date are all used, and the later written one gives the metadata.
+        row = result[("000002-S", "rgbsv")]
+        self.assertAlmostEqual(row["pixels"], np.corrcoef([40, 20, 41], [9, 5, 9])[0][1])
+        self.assertEqual(row["experiment"], "j")
+        refs = dict(conn.execute("select pegasusid,ref_corr from images"))
+        ids = dict((key, row["pegasusid"]) for key, row in result.items())
+        for id, experiment, plant, date, imtype, pixels, height, genotype in self.rows:
+            self.assertEqual(refs[id], ids.get((plant, imtype)))
+        conn.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import ih.imgproc
+import ih.database
+
+def database(path, count):
+    """
+    Creates an images table with count rows, with pegasusids '0' to str(count - 1).
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("create table images (pegasusid PRIMARY KEY, experiment, id, date, imtype, imgname, path)")
+    conn.executemany("insert into images values (?,?,?,?,?,?,?)", [(str(i), "e", "id" + str(i), "2015-01-01", "rgbsv", "0_0", "") for i in range(0, count)])
+    conn.commit()
+    conn.close()
+    return
+
+def dump(path):
+    """
+    :return: The column names, and every row of the images and histograms tables.
+    """
+    conn = sqlite3.connect(path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(images)")]
+    rows = conn.execute("select * from images order by pegasusid").fetchall()
+    hists = conn.execute("select pegasusid,kind,data from histograms order by pegasusid,kind").fetchall() if conn.execute("select name from sqlite_master where name='histograms'").fetchone() else []
+    conn.close()
+    return columns, rows, [(id, kind, str(data)) for id, kind, data in hists]
+
+class DbWriterTest(unittest.TestCase):
+
+    """
+    Checks that values written through a shared, batched :py:class:`~ih.database.DbWriter`
+    end up in the same columns and rows as values written one image at a time.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rand = np.random.RandomState(0)
+        self.images = []
+        for i in range(0, 5):
+            image = np.zeros((50, 70, 3), np.uint8)
+            image[10:40, 15 + i:50] = rand.randint(0, 256, (30, 35 - i, 3))
+            self.images.append(image)
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def test_extract(self):
+        features = ["dimensions", "pixels", "moments", "colors", "channels", "hull", "circle"]
+        for packed in [False, True]:
+            single = self.folder + "/single" + str(packed) + ".db"
+            shared = self.folder + "/shared" + str(packed) + ".db"
+            for db in [single, shared]:
+                database(db, len(self.images))
+            for i,image in enumerate(self.images):
+                plant = ih.imgproc.Image(image.copy(), db = single, dbid = str(i))
+                plant.extractAll(features, packed = packed)
+                plant._closeDb()
+            writer = ih.database.DbWriter(shared)
+            for i,image in enumerate(self.images):
+                ih.imgproc.Image(image.copy(), db = shared, dbid = str(i), writer = writer).extractAll(features, packed = packed)
+            writer.close()
+            self.assertEqual(dump(single), dump(shared))
+
+    def test_add(self):
+        db = self.folder + "/writer.db"
+        database(db, 4)
+        calls = [
+            ("2", [("a", 1), ("b", 2.5)]),
+            ("0", [("b", 3), ("c", "x")]),
+            ("2", [("a", 4), ("d", None)]),
+            ("3", [("c", "y"), ("a", 5)]),
+            ("0", [("e", 6)])
+        ]
+        writer = ih.database.DbWriter(db)
+        for dbid, values in calls:
+            writer.add(dbid, values)
+        writer.close()
+        expected = self.folder + "/expected.db"
+        database(expected, 4)
+        conn = sqlite3.connect(expected)
+        for dbid, values in calls:
+            for column, value in values:
+                if column not in [row[1] for row in conn.execute("PRAGMA table_info(images)")]:
+                    conn.execute("alter table images add column " + column + " " + ih.database.affinity(column))
+                conn.execute("update images set " + column + "=? where pegasusid=?", (value, dbid))
+        conn.commit()
+        conn.close()
+        self.assertEqual(dump(db), dump(expected))
+
+    def test_pack(self):
+        hist = np.random.RandomState(1).randint(0, 100000, (3, 256))
+        self.assertTrue(np.array_equal(ih.database.DbWriter.unpack(ih.database.DbWriter.pack(hist)), hist))
+        cube = ih.imgproc.Image(self.images[0])._colorCube()
+        colors, counts = ih.database.DbWriter.unpackCube(ih.database.DbWriter.packCube(cube))
+        self.assertTrue(np.array_equal(colors, cube[0]) and np.array_equal(counts, cube[1]))
+        self.assertEqual(counts.sum(), 50 * 70)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import ih.database
+import ih.statistics
+
+def shard(path, columns, rows, hists = []):
+    """
+    Creates a database with an images table of the given columns and rows,
+    and if given a histograms table with the given (pegasusid, kind, data) rows.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("create table images (" + ",".join(["pegasusid PRIMARY KEY"] + columns) + ")")
+    conn.executemany("insert into images values (" + ",".join(["?"] * (len(columns) + 1)) + ")", rows)
+    if hists:
+        conn.execute("create table " + ih.database.DbWriter.histtable + " (pegasusid, kind, data BLOB, PRIMARY KEY (pegasusid, kind))")
+        conn.executemany("insert into " + ih.database.DbWriter.histtable + " values (?,?,?)", [(id, kind, sqlite3.Binary(data)) for id, kind, data in hists])
+    conn.commit()
+    conn.close()
+    return
+
+def dump(path):
+    """
+    :return: The columns of the images table, its rows by pegasusid, and the rows of the histograms table.
+    """
+    conn = sqlite3.connect(path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(images)")]
+    rows = conn.execute("select * from images order by pegasusid").fetchall()
+    hists = conn.execute("select pegasusid,kind,data from histograms order by pegasusid,kind").fetchall() if conn.execute("select name from sqlite_master where name='histograms'").fetchone() else []
+    conn.close()
+    return columns, rows, [(id, kind, str(data)) for id, kind, data in hists]
+
+def reference(path, dblist):
+    """
+    The original merge, which copies every shard row into the matching row
+    of the database with one update per row.
+    """
+    conn = sqlite3.connect(path)
+    for f in dblist:
+        other = sqlite3.connect(f)
+        headers = [row[1] for row in other.execute("PRAGMA table_info(images)") if row[1] != "pegasusid"]
+        for col in headers:
+            if col not in [row[1] for row in conn.execute("PRAGMA table_info(images)")]:
+                conn.execute("alter table images add column " + col)
+        conn.executemany("update images set " + ",".join([col + "=?" for col in headers]) + " where pegasusid=?", [row[1:] + row[:1] for row in other.execute("select pegasusid," + ",".join(headers) + " from images")])
+        if other.execute("select name from sqlite_master where name='histograms'").fetchone():
+            conn.execute("create table if not exists histograms (pegasusid, kind, data BLOB, PRIMARY KEY (pegasusid, kind))")
+            conn.executemany("insert or replace into histograms values (?,?,?)", other.execute("select pegasusid,kind,data from histograms"))
+        other.close()
+    conn.commit()
+    conn.close()
+    return
+
+class LoadSqlTest(unittest.TestCase):
+
+    """
+    Checks that merging shard databases with :py:meth:`~ih.statistics.Stats.loadSql`
+    gives the same database as the original row by row merge.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.base = ["experiment", "imtype"]
+        self.rows = [(str(i), "e", "rgbsv" if i % 2 else "rgbtv") for i in range(0, 8)]
+        self.shards = []
+        specs = [
+            (["experiment", "imtype", "pixels"], [("0", "e", "rgbtv", 10), ("1", "e", "rgbsv", 11)], [("0", "colors", "ab")]),
+            (["experiment", "imtype", "pixels", "height"], [("2", "e", "rgbtv", 12, 5.5), ("3", "e", "rgbsv", None, 6)], []),
+            (["experiment", "imtype", "error"], [("4", "e", "rgbtv", "Processing Error"), ("9", "e", "rgbsv", None)], [("4", "colors3d", "cd"), ("9", "colors", "ef")]),
+            (["experiment", "imtype"], [("5", "e", "rgbsv")], []),
+            (["experiment", "imtype", "height", "pixels"], [("1", "e", "rgbsv", 7, 13), ("6", "e", "rgbtv", 8, 14)], [("0", "colors", "gh")])
+        ]
+        for i,(columns, rows, hists) in enumerate(specs):
+            self.shards.append(self.folder + "/shard" + str(i) + ".db")
+            shard(self.shards[-1], columns, rows, hists)
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def _merge(self, name, batch, append = False):
+        path = self.folder + "/" + name + ".db"
+        shard(path, self.base, self.rows)
+        stats = ih.statistics.Stats(path)
+        stats.loadSql(self.shards + [self.folder + "/missing.db"], batch, append)
+        ih.database.close(stats.conn)
+        return path
+
+    def test_merge(self):
+        expected = self.folder + "/expected.db"
+        shard(expected, self.base, self.rows)
+        reference(expected, self.shards)
+        for batch in [1, 2, 8]:
+            self.assertEqual(dump(self._merge("merged" + str(batch), batch)), dump(expected))
+
+    def test_fallback(self):
+        expected = dump(self._merge("upsert", 2))
+        version = sqlite3.sqlite_version_info
+        sqlite3.sqlite_version_info = (3, 23, 0)
+        try:
+            self.assertEqual(dump(self._merge("update", 2)), expected)
+            self.assertEqual(dump(self._merge("updateappend", 2, True)), dump(self._merge("upsertappend", 2, True)))
+        finally:
+            sqlite3.sqlite_version_info = version
+
+    def test_in_place(self):
+        path = self.folder + "/refs.db"
+        shard(path, self.base + ["ref_stats"], [row + (1,) for row in self.rows])
+        conn = sqlite3.connect(path)
+        conn.execute("create table stats (pegasusid INTEGER PRIMARY KEY, value)")
+        conn.execute("insert into stats values (1, 2)")
+        conn.commit()
+        rowids = conn.execute("select pegasusid,rowid from images order by pegasusid").fetchall()
+        conn.close()
+        stats = ih.statistics.Stats(path)
+        stats.loadSql(self.shards, 2)
+        ih.database.close(stats.conn)
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute("select pegasusid,rowid from images order by pegasusid").fetchall(), rowids)
+        self.assertEqual([row[0] for row in conn.execute("select ref_stats from images")], [1] * len(self.rows))
+        conn.close()
+
+    def test_append(self):
+        columns, rows, hists = dump(self._merge("appended", 2, True))
+        self.assertEqual([row[0] for row in rows], [str(i) for i in range(0, 8)] + ["9"])
+        self.assertEqual(tuple(rows[-1])[:3], ("9", "e", "rgbsv"))
+
+if __name__ == "__main__":
+    unittest.main()
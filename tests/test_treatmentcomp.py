@@ -0,0 +1,89 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import ih.database
+import ih.statistics
+
+class TreatmentCompTest(unittest.TestCase):
+
+    """
+    Pins the output of :py:meth:`~ih.statistics.Stats.treatmentComp`: one row per
+    genotype, comparison and date, with metadata from the group's first row, and
+    every input row referencing the row of its own group.
+    """
+
+    # pegasusid, experiment, id, genotype, date, imtype, treatment, pixels
+    rows = [
+        ("1", "a", "p1", "g1", "2015-01-01", "rgbsv", "Control", 30),
+        ("2", "b", "p2", "g1", "2015-01-01", "rgbsv", "Stress", 10),
+        ("3", "c", "p1", "g1", "2015-01-02", "rgbsv", "Stress", 20),
+        ("4", "d", "p2", "g1", "2015-01-02", "rgbsv", "Control", 50),
+        ("5", "e", "p1", "g1", "2015-01-01", "rgbtv", "Control", 8),
+        ("6", "f", "p3", "g2", "2015-01-01", "rgbsv", "Control", 9),
+        ("7", "g", "p4", "g2", "2015-01-01", "rgbsv", "Stress", 0),
+        ("8", "h", "p5", "g2", "2015-01-01", "rgbsv", "Stress", 4)
+    ]
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db = self.folder + "/images.db"
+        conn = sqlite3.connect(self.db)
+        conn.execute("create table images (pegasusid PRIMARY KEY, experiment, id, genotype, date, imtype, treatment, pixels)")
+        conn.executemany("insert into images values (?,?,?,?,?,?,?,?)", self.rows)
+        conn.commit()
+        conn.close()
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def _run(self, type):
+        stats = ih.statistics.Stats(self.db)
+        stats.treatmentComp("images", type, type, overwrite = True)
+        ih.database.close(stats.conn)
+        conn = sqlite3.connect(self.db)
+        result = dict(((row[1], row[2], row[3]), row) for row in conn.execute("select t.pegasusid,i.genotype,t.imtype,t.date,t.experiment,t.pixels from images i join " + type + " t on i.ref_" + type + "=t.pegasusid"))
+        groups = dict((row[0], (row[1], row[2], row[3])) for row in conn.execute("select pegasusid,genotype,imtype,date from images"))
+        refs = dict(conn.execute("select pegasusid,ref_" + type + " from images"))
+        count = conn.execute("select count(*) from " + type).fetchone()[0]
+        conn.close()
+        # Every row references the output row of its own group.
+        for id in groups:
+            self.assertEqual(refs[id], result[groups[id]][0])
+        self.assertEqual(count, 4)
+        return dict((key, row[4:]) for key, row in result.items())
+
+    def test_ratio(self):
+        result = self._run("ratio")
+        self.assertEqual(result[("g1", "rgbsv", "2015-01-01")], ("a", 3.0))
+        self.assertEqual(result[("g1", "rgbsv", "2015-01-02")], ("c", 2.5))
+        # A group without a Stress image is written with nulls.
+        self.assertEqual(result[("g1", "rgbtv", "2015-01-01")], ("e", None))
+        # The first image of each treatment is compared, and division by zero is null.
+        self.assertEqual(result[("g2", "rgbsv", "2015-01-01")], ("f", None))
+
+    def test_difference(self):
+        result = self._run("difference")
+        self.assertEqual(result[("g1", "rgbsv", "2015-01-02")], ("c", 30.0))
+        self.assertEqual(result[("g2", "rgbsv", "2015-01-01")], ("f", 9.0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+This file is part of Image Harvest.
+
+Image Harvest is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Harvest is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Harvest.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+import numpy as np
+import ih.imgproc
+import ih.worker
+import ih.commands
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class WorkerTest(unittest.TestCase):
+
+    """
+    Checks that requests run by :py:mod:`ih.worker` don't leave state behind
+    for the next request, and that invalid requests are answered.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def test_state(self):
+        ih.imgproc.Image.kmeansCenters["warm"] = np.zeros((2, 3), np.float32)
+        home, stdout = os.getcwd(), sys.stdout
+        result = ih.worker.run([os.path.join(root, "scripts", "ih-convert-color"), "--input", "missing.png", "--intype", "bgr", "--outtype", "gray"], self.folder)
+        self.assertEqual(result["status"], 0)
+        self.assertIn("Traceback", result["stdout"])
+        self.assertEqual(ih.imgproc.Image.kmeansCenters, {})
+        self.assertEqual((os.getcwd(), sys.stdout), (home, stdout))
+        result = ih.worker.run([os.path.join(root, "scripts", "ih-convert-color")], os.path.join(self.folder, "missing"))
+        self.assertEqual(result["status"], 1)
+        self.assertEqual((os.getcwd(), sys.stdout), (home, stdout))
+        return
+
+    def test_invalid(self):
+        path = os.path.join(self.folder, "sock")
+        env = dict(os.environ, PYTHONPATH = root)
+        with open(os.path.join(self.folder, "log"), "w") as log:
+            worker = subprocess.Popen([sys.executable, os.path.join(root, "scripts", "ih-worker"), "--socket", path, "--idle", "10"], stderr = log, env = env)
+        try:
+            for line in ["not json", json.dumps({"cwd": self.folder}), json.dumps({"argv": 5})]:
+                sock = ih.worker._connect(path, 10)
+                self.assertTrue(sock)
+                handle = sock.makefile("rw")
+                handle.write(line + "\n")
+                handle.flush()
+                result = json.loads(handle.readline())
+                handle.close()
+                sock.close()
+                self.assertEqual(result["status"], 2)
+        finally:
+            worker.terminate()
+            worker.wait()
+        with open(os.path.join(self.folder, "log")) as rh:
+            self.assertEqual(rh.read().count("Invalid request"), 3)
+        return
+
+if __name__ == "__main__":
+    unittest.main()